@@ -1,8 +1,8 @@
-import React, { useState, useRef, useEffect } from 'react';
+import React, { useState, useRef, useEffect, useCallback } from 'react';
 import { v4 as uuidv4 } from 'uuid';
 import { Domain, Message, LoadingState, FileMeta } from '../../types';
 import { handleChatResponse } from '../../services/geminiService';
-import { getChatHistory, listFiles, uploadFile } from '../../services/backendService';
+import { getChatHistory, listFiles, prefetchChat, subscribeFileStatus, uploadFile } from '../../services/backendService';
 import { MessageBubble } from './MessageBubble';
 import { InputArea } from './InputArea';
 import { SuggestionChips } from './SuggestionChips';
@@ -30,10 +30,14 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
   const [domainSelected, setDomainSelected] = useState(false);
   const [isDomainModalOpen, setIsDomainModalOpen] = useState(false);
   const [availableFiles, setAvailableFiles] = useState<FileMeta[]>([]);
+  const [filesCursor, setFilesCursor] = useState<string | null>(null);
+  const [historyCursor, setHistoryCursor] = useState<number | null>(null);
   const [selectedFileIds, setSelectedFileIds] = useState<string[]>([]);
   
   const messagesEndRef = useRef<HTMLDivElement>(null);
+  const prefetchAbortRef = useRef<AbortController | null>(null);
   const containerRef = useRef<HTMLDivElement>(null);
+  const keepScrollRef = useRef(false);
 
   // Auto-scroll logic
   const scrollToBottom = () => {
@@ -41,6 +45,11 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
   };
 
   useEffect(() => {
+    // Prepending older history should not jump to the newest message.
+    if (keepScrollRef.current) {
+      keepScrollRef.current = false;
+      return;
+    }
     scrollToBottom();
   }, [messages, suggestions]);
 
@@ -57,6 +66,7 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
 
     if (domain === 'general') {
       setAvailableFiles([]);
+      setFilesCursor(null);
     } else {
       await refreshFiles(domain);
     }
@@ -64,31 +74,91 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
     await loadHistory(domain);
   };
 
+  const mapHistory = (domain: Domain, page: any[], cursor: number | null): Message[] =>
+    page.map((msg: any, idx: number) => ({
+      id: `${domain}-${msg.index ?? `${cursor ?? 'latest'}-${idx}`}`,
+      role: msg.role === 'assistant' || msg.role === 'model' ? 'model' : 'user',
+      text: msg.content || ''
+    }));
+
   const loadHistory = async (domain: Domain) => {
     try {
       const payload = await getChatHistory(sessionId, domain);
-      const mapped = (payload?.messages || []).map((msg: any, idx: number) => ({
-        id: `${domain}-${idx}`,
-        role: msg.role === 'assistant' || msg.role === 'model' ? 'model' : 'user',
-        text: msg.content || ''
-      }));
+      const mapped = mapHistory(domain, payload?.messages || [], null);
       setMessages(mapped.length > 0 ? [welcomeMessage, ...mapped] : [welcomeMessage]);
+      setHistoryCursor(payload?.next_cursor ?? null);
       setSuggestions([]);
     } catch (error) {
       console.error("Failed to load history", error);
       setMessages([welcomeMessage]);
+      setHistoryCursor(null);
+    }
+  };
+
+  const loadEarlierHistory = async () => {
+    if (!selectedDomain || historyCursor === null) return;
+    try {
+      const payload = await getChatHistory(sessionId, selectedDomain, historyCursor);
+      const older = mapHistory(selectedDomain, payload?.messages || [], historyCursor);
+      keepScrollRef.current = true;
+      setMessages((prev) => {
+        const known = new Set(prev.map((m) => m.id));
+        const [welcome, ...rest] = prev;
+        return [welcome, ...older.filter((m) => !known.has(m.id)), ...rest];
+      });
+      setHistoryCursor(payload?.next_cursor ?? null);
+    } catch (error) {
+      console.error("Failed to load earlier history", error);
     }
   };
 
   const refreshFiles = async (domain: Domain) => {
     try {
-      const files = await listFiles(domain);
-      setAvailableFiles(files);
+      const page = await listFiles(domain);
+      setAvailableFiles(page.files);
+      setFilesCursor(page.next_cursor);
     } catch (error) {
       console.error("Failed to load files", error);
     }
   };
 
+  // Files still ingesting get live status over SSE instead of polling.
+  const ingestingKey = availableFiles
+    .filter((f) => f.processing_status === 'uploaded' || f.processing_status === 'processing')
+    .map((f) => f.file_id)
+    .sort()
+    .join(',');
+
+  useEffect(() => {
+    if (!ingestingKey) return;
+    return subscribeFileStatus(ingestingKey.split(','), (event) => {
+      setAvailableFiles((prev) => prev.map((f) => (
+        f.file_id === event.file_id
+          ? {
+              ...f,
+              processing_status: event.processing_status,
+              chunks_embedded: event.chunks_embedded,
+              chunks_total: event.chunks_total,
+            }
+          : f
+      )));
+    });
+  }, [ingestingKey]);
+
+  const loadMoreFiles = async () => {
+    if (!selectedDomain || selectedDomain === 'general' || !filesCursor) return;
+    try {
+      const page = await listFiles(selectedDomain, { cursor: filesCursor });
+      setAvailableFiles((prev) => {
+        const known = new Set(prev.map((f) => f.file_id));
+        return [...prev, ...page.files.filter((f) => !known.has(f.file_id))];
+      });
+      setFilesCursor(page.next_cursor);
+    } catch (error) {
+      console.error("Failed to load more files", error);
+    }
+  };
+
   const toggleFileSelection = (fileId: string) => {
     setSelectedFileIds((prev) => {
       if (prev.includes(fileId)) {
@@ -102,8 +172,22 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
     });
   };
 
+  const handleTyping = useCallback((text: string) => {
+    if (!selectedDomain) return;
+    // Each prefetch supersedes the previous one; the backend also rate-limits.
+    prefetchAbortRef.current?.abort();
+    const controller = new AbortController();
+    prefetchAbortRef.current = controller;
+    const fileIds = selectedDomain === 'general' ? [] : selectedFileIds;
+    prefetchChat(selectedDomain, sessionId, text, fileIds, controller.signal).catch(() => {
+      // Best effort only: /chat works the same without it.
+    });
+  }, [selectedDomain, selectedFileIds, sessionId]);
+
   const handleSendMessage = async (text: string, file: File | null = null) => {
     if (!selectedDomain) return;
+    prefetchAbortRef.current?.abort();
+    prefetchAbortRef.current = null;
     const messageId = uuidv4();
     let displayMessage = text;
     if (file) {
@@ -217,7 +301,16 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
         {/* Adjusted container to use min-h-full instead of h-full to fix scrolling issues */}
         <div className="w-full min-h-full flex flex-col justify-end px-4 md:px-8 lg:px-12">
 
-             
+            {historyCursor !== null && (
+              <button
+                onClick={loadEarlierHistory}
+                className="self-center mb-4 text-xs font-semibold text-primary-600 hover:bg-primary-50 rounded-lg px-3 py-2"
+                type="button"
+              >
+                Load earlier messages
+              </button>
+            )}
+
             <AnimatePresence initial={false}>
   {messages.map((msg) => (
     <motion.div key={msg.id} layout>
@@ -255,6 +348,9 @@ export const ChatInterface: React.FC<ChatInterfaceProps> = ({ onLogout, sessionI
           availableFiles={availableFiles}
           selectedFileIds={selectedFileIds}
           onToggleFileSelection={toggleFileSelection}
+          hasMoreFiles={filesCursor !== null}
+          onLoadMoreFiles={loadMoreFiles}
+          onTyping={handleTyping}
         />
       </div>
       <DomainModal
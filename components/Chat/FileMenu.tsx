@@ -8,6 +8,8 @@ interface FileMenuProps {
   selectedFileIds: string[];
   onToggle: (fileId: string) => void;
   onClose: () => void;
+  hasMore?: boolean;
+  onLoadMore?: () => void;
 }
 
 export const FileMenu: React.FC<FileMenuProps> = ({
@@ -16,6 +18,8 @@ export const FileMenu: React.FC<FileMenuProps> = ({
   selectedFileIds,
   onToggle,
   onClose,
+  hasMore = false,
+  onLoadMore,
 }) => {
   if (!isOpen) return null;
 
@@ -51,12 +55,24 @@ export const FileMenu: React.FC<FileMenuProps> = ({
                   <div className="font-semibold text-gray-800 text-sm">{file.filename}</div>
                   <div className="text-xs text-gray-500 mt-0.5">
                     Status: {file.processing_status || 'uploaded'}
+                    {file.processing_status === 'processing' && file.chunks_total
+                      ? ` (${file.chunks_embedded ?? 0}/${file.chunks_total} chunks)`
+                      : ''}
                   </div>
                 </div>
               </div>
             </button>
           );
         })}
+        {hasMore && onLoadMore && (
+          <button
+            onClick={onLoadMore}
+            className="w-full text-center text-xs font-semibold text-primary-600 hover:bg-primary-50 rounded-lg px-3 py-2"
+            type="button"
+          >
+            Load more files
+          </button>
+        )}
       </div>
     </div>
   );
@@ -14,8 +14,13 @@ interface InputAreaProps {
   availableFiles: FileMeta[];
   selectedFileIds: string[];
   onToggleFileSelection: (fileId: string) => void;
+  hasMoreFiles?: boolean;
+  onLoadMoreFiles?: () => void;
+  onTyping?: (text: string) => void;
 }
 
+const TYPEAHEAD_DEBOUNCE_MS = 400;
+
 export const InputArea: React.FC<InputAreaProps> = ({
   onSendMessage,
   isLoading,
@@ -24,7 +29,10 @@ export const InputArea: React.FC<InputAreaProps> = ({
   onRequestDomainSelection,
   availableFiles,
   selectedFileIds,
-  onToggleFileSelection
+  onToggleFileSelection,
+  hasMoreFiles = false,
+  onLoadMoreFiles,
+  onTyping
 }) => {
   const [inputText, setInputText] = useState('');
   const [isMenuOpen, setIsMenuOpen] = useState(false);
@@ -77,6 +85,13 @@ export const InputArea: React.FC<InputAreaProps> = ({
     }
   }, [inputText]);
 
+  // Typeahead prefetch: tell the parent once the user pauses typing
+  useEffect(() => {
+    if (!onTyping || isDomainMissing || isLoading || !inputText.trim()) return;
+    const timer = window.setTimeout(() => onTyping(inputText), TYPEAHEAD_DEBOUNCE_MS);
+    return () => window.clearTimeout(timer);
+  }, [inputText, onTyping, isDomainMissing, isLoading]);
+
   useEffect(() => {
     if (selectedDomain === 'general' && selectedFile) {
       setSelectedFile(null);
@@ -245,6 +260,8 @@ export const InputArea: React.FC<InputAreaProps> = ({
               selectedFileIds={selectedFileIds}
               onToggle={onToggleFileSelection}
               onClose={() => setIsFileMenuOpen(false)}
+              hasMore={hasMoreFiles}
+              onLoadMore={onLoadMoreFiles}
             />
           </div>
 
@@ -1,4 +1,17 @@
-from .domain_router import generate_domain_response, get_system_prompt
+from .domain_router import (
+    build_llm_history,
+    complete_domain_response,
+    generate_domain_response,
+    get_system_prompt,
+    summarize_conversation,
+)
 from .domain_prompts import DOMAIN_PROMPTS
 
-__all__ = ["generate_domain_response", "get_system_prompt", "DOMAIN_PROMPTS"]
+__all__ = [
+    "build_llm_history",
+    "complete_domain_response",
+    "generate_domain_response",
+    "get_system_prompt",
+    "summarize_conversation",
+    "DOMAIN_PROMPTS",
+]
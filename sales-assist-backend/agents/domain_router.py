@@ -102,6 +102,24 @@ def _parse_structured_response(raw_text: str) -> Dict[str, Any]:
     }
 
 
+def build_llm_history(stored_messages: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Convert stored chat messages into Gemini history turns.
+    """
+    history: List[Dict[str, Any]] = []
+    for msg in stored_messages or []:
+        role = msg.get("role")
+        if role == "assistant":
+            role = "model"
+        if role not in {"user", "model"}:
+            continue
+        text = str(msg.get("content", "")).strip()
+        if not text:
+            continue
+        history.append({"role": role, "parts": [{"text": text}]})
+    return history
+
+
 async def generate_domain_response(
     domain: str,
     user_message: str,
@@ -109,12 +127,38 @@ async def generate_domain_response(
     history: Optional[List[Dict[str, Any]]] = None,
     max_output_tokens: Optional[int] = None,
     temperature: Optional[float] = None,
+    summary: Optional[str] = None,
 ) -> Tuple[Dict[str, Any], str]:
     """
     Build a domain-aware prompt, request structured JSON, and parse safely.
     Returns (parsed_response, raw_text).
     """
+    return complete_domain_response(
+        domain,
+        user_message,
+        rag_context=rag_context,
+        history=history,
+        max_output_tokens=max_output_tokens,
+        temperature=temperature,
+        summary=summary,
+    )
+
+
+def complete_domain_response(
+    domain: str,
+    user_message: str,
+    rag_context: Optional[str] = None,
+    history: Optional[List[Dict[str, Any]]] = None,
+    max_output_tokens: Optional[int] = None,
+    temperature: Optional[float] = None,
+    summary: Optional[str] = None,
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Blocking variant of generate_domain_response, for worker threads.
+    """
     system_prompt = get_system_prompt(domain)
+    if summary:
+        system_prompt = f"{system_prompt}\n{build_summary_preamble(summary)}"
     final_user_message = build_user_message(user_message, rag_context)
 
     raw_text = chat_completion(
@@ -127,3 +171,40 @@ async def generate_domain_response(
 
     parsed = _parse_structured_response(raw_text)
     return parsed, raw_text
+
+
+def build_summary_preamble(summary: str) -> str:
+    return f"Summary of the earlier conversation:\n{summary.strip()}\n"
+
+
+def summarize_conversation(
+    previous_summary: Optional[str],
+    messages: List[Dict[str, Any]],
+    max_output_tokens: Optional[int] = None,
+) -> str:
+    """
+    Fold older messages into the running conversation summary. Blocking.
+    """
+    system_prompt = os.getenv(
+        "CHAT_SUMMARY_PROMPT",
+        "You maintain a running summary of a sales conversation. Keep the customer's "
+        "needs, constraints, products and figures discussed, decisions and open "
+        "questions. Be concise and factual. Return only the summary text.",
+    )
+    transcript = "\n".join(
+        f"{'Assistant' if msg.get('role') in {'assistant', 'model'} else 'User'}: "
+        f"{str(msg.get('content', '')).strip()}"
+        for msg in messages
+    )
+    user_message = (
+        f"Current summary:\n{previous_summary or '(none)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        "Return the updated summary."
+    )
+    return chat_completion(
+        system_prompt=system_prompt,
+        history=[],
+        user_message=user_message,
+        temperature=0.0,
+        max_output_tokens=max_output_tokens,
+    ).strip()
@@ -4,18 +4,34 @@ from pydantic import BaseModel, Field
 import time
 import os
 
-from agents.domain_router import generate_domain_response, get_system_prompt
+from agents.domain_router import build_llm_history, generate_domain_response, get_system_prompt
 from config.domains import is_general_domain, is_valid_domain
 from rag.retrieve import retrieve_chunk_records
+from rag.session_context import remember_follow_ups
 from rag.tokenizer import count_tokens
 from services.token_budget_service import enforce_input_budget, load_token_budget
-from services.mongo_service import append_chat_messages, get_chat_history, get_session
+from services.history_writer import append_chat_messages
+from services.mongo_service import get_session
+from services.prefetch_service import (
+    pop_speculative_answer,
+    schedule_follow_up_prefetch,
+    schedule_typeahead_prefetch,
+)
+from services.summary_service import load_history_context, schedule_summary_update
 from logger import enhanced_logger
 from llm.gemini_client import get_model_name
 
 router = APIRouter()
 
 
+def _rag_top_k() -> int:
+    return int(os.getenv("RAG_TOP_K", "4"))
+
+
+def _rag_min_score() -> float:
+    return float(os.getenv("RAG_MIN_SCORE", "0.2"))
+
+
 class ChatRequest(BaseModel):
     domain: Optional[str] = None
     message: str
@@ -24,6 +40,13 @@ class ChatRequest(BaseModel):
     history: Optional[List[Dict[str, Any]]] = Field(default_factory=list)
 
 
+class ChatPrefetchRequest(BaseModel):
+    domain: str
+    message: str
+    session_id: str
+    file_ids: Optional[List[str]] = Field(default_factory=list)
+
+
 class ChatResponse(BaseModel):
     answer: str
     follow_up_questions: List[str]
@@ -72,54 +95,56 @@ async def chat(request: ChatRequest):
         if len(file_ids) > 10:
             raise HTTPException(status_code=400, detail="Too many file_ids (max 10)")
 
-        # Enforce token budgets
-        history = []
-        stored_messages = await get_chat_history(request.session_id, request.domain)
-        if stored_messages:
-            for msg in stored_messages:
-                role = msg.get("role")
-                if role == "assistant":
-                    role = "model"
-                if role not in {"user", "model"}:
-                    continue
-                text = str(msg.get("content", "")).strip()
-                if not text:
-                    continue
-                history.append({"role": role, "parts": [{"text": text}]})
+        # Enforce token budgets: the running summary plus the recent turns it
+        # does not cover yet, read back only as far as the budget allows
         budget = load_token_budget()
+        summary, stored_messages = await load_history_context(
+            request.session_id, request.domain, budget.max_history_tokens
+        )
+        history = build_llm_history(stored_messages)
+        # Identifies the conversation state a speculative answer was built on.
+        history_marker = stored_messages[-1].get("timestamp") if stored_messages else None
 
         enhanced_logger.info(
             "CHAT_DOMAIN_RECEIVED",
             extra_data={"domain": request.domain}
         )
 
-        # 1. Retrieve relevant chunks (RAG-lite)
-        chunk_records: List[Dict[str, Any]] = []
-        rag_start = time.time()
-        chunk_records = await retrieve_chunk_records(
-            query=request.message,
-            file_ids=file_ids,
-            domain=request.domain,
-            top_k=5,
+        # An answer prefetched for this exact follow-up needs no retrieval: it
+        # comes with the records it was generated from, which become the sources.
+        min_score = _rag_min_score()
+        speculative = pop_speculative_answer(
+            request.session_id, request.domain, request.message, history_marker
         )
-        latency_rag = time.time() - rag_start
-
-        # 2. Empty-context guard + relevance floor
-        min_score = float(os.getenv("RAG_MIN_SCORE", "0.2"))
-        if min_score > 0:
-            chunk_records = [
-                rec for rec in chunk_records if float(rec.get("score", 0.0)) >= min_score
-            ]
-
-        system_prompt = get_system_prompt(request.domain)
-        history, chunk_records, usage = enforce_input_budget(
-            system_prompt=system_prompt,
-            history=history,
-            user_message=request.message,
-            rag_records=chunk_records,
-            budget=budget,
-        )
-        tokens_input = usage.get("total_tokens", 0)
+        response_payload: Optional[Dict[str, Any]] = None
+        chunk_records: List[Dict[str, Any]] = []
+        if speculative is not None:
+            response_payload, chunk_records, tokens_input = speculative
+        else:
+            # 1. Retrieve relevant chunks (RAG-lite). The relevance floor is applied
+            # inside the vector search, so nothing below it is hydrated.
+            rag_start = time.time()
+            chunk_records = await retrieve_chunk_records(
+                query=request.message,
+                file_ids=file_ids,
+                domain=request.domain,
+                top_k=_rag_top_k(),
+                min_score=min_score,
+                session_id=request.session_id,
+            )
+            latency_rag = time.time() - rag_start
+
+            # 2. Fit history + retrieved context into the input budget
+            system_prompt = get_system_prompt(request.domain)
+            history, chunk_records, usage = enforce_input_budget(
+                system_prompt=system_prompt,
+                history=history,
+                user_message=request.message,
+                rag_records=chunk_records,
+                budget=budget,
+                summary=summary,
+            )
+            tokens_input = usage.get("total_tokens", 0)
 
         rag_used = len(chunk_records) > 0
         chunks_used = len(chunk_records)
@@ -129,22 +154,25 @@ async def chat(request: ChatRequest):
 
         rag_context = "\n\n".join(r.get("text", "") for r in chunk_records) if chunk_records else None
 
-        # 3. Call LLM via domain router
+        # 3. Call LLM via domain router (unless the answer was prefetched)
         llm_start = time.time()
         temperature = float(os.getenv("GEMINI_TEMPERATURE", "0.2"))
-        response_payload, _raw_text = await generate_domain_response(
-            request.domain,
-            request.message,
-            rag_context=rag_context,
-            history=history,
-            max_output_tokens=budget.max_output_tokens,
-            temperature=temperature,
-        )
+        if response_payload is None:
+            response_payload, _raw_text = await generate_domain_response(
+                request.domain,
+                request.message,
+                rag_context=rag_context,
+                history=history,
+                max_output_tokens=budget.max_output_tokens,
+                temperature=temperature,
+                summary=summary,
+            )
         latency_llm = time.time() - llm_start
         first_token_latency = latency_llm
 
         answer = response_payload.get("answer", "")
         follow_up_questions = response_payload.get("follow_up_questions", [])
+        remember_follow_ups(request.session_id, request.domain, follow_up_questions)
         confidence_score = float(response_payload.get("confidence_score", 0.0))
 
         tokens_output = count_tokens(answer)
@@ -166,6 +194,7 @@ async def chat(request: ChatRequest):
 
         latency_ms = (time.time() - start_time) * 1000.0
 
+        answer_timestamp = time.time()
         await append_chat_messages(
             session_id=request.session_id,
             domain=request.domain,
@@ -173,15 +202,25 @@ async def chat(request: ChatRequest):
                 {
                     "role": "user",
                     "content": request.message,
-                    "timestamp": time.time(),
+                    "timestamp": answer_timestamp,
                 },
                 {
                     "role": "assistant",
                     "content": answer,
-                    "timestamp": time.time(),
+                    "timestamp": answer_timestamp,
                 },
             ],
         )
+        schedule_summary_update(request.session_id, request.domain)
+        schedule_follow_up_prefetch(
+            session_id=request.session_id,
+            domain=request.domain,
+            file_ids=file_ids,
+            follow_up_questions=follow_up_questions,
+            history_marker=answer_timestamp,
+            top_k=_rag_top_k(),
+            min_score=min_score,
+        )
 
         return ChatResponse(
             answer=answer,
@@ -219,3 +258,29 @@ async def chat(request: ChatRequest):
                 "fallback_used": fallback_used,
             },
         )
+
+
+@router.post("/chat/prefetch", status_code=202)
+async def chat_prefetch(request: ChatPrefetchRequest):
+    """
+    Typeahead warm-up: retrieve for the partial message in the background so
+    /chat can start from that context if the final message is close enough.
+    """
+    if not is_valid_domain(request.domain):
+        raise HTTPException(status_code=400, detail="Invalid domain")
+    file_ids = [] if is_general_domain(request.domain) else list(request.file_ids or [])
+    if len(file_ids) > 10:
+        raise HTTPException(status_code=400, detail="Too many file_ids (max 10)")
+    session = await get_session(request.session_id)
+    if not session or not session.get("is_active", True):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    status = schedule_typeahead_prefetch(
+        session_id=request.session_id,
+        domain=request.domain,
+        file_ids=file_ids,
+        partial_message=request.message,
+        top_k=_rag_top_k(),
+        min_score=_rag_min_score(),
+    )
+    return {"status": status}
@@ -1,16 +1,33 @@
-from fastapi import APIRouter, HTTPException
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
 
 from config.domains import is_ingest_domain
+from services import file_events
+from services.file_events import TERMINAL_STATUSES, embedding_status_for
 from services.mongo_service import get_file, list_files
 
 router = APIRouter()
 
 
 @router.get("/files")
-async def get_files(domain: str | None = None):
+async def get_files(
+    domain: str | None = None,
+    status: str | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=200),
+):
     if domain and not is_ingest_domain(domain):
         raise HTTPException(status_code=400, detail="Invalid domain")
-    return await list_files(domain=domain)
+    try:
+        files, next_cursor = await list_files(domain=domain, status=status, cursor=cursor, limit=limit)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return {"files": files, "next_cursor": next_cursor}
 
 
 @router.get("/files/{file_id}/status")
@@ -20,18 +37,108 @@ async def get_file_status(file_id: str):
         raise HTTPException(status_code=404, detail="File not found")
 
     processing_status = doc.get("processing_status", "uploaded")
-    embedding_status = doc.get("embedding_status")
-    if not embedding_status:
-        if processing_status == "completed":
-            embedding_status = "completed"
-        elif processing_status == "failed":
-            embedding_status = "failed"
-        elif processing_status == "processing":
-            embedding_status = "processing"
-        else:
-            embedding_status = "pending"
+    embedding_status = doc.get("embedding_status") or embedding_status_for(processing_status)
 
     return {
         "processing_status": processing_status,
         "embedding_status": embedding_status,
     }
+
+
+def _sse(event: Dict[str, Any]) -> str:
+    return f"event: file_status\ndata: {json.dumps(event, default=str)}\n\n"
+
+
+async def _current_event(file_id: str) -> Optional[Dict[str, Any]]:
+    event = file_events.latest(file_id)
+    if event is not None:
+        return event
+    try:
+        doc = await get_file(file_id)
+    except ValueError:
+        return None
+    if not doc:
+        return None
+    processing_status = doc.get("processing_status", "uploaded")
+    event = {
+        "file_id": file_id,
+        "domain": doc.get("domain"),
+        "processing_status": processing_status,
+        "embedding_status": doc.get("embedding_status") or embedding_status_for(processing_status),
+        "stage": processing_status,
+    }
+    if doc.get("num_chunks") is not None:
+        event["chunks_embedded"] = event["chunks_total"] = doc["num_chunks"]
+    if doc.get("error"):
+        event["error"] = doc["error"]
+    return event
+
+
+@router.get("/files/events")
+async def stream_file_events(
+    request: Request,
+    domain: str | None = None,
+    file_id: List[str] = Query(default=[]),
+):
+    """
+    Server-sent events for ingestion status and progress. With file_id(s)
+    the stream opens with each file's current state and closes once all of
+    them are completed or failed; with only a domain it stays open.
+    """
+    if domain and not is_ingest_domain(domain):
+        raise HTTPException(status_code=400, detail="Invalid domain")
+    if not domain and not file_id:
+        raise HTTPException(status_code=400, detail="Pass a domain or at least one file_id")
+    if len(file_id) > 100:
+        raise HTTPException(status_code=400, detail="Too many file_id values")
+
+    heartbeat = float(os.getenv("FILE_EVENTS_HEARTBEAT_SECONDS", "15"))
+    # Subscribe before reading current state so no transition falls in between.
+    sub = file_events.subscribe(domain=domain, file_ids=file_id)
+
+    async def stream() -> AsyncIterator[str]:
+        try:
+            yield "retry: 3000\n\n"
+            watching = set(file_id)
+            for fid in file_id:
+                event = await _current_event(fid)
+                if event is None:
+                    watching.discard(fid)
+                    yield _sse({"file_id": fid, "processing_status": "not_found", "embedding_status": "failed"})
+                    continue
+                if event["processing_status"] in TERMINAL_STATUSES:
+                    watching.discard(fid)
+                yield _sse(event)
+            if file_id and not watching:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=heartbeat)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    # Files ingesting in another worker never publish here;
+                    # re-check those at heartbeat pace instead.
+                    for fid in [f for f in watching if file_events.latest(f) is None]:
+                        event = await _current_event(fid)
+                        if event is None or event["processing_status"] in TERMINAL_STATUSES:
+                            watching.discard(fid)
+                            if event is not None:
+                                yield _sse(event)
+                    if file_id and not watching:
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield _sse(event)
+                if event["processing_status"] in TERMINAL_STATUSES:
+                    watching.discard(event["file_id"])
+                    if file_id and not watching:
+                        return
+        finally:
+            file_events.unsubscribe(sub)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
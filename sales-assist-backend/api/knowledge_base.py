@@ -1,16 +1,25 @@
 from fastapi import APIRouter, HTTPException
 
-# NOTE: This module is not registered in main.py.
-# Legacy knowledge-base operations are intentionally disabled in this POC.
+from config.domains import is_ingest_domain
+from services.kb_stats_service import get_kb_stats, reconcile_kb_stats
 
 router = APIRouter()
 
 
 @router.get("/knowledge-base/stats")
-async def get_knowledge_base_stats():
-    raise HTTPException(status_code=501, detail="Knowledge base stats not enabled in this POC")
+async def get_knowledge_base_stats(domain: str | None = None):
+    if domain and not is_ingest_domain(domain):
+        raise HTTPException(status_code=400, detail="Invalid domain")
+    return await get_kb_stats(domain)
 
 
+@router.post("/knowledge-base/stats/reconcile")
+async def reconcile_knowledge_base_stats():
+    repaired = await reconcile_kb_stats()
+    return {"repaired": repaired}
+
+
+# NOTE: Legacy knowledge-base clear is intentionally disabled in this POC.
 @router.delete("/knowledge-base/clear")
 async def clear_knowledge_base():
     raise HTTPException(status_code=501, detail="Knowledge base clear not enabled in this POC")
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel, Field
 
 from config.domains import is_valid_domain
-from services.mongo_service import create_session, end_session, get_chat_history, get_session
+from rag.session_context import forget_session
+from services.history_writer import read_chat_history_page
+from services.mongo_service import create_session, end_session, get_session
+from services.prefetch_service import cancel_session
 
 router = APIRouter()
 
@@ -29,11 +34,18 @@ async def start_session(request: SessionStartRequest):
 @router.post("/session/end")
 async def close_session(request: SessionEndRequest):
     await end_session(request.session_id)
+    cancel_session(request.session_id)
+    forget_session(request.session_id)
     return {"status": "ok"}
 
 
 @router.get("/history")
-async def get_history(session_id: str, domain: str):
+async def get_history(
+    session_id: str,
+    domain: str,
+    cursor: Optional[int] = Query(default=None, ge=0),
+    limit: int = Query(default=50, ge=1, le=200),
+):
     if not session_id:
         raise HTTPException(status_code=400, detail="Session required")
     if not is_valid_domain(domain):
@@ -43,5 +55,7 @@ async def get_history(session_id: str, domain: str):
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    messages = await get_chat_history(session_id=session_id, domain=domain)
-    return {"session_id": session_id, "domain": domain, "messages": messages}
+    messages, next_cursor = await read_chat_history_page(
+        session_id=session_id, domain=domain, before=cursor, limit=limit
+    )
+    return {"session_id": session_id, "domain": domain, "messages": messages, "next_cursor": next_cursor}
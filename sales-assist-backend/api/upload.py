@@ -5,6 +5,7 @@ import hashlib
 
 from logger import enhanced_logger
 from config.domains import is_ingest_domain
+from services import file_events
 from services.ingestion_service import ingest_file
 from services.mongo_service import (
     find_file_by_hash,
@@ -70,6 +71,7 @@ async def upload_file(
         if background_tasks is not None:
             background_tasks.add_task(ingest_file, str(file_path), domain, file_id)
             await update_file_status(file_id, "processing")
+            file_events.publish(file_id, domain, "processing", "pending", stage="queued")
         else:
             await ingest_file(str(file_path), domain, file_id)
             processing_status = "completed"
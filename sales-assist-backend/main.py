@@ -12,8 +12,11 @@ from api.ask import router as chat_router
 from api.upload import router as upload_router
 from api.files import router as files_router
 from api.session import router as session_router
+from api.knowledge_base import router as knowledge_base_router
 from services.milvus_service import init_milvus
+from services import chunk_compression, history_writer, kb_stats_service
 from services.mongo_service import ensure_indexes
+from services.session_cache import cache_mode, session_cache_enabled, worker_id
 
 app = FastAPI(title="Sales Assist Backend")
 
@@ -42,19 +45,48 @@ async def domain_required_middleware(request: Request, call_next):
             return JSONResponse(status_code=400, content={"detail": "Domain required"})
     return await call_next(request)
 
+@app.middleware("http")
+async def session_affinity_middleware(request: Request, call_next):
+    response = await call_next(request)
+    # Sticky mode trusts per-worker session caches; expose who served this so
+    # the balancer's session pinning can be verified (see cache_mode).
+    if session_cache_enabled() and cache_mode() == "sticky":
+        response.headers["X-Session-Worker"] = worker_id()
+    return response
+
 # Mount routers
 app.include_router(chat_router, tags=["chat"])
 app.include_router(upload_router, tags=["files"])
 app.include_router(files_router, tags=["files"])
 app.include_router(session_router, tags=["sessions"])
+app.include_router(knowledge_base_router, tags=["knowledge-base"])
 
 
 @app.on_event("startup")
 async def _startup():
     init_milvus()
     await ensure_indexes()
+    # Also seeds the counters on first start against existing data.
+    kb_stats_service.start_reconciler()
+
+
+@app.on_event("shutdown")
+async def _shutdown():
+    # Chat messages are acknowledged before they are durable; persist the rest.
+    await history_writer.shutdown()
+    await kb_stats_service.stop_reconciler()
 
 
 @app.get("/health")
 async def health():
     return {"status": "ok"}
+
+
+@app.get("/health/history-writer")
+async def history_writer_health():
+    return history_writer.get_stats()
+
+
+@app.get("/health/chunk-compression")
+async def chunk_compression_health():
+    return chunk_compression.get_stats()
@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+from config.domains import BASE_DOMAINS, is_general_domain
+from logger import enhanced_logger
+from services.mongo_service import get_db
+
+
+class _Entry:
+    __slots__ = ("versions", "stored_at", "records", "hits", "embedding")
+
+    def __init__(
+        self,
+        versions: Dict[str, int],
+        records: List[Dict[str, Any]],
+        embedding: Optional[np.ndarray] = None,
+    ):
+        self.versions = versions
+        self.stored_at = time.time()
+        self.records = records
+        self.hits = 0
+        self.embedding = embedding
+
+
+_entries: "OrderedDict[Tuple[Any, ...], _Entry]" = OrderedDict()
+_refreshing: Set[Tuple[Any, ...]] = set()
+# dimension -> random hyperplanes for the LSH part of the key
+_hyperplanes: Dict[int, np.ndarray] = {}
+
+
+def retrieval_cache_enabled() -> bool:
+    flag = os.getenv("RETRIEVAL_CACHE_ENABLED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _max_entries() -> int:
+    return int(os.getenv("RETRIEVAL_CACHE_SIZE", "2048"))
+
+
+def _fresh_seconds() -> float:
+    return float(os.getenv("RETRIEVAL_CACHE_FRESH_SECONDS", "300"))
+
+
+def _ttl_seconds() -> float:
+    return float(os.getenv("RETRIEVAL_CACHE_TTL_SECONDS", "1800"))
+
+
+def _hot_hits() -> int:
+    return int(os.getenv("RETRIEVAL_CACHE_HOT_HITS", "3"))
+
+
+def _lsh_bits() -> int:
+    return max(1, int(os.getenv("RETRIEVAL_CACHE_LSH_BITS", "12")))
+
+
+def _min_similarity() -> float:
+    return float(os.getenv("RETRIEVAL_CACHE_MIN_SIMILARITY", "0.95"))
+
+
+def _unit(query_embedding: Sequence[float]) -> np.ndarray:
+    vec = np.asarray(query_embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vec))
+    return vec / norm if norm else vec
+
+
+def _lsh_bucket(query_embedding: Sequence[float]) -> str:
+    # Random-hyperplane signature: the sign pattern only changes when the
+    # query direction moves, so rephrasings usually land in the same bucket.
+    # A fixed seed keeps buckets stable across workers and restarts.
+    vec = _unit(query_embedding)
+    bits = _lsh_bits()
+    planes = _hyperplanes.get(vec.shape[0])
+    if planes is None or planes.shape[0] != bits:
+        planes = np.random.default_rng(0).standard_normal((bits, vec.shape[0])).astype(np.float32)
+        _hyperplanes[vec.shape[0]] = planes
+    return np.packbits(planes @ vec > 0).tobytes().hex()
+
+
+def _query_digest(query: str) -> str:
+    normalized = " ".join(re.findall(r"\w+", query.lower()))
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(
+    domain: Optional[str],
+    file_ids: Optional[Iterable[str]],
+    query_embedding: Sequence[float],
+    top_k: int,
+    min_score: Optional[float] = None,
+    query: Optional[str] = None,
+) -> Tuple[Any, ...]:
+    """
+    Pass `query` whenever the result depends on the text and not just the
+    embedding (BM25 matches exact tokens such as SKUs, the cross-encoder
+    scores the text); its normalized form then becomes part of the key.
+    """
+    return (
+        domain or "",
+        tuple(sorted(file_ids or [])),
+        _lsh_bucket(query_embedding),
+        _query_digest(query) if query is not None else "",
+        int(top_k),
+        round(float(min_score or 0.0), 4),
+    )
+
+
+async def get_domain_versions(domains: Iterable[str]) -> Dict[str, int]:
+    domains = sorted(set(domains))
+    db = get_db()
+    versions = {domain: 0 for domain in domains}
+    async for doc in db["domain_versions"].find({"domain": {"$in": domains}}, {"_id": 0, "domain": 1, "version": 1}):
+        versions[doc["domain"]] = int(doc.get("version", 0))
+    return versions
+
+
+async def get_versions_for_domain(domain: Optional[str]) -> Dict[str, int]:
+    """
+    Versions of every domain a search in `domain` reads (all base domains
+    for general or unscoped searches).
+    """
+    domains = sorted(BASE_DOMAINS) if is_general_domain(domain) or not domain else [domain]
+    return await get_domain_versions(domains)
+
+
+async def bump_domain_version(domain: str) -> None:
+    """
+    Invalidate every cached retrieval that touched this domain.
+    """
+    db = get_db()
+    await db["domain_versions"].update_one({"domain": domain}, {"$inc": {"version": 1}}, upsert=True)
+
+
+def _copy(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [dict(rec) for rec in records]
+
+
+def lookup(
+    key: Tuple[Any, ...],
+    versions: Dict[str, int],
+    query_embedding: Optional[Sequence[float]] = None,
+) -> Optional[Tuple[List[Dict[str, Any]], bool]]:
+    """
+    Return (records, needs_refresh) for a usable entry, else None. Entries
+    from an older domain version are never served, nor ones stored for a
+    query embedding below RETRIEVAL_CACHE_MIN_SIMILARITY (an LSH bucket can
+    hold unrelated queries). Past the fresh window, hot entries are still
+    served but flagged for a background refresh.
+    """
+    entry = _entries.get(key)
+    if entry is None:
+        return None
+    if entry.versions != versions:
+        _entries.pop(key, None)
+        return None
+    if entry.embedding is not None and query_embedding is not None:
+        if float(entry.embedding @ _unit(query_embedding)) < _min_similarity():
+            return None
+    age = time.time() - entry.stored_at
+    if age > _ttl_seconds():
+        _entries.pop(key, None)
+        return None
+    entry.hits += 1
+    _entries.move_to_end(key)
+    if age <= _fresh_seconds():
+        return _copy(entry.records), False
+    if entry.hits >= _hot_hits():
+        return _copy(entry.records), True
+    _entries.pop(key, None)
+    return None
+
+
+def store(
+    key: Tuple[Any, ...],
+    versions: Dict[str, int],
+    records: List[Dict[str, Any]],
+    query_embedding: Optional[Sequence[float]] = None,
+) -> None:
+    embedding = _unit(query_embedding) if query_embedding is not None else None
+    _entries[key] = _Entry(dict(versions), _copy(records), embedding)
+    _entries.move_to_end(key)
+    while len(_entries) > _max_entries():
+        _entries.popitem(last=False)
+
+
+def schedule_refresh(
+    key: Tuple[Any, ...],
+    versions: Dict[str, int],
+    fetch: Callable[[], Awaitable[List[Dict[str, Any]]]],
+) -> None:
+    """
+    Stale-while-revalidate: recompute a hot entry off the request path.
+    """
+    if key in _refreshing:
+        return
+    _refreshing.add(key)
+
+    async def _run() -> None:
+        try:
+            records = await fetch()
+            entry = _entries.get(key)
+            hits = entry.hits if entry is not None else 0
+            embedding = entry.embedding if entry is not None else None
+            store(key, versions, records, embedding)
+            _entries[key].hits = hits
+        except Exception as exc:
+            enhanced_logger.warning(
+                "RETRIEVAL_CACHE_REFRESH_FAILED",
+                extra_data={"domain": key[0], "error": str(exc)},
+            )
+        finally:
+            _refreshing.discard(key)
+
+    asyncio.get_running_loop().create_task(_run())
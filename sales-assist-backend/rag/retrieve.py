@@ -1,14 +1,27 @@
+import asyncio
 import math
 import os
 import time
 import uuid
-from typing import Any, Dict, List, Optional
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
 
 from config.domains import BASE_DOMAINS, is_general_domain
 from logger import enhanced_logger
+from rag import retrieval_cache, session_context
 from services.embedding_service import embed_query_async
+from services.keyword_index_service import keyword_search
 from services.milvus_service import get_general_collection_name, search_embeddings
-from services.mongo_service import get_chunks_by_ids
+from rag.tokenizer import count_tokens
+from services.centroid_service import (
+    domain_routing_enabled,
+    refresh_domain_centroids,
+    route_files,
+    select_domains,
+)
+from services.mongo_service import get_chunk_texts, get_chunk_windows
+from services.rerank_service import get_rerank_candidates, rerank_enabled, rerank_records
+from services.token_budget_service import load_token_budget, rag_packing_uses_vectors
 
 
 def _extract_chunk_id(hit: Any) -> Optional[str]:
@@ -38,6 +51,62 @@ def _debug_enabled() -> bool:
     return str(flag).lower() in {"1", "true", "yes", "on"}
 
 
+def _hybrid_enabled() -> bool:
+    flag = os.getenv("HYBRID_SEARCH", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _fuse_rrf(ranked_lists: List[List[Dict[str, Any]]], top_k: int) -> List[Dict[str, Any]]:
+    """
+    Reciprocal-rank fusion: sum of 1 / (k + rank) across the ranked lists.
+    Every record leaves with a "score": its dense similarity when the vector
+    search found it, otherwise its fused RRF score.
+    """
+    k = int(os.getenv("RRF_K", "60"))
+    fused: Dict[str, Dict[str, Any]] = {}
+    for records in ranked_lists:
+        for rank, rec in enumerate(records, start=1):
+            entry = fused.get(rec["chunk_id"])
+            if entry is None:
+                entry = dict(rec)
+                entry["rrf_score"] = 0.0
+                fused[rec["chunk_id"]] = entry
+            else:
+                for key, value in rec.items():
+                    if entry.get(key) is None:
+                        entry[key] = value
+            entry["rrf_score"] += 1.0 / (k + rank)
+    for entry in fused.values():
+        if entry.get("score") is None:
+            entry["score"] = entry["rrf_score"]
+    ordered = sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)
+    return ordered[:top_k]
+
+
+def _hits_to_records(hits: List[Any]) -> List[Dict[str, Any]]:
+    records: List[Dict[str, Any]] = []
+    for hit in hits:
+        chunk_id = _extract_chunk_id(hit)
+        score = _extract_score(hit)
+        file_id = _extract_entity_value(hit, "file_id")
+        domain_value = _extract_entity_value(hit, "domain")
+        chunk_index = _extract_entity_value(hit, "chunk_index")
+        embedding = _extract_entity_value(hit, "embedding")
+
+        if chunk_id:
+            record = {
+                "chunk_id": str(chunk_id),
+                "file_id": str(file_id) if file_id is not None else None,
+                "domain": str(domain_value) if domain_value is not None else None,
+                "chunk_index": int(chunk_index) if chunk_index is not None else None,
+                "score": score,
+            }
+            if embedding is not None:
+                record["embedding"] = [float(x) for x in embedding]
+            records.append(record)
+    return records
+
+
 def _log_retrieval_debug(
     query_id: str,
     domain: Optional[str],
@@ -72,14 +141,17 @@ def _search_hits(
     top_k: int,
     file_ids: List[str],
     domain: Optional[str],
+    include_vectors: bool = False,
+    radius: Optional[float] = None,
 ) -> List[Any]:
     if is_general_domain(domain):
+        domains = select_domains(query_embedding, sorted(BASE_DOMAINS))
         per_domain_k = int(os.getenv("GENERAL_TOP_K_PER_DOMAIN", "0") or 0)
         if per_domain_k <= 0:
-            per_domain_k = max(1, math.ceil(top_k / max(len(BASE_DOMAINS), 1)))
+            per_domain_k = max(1, math.ceil(top_k / max(len(domains), 1)))
         hits: List[Any] = []
         collection_name = get_general_collection_name()
-        for base_domain in sorted(BASE_DOMAINS):
+        for base_domain in domains:
             hits.extend(
                 search_embeddings(
                     query_embedding=query_embedding,
@@ -87,6 +159,8 @@ def _search_hits(
                     file_ids=[],
                     domain=base_domain,
                     collection_name=collection_name,
+                    include_vectors=include_vectors,
+                    radius=radius,
                 )
             )
         hits.sort(key=_extract_score, reverse=True)
@@ -97,9 +171,139 @@ def _search_hits(
         top_k=top_k,
         file_ids=file_ids,
         domain=domain,
+        include_vectors=include_vectors,
+        radius=radius,
     )
 
 
+def _routing_fallback_score() -> float:
+    return float(os.getenv("FILE_ROUTING_FALLBACK_SCORE", "0.4"))
+
+
+def _score_cliff_enabled() -> bool:
+    flag = os.getenv("RAG_CLIFF_CUT_ENABLED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _cut_at_score_cliff(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Adaptive top_k: stop once dense scores fall off a cliff, either relative
+    to the best hit or as a sharp drop between neighbours.
+    """
+    ratio = float(os.getenv("RAG_CLIFF_RATIO", "0.75"))
+    gap = float(os.getenv("RAG_CLIFF_GAP", "0.15"))
+    keep_min = max(1, int(os.getenv("RAG_CLIFF_MIN_RESULTS", "1")))
+    if len(records) <= keep_min:
+        return records
+    best = float(records[0]["score"])
+    kept = records[:keep_min]
+    for prev, rec in zip(records[keep_min - 1:], records[keep_min:]):
+        score = float(rec["score"])
+        if best > 0 and score < best * ratio:
+            break
+        if float(prev["score"]) - score > gap:
+            break
+        kept.append(rec)
+    return kept
+
+
+def _floor_keyword_only(
+    keyword_records: List[Dict[str, Any]],
+    dense_ids: set,
+    top_k: int,
+) -> List[Dict[str, Any]]:
+    """
+    Keyword hits the dense side did not keep never met the dense relevance
+    floor; hold them to a BM25 floor and a rank cutoff instead.
+    """
+    min_score = float(os.getenv("KEYWORD_MIN_SCORE", "0"))
+    max_rank = int(os.getenv("KEYWORD_ONLY_MAX_RANK", "0") or 0) or top_k
+    return [
+        rec
+        for rank, rec in enumerate(keyword_records)
+        if rec["chunk_id"] in dense_ids or (rank < max_rank and rec["keyword_score"] >= min_score)
+    ]
+
+
+def _merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+async def _expand_neighbor_windows(
+    records: List[Dict[str, Any]],
+    window: int,
+    max_tokens: int,
+) -> List[Dict[str, Any]]:
+    """
+    Add the chunks within +-window of each hit (same file) as extra records.
+    Neighbours carry the hit's scores decayed by distance, overlapping windows
+    are fetched once, and nearer neighbours of better hits are added first
+    until the RAG token budget is used up.
+    """
+    if window <= 0 or not records:
+        return records
+    decay = float(os.getenv("RAG_NEIGHBOR_DECAY", "0.5"))
+    present = {rec["chunk_id"] for rec in records}
+    ranges: Dict[str, List[Tuple[int, int]]] = {}
+    for rec in records:
+        if rec.get("file_id") is None or rec.get("chunk_index") is None:
+            continue
+        index = int(rec["chunk_index"])
+        ranges.setdefault(rec["file_id"], []).append((max(0, index - window), index + window))
+    if not ranges:
+        return records
+
+    docs = await get_chunk_windows({file_id: _merge_ranges(r) for file_id, r in ranges.items()})
+    by_position = {
+        (doc["file_id"], int(doc["chunk_index"])): doc
+        for doc in docs
+        if doc.get("chunk_id") not in present
+    }
+
+    budget = max_tokens - sum(count_tokens(rec.get("text", "")) for rec in records) if max_tokens > 0 else None
+    neighbors: List[Dict[str, Any]] = []
+    for distance in range(1, window + 1):
+        for rec in records:
+            if rec.get("file_id") is None or rec.get("chunk_index") is None:
+                continue
+            for index in (rec["chunk_index"] - distance, rec["chunk_index"] + distance):
+                doc = by_position.pop((rec["file_id"], index), None)
+                if doc is None:
+                    continue
+                text = doc.get("text", "")
+                if budget is not None:
+                    tokens = count_tokens(text)
+                    if tokens > budget:
+                        continue
+                    budget -= tokens
+                neighbor = {
+                    "chunk_id": doc["chunk_id"],
+                    "file_id": doc["file_id"],
+                    "domain": doc.get("domain"),
+                    "chunk_index": int(doc["chunk_index"]),
+                    "text": text,
+                    "neighbor_of": rec["chunk_id"],
+                }
+                factor = decay ** distance
+                for key in ("score", "rerank_score", "rrf_score", "keyword_score"):
+                    if rec.get(key) is not None:
+                        neighbor[key] = float(rec[key]) * factor
+                neighbors.append(neighbor)
+
+    if neighbors:
+        enhanced_logger.debug(
+            "RAG_NEIGHBORS_EXPANDED",
+            extra_data={"hits": len(records), "neighbors": len(neighbors), "window": window},
+        )
+    return records + neighbors
+
+
 async def retrieve_chunks(
     query: str,
     file_ids: List[str],
@@ -139,8 +343,8 @@ async def retrieve_chunks(
     if not chunk_ids:
         return []
 
-    chunk_map = await get_chunks_by_ids(chunk_ids)
-    return [chunk_map[cid]["text"] for cid in chunk_ids if cid in chunk_map]
+    text_map = await get_chunk_texts(chunk_ids)
+    return [text_map[cid] for cid in chunk_ids if cid in text_map]
 
 
 async def retrieve_chunks_with_scores(
@@ -184,12 +388,12 @@ async def retrieve_chunks_with_scores(
         return [], []
 
     chunk_ids = [cid for cid, _ in chunk_pairs]
-    chunk_map = await get_chunks_by_ids(chunk_ids)
+    text_map = await get_chunk_texts(chunk_ids)
     chunks: List[str] = []
     scores: List[float] = []
     for cid, score in chunk_pairs:
-        if cid in chunk_map:
-            chunks.append(chunk_map[cid]["text"])
+        if cid in text_map:
+            chunks.append(text_map[cid])
             scores.append(score)
 
     return chunks, scores
@@ -200,9 +404,24 @@ async def retrieve_chunk_records(
     file_ids: List[str],
     domain: Optional[str] = None,
     top_k: int = None,
+    min_score: Optional[float] = None,
+    session_id: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """
     Retrieve chunks with metadata and scores for RAG + source attribution.
+    `min_score` is pushed into the vector search as a range-search radius, so
+    only surviving ids are hydrated from Mongo. With RAG_CLIFF_CUT_ENABLED on
+    (and rerank off), dense hits are also cut where scores fall off a cliff.
+    With HYBRID_SEARCH on, dense and BM25 candidates are fused with RRF.
+    With RERANK_ENABLED on, a larger pool is re-ordered by a cross-encoder.
+    With FILE_ROUTING_ENABLED on, single-domain searches are first narrowed to
+    the files whose centroids best match the query.
+    With RAG_NEIGHBOR_WINDOW > 0, hits are expanded with adjacent chunks.
+    With RETRIEVAL_CACHE_ENABLED on, results are cached per (domain, file_ids,
+    LSH bucket of the query embedding, top_k), plus the normalized query text
+    when hybrid search or rerank reads it, until the domain's data version changes.
+    With a session_id, follow-up turns reuse (or top up) the previous turn's
+    chunks instead of searching again.
     """
     top_k = top_k or int(os.getenv("MILVUS_TOP_K", 5))
 
@@ -210,13 +429,144 @@ async def retrieve_chunk_records(
     if not query_embedding:
         return []
 
+    if not session_id or not session_context.session_reuse_enabled():
+        return await _retrieve_with_cache(query, query_embedding, file_ids, domain, top_k, min_score)
+
+    # Read before searching: a re-ingest landing mid-turn leaves the stored
+    # records tagged with the older version, so they are never reused.
+    versions = await retrieval_cache.get_versions_for_domain(domain)
+    reuse = session_context.match_turn(session_id, domain or "", file_ids, query, query_embedding, versions)
+    if reuse is None:
+        records = await _retrieve_with_cache(
+            query, query_embedding, file_ids, domain, top_k, min_score, versions
+        )
+        stored = records
+    elif reuse.mode == "reuse":
+        records = stored = reuse.records
+    else:
+        fresh = await _retrieve_with_cache(
+            query, query_embedding, file_ids, domain, session_context.get_top_up_k(), min_score, versions
+        )
+        seen = {rec["chunk_id"] for rec in reuse.records}
+        added = [rec for rec in fresh if rec["chunk_id"] not in seen]
+        records = reuse.records + added
+        # Keep this turn's fresh hits first so repeated top-ups stay at top_k.
+        stored = added + reuse.records
+    if reuse is not None:
+        enhanced_logger.info(
+            "SESSION_RETRIEVAL_REUSED",
+            extra_data={
+                "domain": domain,
+                "mode": reuse.mode,
+                "reason": reuse.reason,
+                "similarity": round(reuse.similarity, 4),
+                "records": len(records),
+            },
+        )
+    session_context.remember_retrieval(
+        session_id, domain or "", file_ids, query_embedding, stored[:top_k], versions, query=query
+    )
+    return records
+
+
+async def _retrieve_with_cache(
+    query: str,
+    query_embedding: List[float],
+    file_ids: List[str],
+    domain: Optional[str],
+    top_k: int,
+    min_score: Optional[float],
+    versions: Optional[Dict[str, int]] = None,
+) -> List[Dict[str, Any]]:
+    def _fetch():
+        return _retrieve_chunk_records_uncached(query, query_embedding, file_ids, domain, top_k, min_score)
+
+    if not retrieval_cache.retrieval_cache_enabled():
+        return await _fetch()
+
+    if versions is None:
+        versions = await retrieval_cache.get_versions_for_domain(domain)
+    # Keyword matching and reranking read the text itself, not just its embedding.
+    text_sensitive = _hybrid_enabled() or rerank_enabled()
+    key = retrieval_cache.make_cache_key(
+        domain, file_ids, query_embedding, top_k, min_score, query=query if text_sensitive else None
+    )
+    cached = retrieval_cache.lookup(key, versions, query_embedding)
+    if cached is not None:
+        records, needs_refresh = cached
+        if needs_refresh:
+            retrieval_cache.schedule_refresh(key, versions, _fetch)
+        enhanced_logger.debug(
+            "RETRIEVAL_CACHE_HIT",
+            extra_data={"domain": domain, "records": len(records), "refresh": needs_refresh},
+        )
+        return records
+
+    records = await _fetch()
+    retrieval_cache.store(key, versions, records, query_embedding)
+    return records
+
+
+async def _retrieve_chunk_records_uncached(
+    query: str,
+    query_embedding: List[float],
+    file_ids: List[str],
+    domain: Optional[str],
+    top_k: int,
+    min_score: Optional[float],
+) -> List[Dict[str, Any]]:
+    rerank = rerank_enabled()
+    pool_k = get_rerank_candidates(top_k) if rerank else top_k
+    hybrid = _hybrid_enabled()
+    candidate_k = pool_k * int(os.getenv("HYBRID_CANDIDATE_MULTIPLIER", "2")) if hybrid else pool_k
+
+    loop = asyncio.get_running_loop()
     search_start = time.time()
-    hits = _search_hits(
+    routed_file_ids = None
+    if is_general_domain(domain):
+        if domain_routing_enabled():
+            await refresh_domain_centroids()
+    elif domain:
+        routed_file_ids = await route_files(query_embedding, domain, file_ids)
+    radius = min_score if min_score and min_score > 0 else None
+    search = partial(
+        _search_hits,
         query_embedding=query_embedding,
-        top_k=top_k,
-        file_ids=file_ids,
+        top_k=candidate_k,
         domain=domain,
+        include_vectors=rag_packing_uses_vectors(),
+        radius=radius,
     )
+    dense_task = loop.run_in_executor(None, partial(search, file_ids=routed_file_ids or file_ids))
+    keyword_records: List[Dict[str, Any]] = []
+    if hybrid:
+        keyword_domains = sorted(BASE_DOMAINS) if is_general_domain(domain) or not domain else [domain]
+        hits, keyword_records = await asyncio.gather(
+            dense_task,
+            keyword_search(
+                query,
+                top_k=candidate_k,
+                domains=keyword_domains,
+                file_ids=[] if is_general_domain(domain) else file_ids,
+            ),
+        )
+    else:
+        hits = await dense_task
+    best_score = max((_extract_score(hit) for hit in hits), default=0.0)
+    if routed_file_ids and (len(hits) < top_k or best_score < _routing_fallback_score()):
+        # Routing missed: the selected files gave fewer than top_k hits (above
+        # the radius, when one is set) or only weak ones, so search the whole
+        # domain (or the caller's file filter) instead.
+        enhanced_logger.debug(
+            "FILE_ROUTING_FALLBACK",
+            extra_data={
+                "domain": domain,
+                "routed_files": len(routed_file_ids),
+                "hits": len(hits),
+                "best_score": round(best_score, 4),
+            },
+        )
+        hits = await loop.run_in_executor(None, partial(search, file_ids=file_ids))
     _log_retrieval_debug(
         query_id=uuid.uuid4().hex,
         domain=domain,
@@ -225,37 +575,41 @@ async def retrieve_chunk_records(
         latency_ms=(time.time() - search_start) * 1000.0,
     )
 
-    records: List[Dict[str, Any]] = []
-    for hit in hits:
-        chunk_id = _extract_chunk_id(hit)
-        score = _extract_score(hit)
-        file_id = _extract_entity_value(hit, "file_id")
-        domain_value = _extract_entity_value(hit, "domain")
-        chunk_index = _extract_entity_value(hit, "chunk_index")
-
-        if chunk_id:
-            records.append(
-                {
-                    "chunk_id": str(chunk_id),
-                    "file_id": str(file_id) if file_id is not None else None,
-                    "domain": str(domain_value) if domain_value is not None else None,
-                    "chunk_index": int(chunk_index) if chunk_index is not None else None,
-                    "score": score,
-                }
-            )
+    records = _hits_to_records(hits)
+    if min_score and min_score > 0:
+        records = [rec for rec in records if rec["score"] >= min_score]
+    if _score_cliff_enabled() and not rerank:
+        # With rerank on, the cross-encoder gets the whole pool to reorder.
+        records = _cut_at_score_cliff(records)
+    if keyword_records:
+        keyword_records = _floor_keyword_only(keyword_records, {rec["chunk_id"] for rec in records}, top_k)
+        records = _fuse_rrf([records, keyword_records], pool_k)
+    else:
+        records = records[:pool_k]
 
     if not records:
         return []
 
     chunk_ids = [r["chunk_id"] for r in records]
-    chunk_map = await get_chunks_by_ids(chunk_ids)
+    text_map = await get_chunk_texts(chunk_ids)
 
     hydrated: List[Dict[str, Any]] = []
     for rec in records:
-        chunk = chunk_map.get(rec["chunk_id"])
-        if not chunk:
+        text = text_map.get(rec["chunk_id"])
+        if text is None:
             continue
-        rec["text"] = chunk.get("text", "")
+        rec["text"] = text
         hydrated.append(rec)
 
+    if rerank:
+        hydrated = await rerank_records(query, hydrated, top_k)
+
+    neighbor_window = int(os.getenv("RAG_NEIGHBOR_WINDOW", "0"))
+    if neighbor_window > 0:
+        hydrated = await _expand_neighbor_windows(
+            hydrated,
+            neighbor_window,
+            load_token_budget().max_rag_tokens,
+        )
+
     return hydrated
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+@dataclass
+class _TurnContext:
+    query_embedding: np.ndarray
+    file_ids: Tuple[str, ...]
+    records: List[Dict[str, Any]]
+    follow_ups: Tuple[str, ...] = ()
+    stored_at: float = 0.0
+    # Domain data versions the records were retrieved under.
+    versions: Dict[str, int] = field(default_factory=dict)
+    key_tokens: FrozenSet[str] = frozenset()
+
+
+@dataclass(frozen=True)
+class _Prefetched:
+    query_embedding: np.ndarray
+    file_ids: Tuple[str, ...]
+    records: List[Dict[str, Any]]
+    stored_at: float
+    versions: Dict[str, int] = field(default_factory=dict)
+    key_tokens: FrozenSet[str] = frozenset()
+
+
+@dataclass(frozen=True)
+class SessionReuse:
+    mode: str  # "reuse" or "top_up"
+    reason: str  # "similar", "follow_up", "prefetched" or "typeahead"
+    similarity: float
+    records: List[Dict[str, Any]]
+
+
+# (session_id, domain) -> last turn's retrieval
+_turns: "OrderedDict[Tuple[str, str], _TurnContext]" = OrderedDict()
+# (session_id, domain) -> normalised question -> retrieval run ahead of time
+_prefetched: "OrderedDict[Tuple[str, str], Dict[str, _Prefetched]]" = OrderedDict()
+# (session_id, domain) -> retrieval for the partial message being typed
+_typeahead: "OrderedDict[Tuple[str, str], _Prefetched]" = OrderedDict()
+
+
+def session_reuse_enabled() -> bool:
+    flag = os.getenv("SESSION_REUSE_ENABLED", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def get_top_up_k() -> int:
+    return max(1, int(os.getenv("SESSION_TOPUP_K", "2")))
+
+
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").lower().split()).rstrip("?.! ")
+
+
+def _key_tokens(text: Optional[str]) -> FrozenSet[str]:
+    # SKUs, model numbers, quantities: anything with a digit. Questions that
+    # differ only in one of these embed almost identically, so similarity
+    # alone would reuse chunks about the wrong product.
+    tokens = re.findall(r"[\w-]*\d[\w-]*", (text or "").lower())
+    return frozenset(token.replace("-", "").replace("_", "") for token in tokens)
+
+
+def _unit(vector: Sequence[float]) -> np.ndarray:
+    arr = np.asarray(vector, dtype=np.float32)
+    norm = float(np.linalg.norm(arr))
+    return arr / norm if norm else arr
+
+
+def _is_current(stored: Dict[str, int], versions: Optional[Dict[str, int]]) -> bool:
+    # Records from before a re-ingest may point at deleted chunks.
+    return versions is None or stored == versions
+
+
+def _get(session_id: str, domain: str) -> Optional[_TurnContext]:
+    key = (session_id, domain)
+    turn = _turns.get(key)
+    if turn is None:
+        return None
+    if time.time() - turn.stored_at > float(os.getenv("SESSION_REUSE_TTL_SECONDS", "1800")):
+        _turns.pop(key, None)
+        return None
+    _turns.move_to_end(key)
+    return turn
+
+
+def match_turn(
+    session_id: str,
+    domain: str,
+    file_ids: Iterable[str],
+    query: str,
+    query_embedding: Sequence[float],
+    versions: Optional[Dict[str, int]] = None,
+) -> Optional[SessionReuse]:
+    """
+    Decide whether this turn can reuse earlier work: a retrieval prefetched
+    for exactly this question or for what the user was typing, the previous
+    turn's chunks as-is when the query embedding is nearly the same, or those
+    chunks topped up with a few fresh hits when it is close or is one of the
+    follow-ups we suggested last turn. Similarity-based matches also need
+    the same key tokens (numbers, SKUs). Entries retrieved under other domain
+    versions are never reused.
+    """
+    if not session_reuse_enabled():
+        return None
+    prefetched = _pop_prefetched(session_id, domain, query, file_ids)
+    if prefetched is not None and _is_current(prefetched.versions, versions):
+        similarity = float(_unit(query_embedding) @ prefetched.query_embedding)
+        return SessionReuse("reuse", "prefetched", similarity, [dict(rec) for rec in prefetched.records])
+    key_tokens = _key_tokens(query)
+    typeahead = _pop_typeahead(session_id, domain, file_ids)
+    if typeahead is not None and _is_current(typeahead.versions, versions) and typeahead.key_tokens == key_tokens:
+        similarity = float(_unit(query_embedding) @ typeahead.query_embedding)
+        if similarity >= float(os.getenv("TYPEAHEAD_REUSE_SIMILARITY", "0.9")):
+            return SessionReuse("reuse", "typeahead", similarity, [dict(rec) for rec in typeahead.records])
+    turn = _get(session_id, domain)
+    if turn is None or not turn.records or turn.file_ids != tuple(sorted(file_ids or [])):
+        return None
+    if not _is_current(turn.versions, versions):
+        return None
+    similarity = float(_unit(query_embedding) @ turn.query_embedding)
+    records = [dict(rec) for rec in turn.records]
+    if _normalize_text(query) in turn.follow_ups:
+        return SessionReuse("top_up", "follow_up", similarity, records)
+    if turn.key_tokens != key_tokens:
+        return None
+    if similarity >= float(os.getenv("SESSION_REUSE_SIMILARITY", "0.92")):
+        return SessionReuse("reuse", "similar", similarity, records)
+    if similarity >= float(os.getenv("SESSION_TOPUP_SIMILARITY", "0.8")):
+        return SessionReuse("top_up", "similar", similarity, records)
+    return None
+
+
+def remember_retrieval(
+    session_id: str,
+    domain: str,
+    file_ids: Iterable[str],
+    query_embedding: Sequence[float],
+    records: List[Dict[str, Any]],
+    versions: Optional[Dict[str, int]] = None,
+    query: Optional[str] = None,
+) -> None:
+    key = (session_id, domain)
+    _turns[key] = _TurnContext(
+        query_embedding=_unit(query_embedding),
+        file_ids=tuple(sorted(file_ids or [])),
+        records=[dict(rec) for rec in records],
+        stored_at=time.time(),
+        versions=dict(versions or {}),
+        key_tokens=_key_tokens(query),
+    )
+    _turns.move_to_end(key)
+    max_sessions = int(os.getenv("SESSION_REUSE_MAX_SESSIONS", "1000"))
+    while len(_turns) > max_sessions:
+        _turns.popitem(last=False)
+
+
+def remember_follow_ups(session_id: str, domain: str, follow_up_questions: Iterable[str]) -> None:
+    turn = _turns.get((session_id, domain))
+    if turn is not None:
+        turn.follow_ups = tuple(_normalize_text(q) for q in follow_up_questions or [] if q)
+
+
+def remember_prefetch(
+    session_id: str,
+    domain: str,
+    query: str,
+    file_ids: Iterable[str],
+    query_embedding: Sequence[float],
+    records: List[Dict[str, Any]],
+    versions: Optional[Dict[str, int]] = None,
+) -> None:
+    key = (session_id, domain)
+    slots = _prefetched.setdefault(key, {})
+    _prefetched.move_to_end(key)
+    slots[_normalize_text(query)] = _Prefetched(
+        query_embedding=_unit(query_embedding),
+        file_ids=tuple(sorted(file_ids or [])),
+        records=[dict(rec) for rec in records],
+        stored_at=time.time(),
+        versions=dict(versions or {}),
+    )
+    max_slots = int(os.getenv("PREFETCH_MAX_PER_SESSION", "4"))
+    while len(slots) > max_slots:
+        oldest = min(slots, key=lambda q: slots[q].stored_at)
+        slots.pop(oldest, None)
+    # Sessions that are never ended would otherwise keep their slots forever.
+    max_sessions = int(os.getenv("SESSION_REUSE_MAX_SESSIONS", "1000"))
+    cutoff = time.time() - float(os.getenv("PREFETCH_TTL_SECONDS", "600"))
+    while _prefetched and (
+        len(_prefetched) > max_sessions
+        or max((entry.stored_at for entry in next(iter(_prefetched.values())).values()), default=0.0) < cutoff
+    ):
+        _prefetched.popitem(last=False)
+
+
+def _pop_prefetched(session_id: str, domain: str, query: str, file_ids: Iterable[str]) -> Optional[_Prefetched]:
+    slots = _prefetched.get((session_id, domain))
+    if not slots:
+        return None
+    entry = slots.pop(_normalize_text(query), None)
+    if entry is None or entry.file_ids != tuple(sorted(file_ids or [])):
+        return None
+    if time.time() - entry.stored_at > float(os.getenv("PREFETCH_TTL_SECONDS", "600")):
+        return None
+    return entry
+
+
+def remember_typeahead(
+    session_id: str,
+    domain: str,
+    file_ids: Iterable[str],
+    query_embedding: Sequence[float],
+    records: List[Dict[str, Any]],
+    versions: Optional[Dict[str, int]] = None,
+    query: Optional[str] = None,
+) -> None:
+    _typeahead[(session_id, domain)] = _Prefetched(
+        query_embedding=_unit(query_embedding),
+        file_ids=tuple(sorted(file_ids or [])),
+        records=[dict(rec) for rec in records],
+        stored_at=time.time(),
+        versions=dict(versions or {}),
+        key_tokens=_key_tokens(query),
+    )
+    _typeahead.move_to_end((session_id, domain))
+    max_sessions = int(os.getenv("SESSION_REUSE_MAX_SESSIONS", "1000"))
+    while len(_typeahead) > max_sessions:
+        _typeahead.popitem(last=False)
+
+
+def _pop_typeahead(session_id: str, domain: str, file_ids: Iterable[str]) -> Optional[_Prefetched]:
+    entry = _typeahead.pop((session_id, domain), None)
+    if entry is None or entry.file_ids != tuple(sorted(file_ids or [])):
+        return None
+    if time.time() - entry.stored_at > float(os.getenv("TYPEAHEAD_TTL_SECONDS", "30")):
+        return None
+    return entry
+
+
+def forget_session(session_id: str) -> None:
+    for key in [key for key in _turns if key[0] == session_id]:
+        _turns.pop(key, None)
+    for key in [key for key in _prefetched if key[0] == session_id]:
+        _prefetched.pop(key, None)
+    for key in [key for key in _typeahead if key[0] == session_id]:
+        _typeahead.pop(key, None)
@@ -0,0 +1,100 @@
+"""
+Backfill file and domain centroids for files ingested before ingest kept a
+per-file embedding sum.
+
+Such files have no file_centroids document, or one without sum_vector, so
+they never reached the running domain_centroids sums and general-domain
+routing (DOMAIN_ROUTING_ENABLED) is skewed towards recently ingested files.
+Each one is re-embedded from its stored chunk text and folded in through
+upsert_file_centroids, the same path ingest uses. Files that already carry a
+sum_vector are skipped, so the script is safe to re-run.
+
+Usage (from sales-assist-backend/, with Mongo configured):
+    python -m scripts.backfill_centroids --dry-run     # count what would be backfilled
+    python -m scripts.backfill_centroids
+    python -m scripts.backfill_centroids --domain it --batch-size 128
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from config.domains import BASE_DOMAINS
+
+
+async def _chunk_texts(db, file_id: str) -> List[str]:
+    from services.chunk_compression import decode_chunk_docs
+
+    cursor = db["chunks"].find({"file_id": file_id}, {"_id": 0, "chunk_index": 1, "text": 1, "text_z": 1})
+    docs = [doc async for doc in cursor]
+    await decode_chunk_docs(docs)
+    docs.sort(key=lambda doc: doc.get("chunk_index", 0))
+    return [doc.get("text") or "" for doc in docs]
+
+
+async def _embed(texts: List[str], batch_size: int) -> List[List[float]]:
+    from services.embedding_service import embed_texts_async
+
+    embeddings: List[List[float]] = []
+    for start in range(0, len(texts), batch_size):
+        embeddings.extend(await embed_texts_async(texts[start:start + batch_size]))
+    return embeddings
+
+
+async def _backfill_domain(db, domain: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from services.centroid_service import upsert_file_centroids
+
+    row = {"domain": domain, "files": 0, "backfilled": 0, "chunks": 0, "empty": 0}
+    done = set()
+    async for doc in db["file_centroids"].find(
+        {"domain": domain, "sum_vector": {"$exists": True}}, {"_id": 0, "file_id": 1}
+    ):
+        done.add(doc["file_id"])
+    async for doc in db["files"].find({"domain": domain, "processing_status": "completed"}, {"_id": 1}):
+        file_id = str(doc["_id"])
+        row["files"] += 1
+        if file_id in done:
+            continue
+        texts = await _chunk_texts(db, file_id)
+        if not texts:
+            row["empty"] += 1
+            continue
+        row["backfilled"] += 1
+        row["chunks"] += len(texts)
+        if args.dry_run:
+            continue
+        await upsert_file_centroids(file_id, domain, await _embed(texts, args.batch_size))
+    return row
+
+
+async def _main(args: argparse.Namespace) -> int:
+    from utils.database import get_database
+
+    db = get_database()
+    rows = [await _backfill_domain(db, domain, args) for domain in args.domain or sorted(BASE_DOMAINS)]
+
+    print(f"\nbackfill centroids{' (dry run)' if args.dry_run else ''}")
+    print(f"{'domain':<10} {'files':>7} {'backfilled':>10} {'chunks':>8} {'no_chunks':>9}")
+    for row in rows:
+        print(
+            f"{row['domain']:<10} {row['files']:>7} {row['backfilled']:>10} "
+            f"{row['chunks']:>8} {row['empty']:>9}"
+        )
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domain", action="append", choices=sorted(BASE_DOMAINS), help="repeatable; default all")
+    parser.add_argument("--dry-run", action="store_true", help="report what would be backfilled without writing")
+    parser.add_argument("--batch-size", type=int, default=64, help="chunks per embedding call")
+    args = parser.parse_args(argv)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,160 @@
+"""
+Latency vs corpus size for two-stage (file centroid -> chunk) retrieval,
+with recall held at a fixed target.
+
+For each corpus size the smallest FILE_ROUTING_TOP_M that reaches the target
+recall@k against a full scan is picked, then both paths are timed. Chunk
+search runs through the in-process vector store, so the numbers reflect an
+exact scan over the domain vs. an exact scan over the routed files.
+
+Usage (from sales-assist-backend/):
+    python -m scripts.bench_file_routing --files 100 1000 5000 --chunks-per-file 40
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from services.centroid_service import compute_file_vectors, rank_files
+
+DOMAIN = "it"
+
+
+def _synthetic_files(num_files: int, chunks_per_file: int, dim: int, rng: np.random.Generator):
+    # Each file is about a handful of topics; chunks sit near one of them.
+    topics = rng.normal(size=(max(num_files // 4, 8), dim)).astype(np.float32)
+    ids: List[str] = []
+    metadata: List[Dict[str, Any]] = []
+    blocks: List[np.ndarray] = []
+    for f in range(num_files):
+        file_id = f"file{f:06d}"
+        file_topics = topics[rng.choice(len(topics), size=2, replace=False)]
+        pick = rng.integers(0, len(file_topics), size=chunks_per_file)
+        vectors = file_topics[pick] + 0.6 * rng.normal(size=(chunks_per_file, dim)).astype(np.float32)
+        blocks.append(vectors)
+        for idx in range(chunks_per_file):
+            ids.append(f"{file_id}:{idx}")
+            metadata.append({"file_id": file_id, "domain": DOMAIN, "chunk_index": idx})
+    vectors = np.vstack(blocks)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return ids, vectors, metadata
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(np.asarray(values), pct)) if values else 0.0
+
+
+def bench_size(
+    num_files: int,
+    chunks_per_file: int,
+    dim: int,
+    top_k: int,
+    num_queries: int,
+    target_recall: float,
+    medoids: int,
+    seed: int,
+) -> Dict[str, Any]:
+    from services.local_vector_store import LocalVectorCollection
+
+    rng = np.random.default_rng(seed)
+    ids, vectors, metadata = _synthetic_files(num_files, chunks_per_file, dim, rng)
+    picks = rng.choice(len(ids), size=min(num_queries, len(ids)), replace=False)
+    queries = vectors[picks] + 0.2 * rng.normal(size=(len(picks), dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    routing_rows: List[np.ndarray] = []
+    routing_file_ids: List[str] = []
+    for f in range(num_files):
+        file_vectors = compute_file_vectors(vectors[f * chunks_per_file:(f + 1) * chunks_per_file], medoids)
+        routing_rows.append(file_vectors)
+        routing_file_ids.extend([f"file{f:06d}"] * len(file_vectors))
+    routing = np.vstack(routing_rows)
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_file_routing_")
+    try:
+        # Exact scans only, so the comparison is about rows touched.
+        os.environ["LOCAL_VECTOR_STORE_INDEX"] = "flat"
+        store = LocalVectorCollection(os.path.join(tmp_dir, "bench"), dim)
+        for start in range(0, len(ids), 5000):
+            store.insert(ids[start:start + 5000], vectors[start:start + 5000], metadata[start:start + 5000])
+
+        full_latencies: List[float] = []
+        truth: List[set] = []
+        for query in queries:
+            t0 = time.perf_counter()
+            hits = store.search(query, top_k, domain=DOMAIN)
+            full_latencies.append((time.perf_counter() - t0) * 1000.0)
+            truth.append({hit.id for hit in hits})
+
+        chosen: Optional[Dict[str, Any]] = None
+        top_m = 1
+        while top_m <= num_files:
+            latencies: List[float] = []
+            found = 0
+            for query, expected in zip(queries, truth):
+                t0 = time.perf_counter()
+                file_ids = rank_files(query, routing, routing_file_ids, top_m)
+                hits = store.search(query, top_k, file_ids=file_ids, domain=DOMAIN)
+                latencies.append((time.perf_counter() - t0) * 1000.0)
+                found += len(expected.intersection(hit.id for hit in hits))
+            recall = found / float(sum(len(t) for t in truth) or 1)
+            chosen = {"top_m": top_m, "recall": recall, "latencies": latencies}
+            if recall >= target_recall:
+                break
+            top_m *= 2
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return {
+        "files": num_files,
+        "chunks": len(ids),
+        "full_p50_ms": round(_percentile(full_latencies, 50), 3),
+        "top_m": chosen["top_m"],
+        "routed_p50_ms": round(_percentile(chosen["latencies"], 50), 3),
+        "routed_p95_ms": round(_percentile(chosen["latencies"], 95), 3),
+        "recall": round(chosen["recall"], 4),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, nargs="+", default=[100, 1000, 5000])
+    parser.add_argument("--chunks-per-file", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=int(os.getenv("MILVUS_DIMENSION", "384")))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--medoids", type=int, default=int(os.getenv("FILE_ROUTING_MEDOIDS", "2")))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    print(
+        f"{'files':>7} {'chunks':>8} {'full_p50':>9} {'top_m':>6} "
+        f"{'routed_p50':>11} {'routed_p95':>11} {'recall':>7}"
+    )
+    for num_files in args.files:
+        row = bench_size(
+            num_files,
+            args.chunks_per_file,
+            args.dim,
+            args.top_k,
+            args.queries,
+            args.target_recall,
+            args.medoids,
+            args.seed,
+        )
+        print(
+            f"{row['files']:>7} {row['chunks']:>8} {row['full_p50_ms']:>9} {row['top_m']:>6} "
+            f"{row['routed_p50_ms']:>11} {row['routed_p95_ms']:>11} {row['recall']:>7}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,130 @@
+"""
+Report memory savings and recall@5 of quantized first-pass search with
+float32 rescoring, on the vectors already stored for our corpus.
+
+Usage (from sales-assist-backend/):
+    python -m scripts.bench_quantization                      # Milvus (or Milvus Lite via MILVUS_URI)
+    python -m scripts.bench_quantization --source local       # LOCAL_VECTOR_STORE_DIR
+    python -m scripts.bench_quantization --source npz --vectors-file vectors.npz
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from config.domains import BASE_DOMAINS
+from services.quantization import (
+    binarize,
+    binary_scores,
+    bytes_per_vector,
+    int8_scores,
+    quantize_int8,
+    rescore,
+)
+
+
+def _load_vectors(source: str, vectors_file: Optional[str]) -> Tuple[np.ndarray, np.ndarray]:
+    if source == "npz":
+        data = np.load(vectors_file, allow_pickle=False)
+        return np.asarray(data["embeddings"], dtype=np.float32), np.asarray(data["domains"]).astype(str)
+
+    if source == "local":
+        from services.local_vector_store import get_local_collection
+        from services.milvus_service import get_collection_name
+
+        collection = get_local_collection(get_collection_name())
+        vectors, domains = [], []
+        for seg in collection._segments:
+            rows = np.flatnonzero(seg.live)
+            vectors.append(np.asarray(seg.vectors[rows], dtype=np.float32))
+            domains.append(seg.domains[rows].astype(str))
+        if not vectors:
+            return np.zeros((0, 0), dtype=np.float32), np.array([], dtype=str)
+        return np.concatenate(vectors), np.concatenate(domains)
+
+    from scripts.tune_search_params import MilvusTuningBackend
+
+    backend = MilvusTuningBackend()
+    vectors, domains = [], []
+    for domain in sorted(BASE_DOMAINS):
+        _ids, domain_vectors = backend.fetch_vectors(domain)
+        if len(domain_vectors):
+            vectors.append(domain_vectors)
+            domains.append(np.full(len(domain_vectors), domain))
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32), np.array([], dtype=str)
+    return np.concatenate(vectors), np.concatenate(domains)
+
+
+def _recall(
+    vectors: np.ndarray,
+    domains: np.ndarray,
+    queries: np.ndarray,
+    query_domains: List[str],
+    top_k: int,
+    multiplier: int,
+) -> Dict[str, float]:
+    codes, scales = quantize_int8(vectors)
+    packed = binarize(vectors)
+    found = {"sq8": 0, "binary": 0, "sq8_no_rescore": 0, "binary_no_rescore": 0}
+    total = 0
+    for query, domain in zip(queries, query_domains):
+        rows = np.flatnonzero(domains == domain)
+        exact = set(rows[np.argsort(-(vectors[rows] @ query))[:top_k]].tolist())
+        total += len(exact)
+        for mode, scores in (
+            ("sq8", int8_scores(codes[rows], scales[rows], query)),
+            ("binary", binary_scores(packed[rows], query)),
+        ):
+            shortlist = rows[np.argsort(-scores)[: top_k * multiplier]]
+            found[f"{mode}_no_rescore"] += len(exact.intersection(shortlist[:top_k].tolist()))
+            final = shortlist[np.argsort(-rescore(query, vectors[shortlist]))[:top_k]]
+            found[mode] += len(exact.intersection(final.tolist()))
+    return {mode: hits / float(total or 1) for mode, hits in found.items()}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--source", choices=["milvus", "local", "npz"], default="milvus")
+    parser.add_argument("--vectors-file", default=None)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--multiplier", type=int, default=int(os.getenv("VECTOR_RESCORE_MULTIPLIER", "4")))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+    if args.source == "npz" and not args.vectors_file:
+        parser.error("--vectors-file is required for --source npz")
+
+    vectors, domains = _load_vectors(args.source, args.vectors_file)
+    if not len(vectors):
+        print("No vectors found.")
+        return 1
+    count, dim = vectors.shape
+
+    print(f"vectors: {count}  dim: {dim}  (x2: default + general collections)")
+    print(f"{'mode':>8} {'bytes/vec':>10} {'total_MB':>10} {'saving':>8}")
+    float_bytes = bytes_per_vector(dim, "none")
+    for mode in ("none", "sq8", "binary"):
+        per_vector = bytes_per_vector(dim, mode)
+        total_mb = per_vector * count * 2 / (1024 * 1024)
+        print(f"{mode:>8} {per_vector:>10} {total_mb:>10.2f} {float_bytes / per_vector:>7.1f}x")
+
+    rng = np.random.default_rng(args.seed)
+    picks = rng.choice(count, size=min(args.queries, count), replace=False)
+    queries = vectors[picks] + 0.05 * rng.normal(size=(len(picks), dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    recalls = _recall(vectors, domains, queries, [str(domains[p]) for p in picks], args.top_k, args.multiplier)
+
+    print(f"\nrecall@{args.top_k} (shortlist = {args.multiplier} x top_k)")
+    for mode in ("sq8", "binary"):
+        print(f"{mode:>8}  first-pass only: {recalls[f'{mode}_no_rescore']:.4f}  with rescoring: {recalls[mode]:.4f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
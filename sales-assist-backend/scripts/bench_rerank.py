@@ -0,0 +1,114 @@
+"""
+Measure latency and retrieval quality of the cross-encoder stage at several
+candidate-pool sizes, against dense/hybrid retrieval without re-ranking.
+
+The eval set is JSONL, one labelled query per line:
+    {"query": "...", "domain": "it", "file_ids": [], "relevant_chunk_ids": ["<file_id>:3"]}
+
+Usage (from sales-assist-backend/, with Mongo + Milvus configured):
+    python -m scripts.bench_rerank --eval-set eval.jsonl --candidates 10 20 40
+    RERANK_BACKEND=onnx python -m scripts.bench_rerank --eval-set eval.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+
+def _load_eval_set(path: str) -> List[Dict[str, Any]]:
+    items: List[Dict[str, Any]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+    return items
+
+
+def _quality(ranked: List[str], relevant: set, top_k: int) -> Dict[str, float]:
+    top = ranked[:top_k]
+    hits = [1.0 if cid in relevant else 0.0 for cid in top]
+    recall = sum(hits) / float(min(len(relevant), top_k) or 1)
+    mrr = next((1.0 / (i + 1) for i, h in enumerate(hits) if h), 0.0)
+    dcg = sum(h / np.log2(i + 2) for i, h in enumerate(hits))
+    ideal = sum(1.0 / np.log2(i + 2) for i in range(min(len(relevant), top_k)))
+    return {"recall": recall, "mrr": mrr, "ndcg": dcg / ideal if ideal else 0.0}
+
+
+async def _run(items: List[Dict[str, Any]], top_k: int, candidates: Optional[int]) -> Dict[str, float]:
+    from rag.retrieve import retrieve_chunk_records
+
+    if candidates is None:
+        os.environ["RERANK_ENABLED"] = "false"
+    else:
+        os.environ["RERANK_ENABLED"] = "true"
+        os.environ["RERANK_CANDIDATES"] = str(candidates)
+
+    latencies: List[float] = []
+    totals = {"recall": 0.0, "mrr": 0.0, "ndcg": 0.0}
+    for item in items:
+        start = time.perf_counter()
+        records = await retrieve_chunk_records(
+            query=item["query"],
+            file_ids=item.get("file_ids") or [],
+            domain=item.get("domain"),
+            top_k=top_k,
+        )
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        quality = _quality([r["chunk_id"] for r in records], set(item.get("relevant_chunk_ids") or []), top_k)
+        for key, value in quality.items():
+            totals[key] += value
+    count = float(len(items) or 1)
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) if latencies else 0.0,
+        "p95_ms": float(np.percentile(latencies, 95)) if latencies else 0.0,
+        **{key: value / count for key, value in totals.items()},
+    }
+
+
+async def _main(args: argparse.Namespace) -> int:
+    items = _load_eval_set(args.eval_set)
+    if not items:
+        print("Empty eval set.")
+        return 1
+
+    # Warm up the embedding and cross-encoder models outside the measurement.
+    from services.embedding_service import embed_texts
+    from services.rerank_service import get_rerank_model
+
+    embed_texts(["warm up"])
+    get_rerank_model().predict([("warm up", "warm up")])
+    os.environ["RERANK_CACHE_SIZE"] = "0"  # measure cold pair scoring
+
+    print(f"{len(items)} queries, top_k={args.top_k}, backend={os.getenv('RERANK_BACKEND', 'torch')}")
+    print(f"{'candidates':>10} {'p50_ms':>8} {'p95_ms':>8} {'recall':>7} {'mrr':>7} {'ndcg':>7}")
+    runs: List[Optional[int]] = [None] + list(args.candidates)
+    for candidates in runs:
+        row = await _run(items, args.top_k, candidates)
+        label = "none" if candidates is None else str(candidates)
+        print(
+            f"{label:>10} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+            f"{row['recall']:>7.3f} {row['mrr']:>7.3f} {row['ndcg']:>7.3f}"
+        )
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--eval-set", required=True)
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("RAG_TOP_K", "4")))
+    parser.add_argument("--candidates", type=int, nargs="+", default=[10, 20, 40])
+    args = parser.parse_args(argv)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
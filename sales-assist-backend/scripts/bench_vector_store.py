@@ -0,0 +1,156 @@
+"""
+Compare the in-process vector store with the Milvus path on synthetic data.
+
+Usage (from sales-assist-backend/):
+    python -m scripts.bench_vector_store --sizes 1000 10000 50000
+    python -m scripts.bench_vector_store --sizes 10000 --milvus   # needs MILVUS_HOST/PORT or MILVUS_URI
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+DOMAINS = ["rpa", "it", "hr", "security"]
+
+
+def _synthetic_corpus(size: int, dim: int, rng: np.random.Generator):
+    # Clustered vectors so ANN indexes behave like they do on real embeddings.
+    centers = rng.normal(size=(max(size // 200, 8), dim)).astype(np.float32)
+    assign = rng.integers(0, len(centers), size=size)
+    vectors = centers[assign] + 0.35 * rng.normal(size=(size, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    file_ids = [f"bench{idx // 50:06d}" for idx in range(size)]
+    ids = [f"{fid}:{idx % 50}" for idx, fid in enumerate(file_ids)]
+    metadata = [
+        {"file_id": fid, "domain": DOMAINS[idx % len(DOMAINS)], "chunk_index": idx % 50}
+        for idx, fid in enumerate(file_ids)
+    ]
+    return ids, vectors, metadata
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    return float(np.percentile(np.asarray(values), pct)) if values else 0.0
+
+
+def _run(
+    label: str,
+    insert: Callable[[], None],
+    search: Callable[[np.ndarray, str], List[str]],
+    queries: np.ndarray,
+    truth: List[set],
+    query_domains: List[str],
+) -> Dict[str, Any]:
+    start = time.perf_counter()
+    insert()
+    insert_s = time.perf_counter() - start
+
+    latencies: List[float] = []
+    hits = 0
+    for query, expected, domain in zip(queries, truth, query_domains):
+        t0 = time.perf_counter()
+        found = search(query, domain)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        hits += len(expected.intersection(found))
+    recall = hits / float(sum(len(t) for t in truth) or 1)
+    return {
+        "backend": label,
+        "insert_s": round(insert_s, 3),
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "recall": round(recall, 4),
+    }
+
+
+def bench_size(size: int, dim: int, top_k: int, num_queries: int, use_milvus: bool, seed: int) -> List[Dict[str, Any]]:
+    from services.local_vector_store import LocalVectorCollection
+
+    rng = np.random.default_rng(seed)
+    ids, vectors, metadata = _synthetic_corpus(size, dim, rng)
+    domains = np.asarray([m["domain"] for m in metadata])
+    picks = rng.choice(size, size=min(num_queries, size), replace=False)
+    queries = vectors[picks] + 0.1 * rng.normal(size=(len(picks), dim)).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+    query_domains = [str(domains[p]) for p in picks]
+
+    truth: List[set] = []
+    for query, domain in zip(queries, query_domains):
+        rows = np.flatnonzero(domains == domain)
+        scores = vectors[rows] @ query
+        best = rows[np.argsort(-scores)[:top_k]]
+        truth.append({ids[i] for i in best})
+
+    results: List[Dict[str, Any]] = []
+    tmp_dir = tempfile.mkdtemp(prefix="bench_vector_store_")
+    try:
+        store = LocalVectorCollection(os.path.join(tmp_dir, "bench"), dim)
+
+        def _local_insert() -> None:
+            for start in range(0, size, 1000):
+                store.insert(ids[start:start + 1000], vectors[start:start + 1000], metadata[start:start + 1000])
+
+        def _local_search(query: np.ndarray, domain: str) -> List[str]:
+            return [hit.id for hit in store.search(query, top_k, domain=domain)]
+
+        label = "local-hnsw" if os.getenv("LOCAL_VECTOR_STORE_INDEX", "auto").lower() == "hnsw" else "local"
+        results.append(_run(label, _local_insert, _local_search, queries, truth, query_domains))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if use_milvus:
+        from pymilvus import utility
+
+        from services import milvus_service
+
+        collection_name = f"bench_{uuid.uuid4().hex[:8]}"
+        try:
+            def _milvus_insert() -> None:
+                milvus_service.insert_embeddings(ids, vectors.tolist(), metadata, batch_size=1000, collection_name=collection_name)
+                milvus_service.get_collection(collection_name).flush()
+
+            def _milvus_search(query: np.ndarray, domain: str) -> List[str]:
+                hits = milvus_service.search_embeddings(
+                    query.tolist(), top_k, domain=domain, collection_name=collection_name
+                )
+                return [str(hit.id) for hit in hits]
+
+            results.append(_run("milvus", _milvus_insert, _milvus_search, queries, truth, query_domains))
+        finally:
+            if utility.has_collection(collection_name):
+                utility.drop_collection(collection_name)
+    return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--dim", type=int, default=int(os.getenv("MILVUS_DIMENSION", "384")))
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--milvus", action="store_true", help="Also benchmark the Milvus path")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    # The Milvus path reads VECTOR_STORE too; keep it pointed at Milvus here.
+    os.environ["VECTOR_STORE"] = "milvus"
+
+    print(f"{'size':>8} {'backend':>12} {'insert_s':>9} {'p50_ms':>8} {'p95_ms':>8} {'recall':>7}")
+    for size in args.sizes:
+        for row in bench_size(size, args.dim, args.top_k, args.queries, args.milvus, args.seed):
+            print(
+                f"{size:>8} {row['backend']:>12} {row['insert_s']:>9} "
+                f"{row['p50_ms']:>8} {row['p95_ms']:>8} {row['recall']:>7}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,110 @@
+"""
+Check that every registered service query is index-backed.
+
+Runs explain() for each QueryShape in services/mongo_indexes.py and fails
+(exit code 1) when a winning plan contains a COLLSCAN, unless the shape is
+explicitly allowed to scan. In-memory SORT stages are reported as well, and
+fail the run with --strict-sort. Explain needs no matching data, but the
+collections must exist; missing ones are reported as "empty" and skipped.
+
+Usage (from sales-assist-backend/, with Mongo configured):
+    python -m scripts.check_query_plans
+    python -m scripts.check_query_plans --no-create --strict-sort
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+
+def _walk_stages(plan: Any) -> Iterable[Dict[str, Any]]:
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan
+        for value in plan.values():
+            yield from _walk_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _walk_stages(item)
+
+
+def _winning_plan(explain: Dict[str, Any]) -> Dict[str, Any]:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Sharded / aggregate explain wraps the planner one level down.
+        for stage in explain.get("stages", []) or []:
+            cursor = stage.get("$cursor") or {}
+            if "queryPlanner" in cursor:
+                planner = cursor["queryPlanner"]
+                break
+    winning = (planner or {}).get("winningPlan", {})
+    # Slot-based engine nests the classic tree under "queryPlan".
+    return winning.get("queryPlan", winning)
+
+
+def classify(explain: Dict[str, Any]) -> Dict[str, Any]:
+    stages = list(_walk_stages(_winning_plan(explain)))
+    names: Set[str] = {str(stage.get("stage")) for stage in stages}
+    indexes = sorted({str(stage["indexName"]) for stage in stages if stage.get("indexName")})
+    return {
+        "collscan": "COLLSCAN" in names,
+        "blocking_sort": "SORT" in names,
+        "empty": names <= {"EOF"},
+        "indexes": indexes,
+    }
+
+
+async def _explain(db, shape) -> Dict[str, Any]:
+    cursor = db[shape.collection].find(shape.filter, shape.projection)
+    if shape.sort:
+        cursor = cursor.sort(list(shape.sort))
+    return await cursor.explain()
+
+
+async def _main(args: argparse.Namespace) -> int:
+    from services.mongo_indexes import QUERY_SHAPES, ensure_indexes
+    from utils.database import get_database
+
+    db = get_database()
+    if not args.no_create:
+        await ensure_indexes(db)
+
+    failures: List[str] = []
+    print(f"{'query':<30} {'collection':<22} {'result':<10} index")
+    for shape in QUERY_SHAPES:
+        info = classify(await _explain(db, shape))
+        if info["empty"]:
+            result = "empty"
+        elif info["collscan"]:
+            result = "allowed" if shape.allow_collscan else "COLLSCAN"
+            if not shape.allow_collscan:
+                failures.append(shape.name)
+        elif info["blocking_sort"]:
+            result = "SORT"
+            if args.strict_sort:
+                failures.append(shape.name)
+        else:
+            result = "ok"
+        print(f"{shape.name:<30} {shape.collection:<22} {result:<10} {', '.join(info['indexes']) or '-'}")
+
+    if failures:
+        print(f"\n{len(failures)} query shape(s) not index-backed: {', '.join(failures)}")
+        return 1
+    print(f"\nAll {len(QUERY_SHAPES)} query shapes are index-backed.")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--no-create", action="store_true", help="check the live indexes without creating missing ones")
+    parser.add_argument("--strict-sort", action="store_true", help="also fail on in-memory sorts")
+    args = parser.parse_args(argv)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
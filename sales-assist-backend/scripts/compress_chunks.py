@@ -0,0 +1,195 @@
+"""
+Compress stored chunk text with zstd, one trained dictionary per domain,
+and report storage and transfer savings.
+
+Chunks written with plain "text" are rewritten to text_z/text_codec; reads
+in services/mongo_service.py decompress transparently either way, so the
+migration can run while the API is serving. --revert restores plain text.
+Set CHUNK_TEXT_COMPRESSION_ENABLED=true so new ingests are compressed too.
+
+Usage (from sales-assist-backend/, with Mongo configured):
+    python -m scripts.compress_chunks --dry-run        # estimate only, writes nothing
+    python -m scripts.compress_chunks                  # train missing dictionaries, compress
+    python -m scripts.compress_chunks --domain it --retrain --dict-kb 64
+    python -m scripts.compress_chunks --revert
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from pymongo import UpdateOne
+
+from config.domains import BASE_DOMAINS
+
+
+async def _collection_sizes(db) -> Dict[str, int]:
+    try:
+        stats = await db.command("collStats", "chunks")
+    except Exception:
+        return {}
+    return {"size": int(stats.get("size", 0)), "storage": int(stats.get("storageSize", 0))}
+
+
+async def _sample_texts(db, domain: str, limit: int) -> List[str]:
+    from services.chunk_compression import decode_chunk_docs
+
+    pipeline = [
+        {"$match": {"domain": domain}},
+        {"$sample": {"size": limit}},
+        {"$project": {"_id": 0, "text": 1, "text_z": 1}},
+    ]
+    docs = [doc async for doc in db["chunks"].aggregate(pipeline)]
+    await decode_chunk_docs(docs)
+    return [doc.get("text") or "" for doc in docs]
+
+
+async def _prepare_dictionary(db, domain: str, args: argparse.Namespace) -> Optional[int]:
+    from services import chunk_compression
+
+    dict_id = chunk_compression.active_dictionary_id(domain)
+    if dict_id is not None and not args.retrain:
+        return dict_id
+    samples = await _sample_texts(db, domain, args.samples)
+    if len(samples) < args.min_samples:
+        print(f"{domain}: {len(samples)} samples, below --min-samples; compressing without a dictionary")
+        return dict_id
+    try:
+        zdict = chunk_compression.train_dictionary(samples, args.dict_kb * 1024)
+    except Exception as exc:
+        print(f"{domain}: dictionary training failed ({exc}); compressing without a dictionary")
+        return dict_id
+    if args.dry_run:
+        return chunk_compression.register_dictionary(domain, zdict)
+    return await chunk_compression.save_dictionary(domain, zdict, len(samples))
+
+
+async def _compress_domain(db, domain: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from services.chunk_compression import CODEC, compress_text
+
+    dict_id = await _prepare_dictionary(db, domain, args)
+    row = {"domain": domain, "dict_id": dict_id, "chunks": 0, "compressed": 0, "raw": 0, "stored": 0}
+    ops: List[UpdateOne] = []
+    cursor = db["chunks"].find({"domain": domain, "text": {"$exists": True}}, {"_id": 1, "text": 1})
+    async for doc in cursor:
+        text = doc.get("text") or ""
+        raw = len(text.encode("utf-8"))
+        blob = compress_text(text, domain)
+        row["chunks"] += 1
+        row["raw"] += raw
+        row["stored"] += len(blob) if blob is not None else raw
+        if blob is None:
+            continue
+        row["compressed"] += 1
+        ops.append(
+            UpdateOne(
+                {"_id": doc["_id"], "text": text},
+                {"$set": {"text_z": blob, "text_codec": CODEC}, "$unset": {"text": ""}},
+            )
+        )
+        if len(ops) >= args.batch_size:
+            if not args.dry_run:
+                await db["chunks"].bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not args.dry_run:
+        await db["chunks"].bulk_write(ops, ordered=False)
+    return row
+
+
+async def _revert_domain(db, domain: str, args: argparse.Namespace) -> Dict[str, Any]:
+    from services.chunk_compression import decode_chunk_docs
+
+    row = {"domain": domain, "dict_id": None, "chunks": 0, "compressed": 0, "raw": 0, "stored": 0}
+    ops: List[UpdateOne] = []
+    cursor = db["chunks"].find({"domain": domain, "text_z": {"$exists": True}}, {"_id": 1, "text_z": 1})
+    async for doc in cursor:
+        stored = len(doc["text_z"])
+        await decode_chunk_docs([doc])
+        row["chunks"] += 1
+        row["stored"] += stored
+        row["raw"] += len(doc["text"].encode("utf-8"))
+        ops.append(
+            UpdateOne(
+                {"_id": doc["_id"]},
+                {"$set": {"text": doc["text"]}, "$unset": {"text_z": "", "text_codec": ""}},
+            )
+        )
+        if len(ops) >= args.batch_size:
+            if not args.dry_run:
+                await db["chunks"].bulk_write(ops, ordered=False)
+            ops = []
+    if ops and not args.dry_run:
+        await db["chunks"].bulk_write(ops, ordered=False)
+    return row
+
+
+def _mb(value: int) -> float:
+    return value / (1024 * 1024)
+
+
+async def _main(args: argparse.Namespace) -> int:
+    from services.chunk_compression import load_dictionaries, zstd_available
+    from utils.database import get_database
+
+    if not zstd_available():
+        print("zstandard is not installed (pip install zstandard).")
+        return 1
+    db = get_database()
+    await load_dictionaries(force=True)
+    before = await _collection_sizes(db)
+
+    rows = []
+    for domain in args.domain or sorted(BASE_DOMAINS):
+        if args.revert:
+            rows.append(await _revert_domain(db, domain, args))
+        else:
+            rows.append(await _compress_domain(db, domain, args))
+
+    verb = "revert" if args.revert else "compress"
+    print(f"\n{verb}{' (dry run)' if args.dry_run else ''}")
+    print(f"{'domain':<10} {'dict_id':>11} {'chunks':>8} {'rewritten':>9} {'text_MB':>9} {'stored_MB':>9} {'ratio':>6}")
+    total_raw = total_stored = 0
+    for row in rows:
+        total_raw += row["raw"]
+        total_stored += row["stored"]
+        ratio = row["stored"] / row["raw"] if row["raw"] else 1.0
+        rewritten = row["chunks"] if args.revert else row["compressed"]
+        print(
+            f"{row['domain']:<10} {str(row['dict_id'] or '-'):>11} {row['chunks']:>8} {rewritten:>9} "
+            f"{_mb(row['raw']):>9.2f} {_mb(row['stored']):>9.2f} {ratio:>6.2f}"
+        )
+    if total_raw:
+        print(
+            f"\nchunk text on the wire: {_mb(total_raw):.2f} MB plain vs {_mb(total_stored):.2f} MB compressed "
+            f"({100.0 * (1 - total_stored / total_raw):.1f}% less per full read of these chunks)"
+        )
+
+    after = await _collection_sizes(db)
+    if before and after and not args.dry_run:
+        print(
+            f"chunks collection: data {_mb(before['size']):.2f} -> {_mb(after['size']):.2f} MB, "
+            f"storage {_mb(before['storage']):.2f} -> {_mb(after['storage']):.2f} MB"
+        )
+        print("(storageSize only shrinks once WiredTiger reuses or compacts the freed space)")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--domain", action="append", choices=sorted(BASE_DOMAINS), help="repeatable; default all")
+    parser.add_argument("--dry-run", action="store_true", help="report the savings without writing anything")
+    parser.add_argument("--revert", action="store_true", help="restore plain text on compressed chunks")
+    parser.add_argument("--retrain", action="store_true", help="train a new dictionary even if one exists")
+    parser.add_argument("--dict-kb", type=int, default=64)
+    parser.add_argument("--samples", type=int, default=2000)
+    parser.add_argument("--min-samples", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,322 @@
+"""
+Sweep nprobe/ef per domain and record the smallest setting that meets the
+recall target against exact brute-force top-k.
+
+Queries come from --queries-file (one question per line, optionally
+"domain<TAB>question"; embedded with the app's model) when given. Otherwise
+indexed vectors are used as queries, held out leave-one-out: each query's own
+id is dropped from both the search results and the exact top-k, so a vector
+finding itself does not inflate recall.
+
+Results are saved under the real collection name for either backend. The
+memory backend should be fed an export of the whole collection: it builds one
+IVF over every domain, like Milvus, and only saves when that IVF plan is the
+one the app serves for the collection's size.
+
+Usage (from sales-assist-backend/):
+    python -m scripts.tune_search_params --domains rpa it --target-recall 0.95
+    python -m scripts.tune_search_params --queries-file eval_questions.tsv
+    MILVUS_URI=./milvus_lite.db python -m scripts.tune_search_params
+    python -m scripts.tune_search_params --backend memory --vectors-file vectors.npz
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from config.domains import BASE_DOMAINS
+
+
+class MilvusTuningBackend:
+    """
+    Tunes the live collection through the same search path the app uses.
+    Set MILVUS_URI to a local file to run against Milvus Lite.
+    """
+
+    def __init__(self, collection_name: Optional[str] = None):
+        from services.milvus_index_manager import get_active_plan
+        from services.milvus_service import get_collection, get_collection_name
+
+        self.collection_name = collection_name or get_collection_name()
+        self.collection = get_collection(self.collection_name)
+        self.plan = get_active_plan(self.collection_name)
+
+    def fetch_vectors(self, domain: str) -> Tuple[List[str], np.ndarray]:
+        ids: List[str] = []
+        vectors: List[List[float]] = []
+        iterator = self.collection.query_iterator(
+            batch_size=1000,
+            expr=f'domain == "{domain}"',
+            output_fields=["id", "embedding"],
+        )
+        try:
+            while True:
+                batch = iterator.next()
+                if not batch:
+                    break
+                for row in batch:
+                    ids.append(str(row["id"]))
+                    vectors.append(row["embedding"])
+        finally:
+            iterator.close()
+        return ids, np.asarray(vectors, dtype=np.float32)
+
+    def search(self, query: np.ndarray, top_k: int, domain: str, params: Dict[str, Any]) -> List[str]:
+        from services.milvus_service import search_embeddings
+
+        hits = search_embeddings(
+            query_embedding=query.tolist(),
+            top_k=top_k,
+            domain=domain,
+            collection_name=self.collection_name,
+            search_params={"metric_type": "IP", "params": params},
+        )
+        return [str(hit.id) for hit in hits]
+
+
+class InMemoryIVFBackend:
+    """
+    In-process IVF stand-in for tuning without a Milvus server.
+    Vectors come from an .npz with `ids`, `embeddings` and `domains` arrays.
+    Like Milvus, it clusters the whole collection once and applies the domain
+    filter to the probed lists, so a minority domain needs the same extra
+    nprobe here as in production.
+    """
+
+    def __init__(self, vectors_file: str, collection_name: str, nlist: int = 0, seed: int = 7):
+        from services.milvus_index_manager import plan_for_size
+
+        data = np.load(vectors_file, allow_pickle=False)
+        self._ids = np.asarray(data["ids"]).astype(str)
+        self._vectors = np.asarray(data["embeddings"], dtype=np.float32)
+        self._domains = np.asarray(data["domains"]).astype(str)
+        self.collection_name = collection_name
+        # Tuned params only apply to the exact plan the app serves, which
+        # for an export of the whole collection is the one for its size.
+        self.plan = plan_for_size(len(self._ids))
+        self.saveable = True
+        if not self.plan.index_type.startswith("IVF"):
+            print(
+                f"{collection_name}: {len(self._ids)} vectors serve as {self.plan.index_type}; "
+                "tuning an IVF_FLAT stand-in, results will not be saved"
+            )
+            self.plan = plan_for_size(len(self._ids), index_type="IVF_FLAT")
+            self.saveable = False
+        if nlist and nlist != int(self.plan.build_params["nlist"]):
+            self.plan = type(self.plan)(self.plan.index_type, {"nlist": nlist}, dict(self.plan.search_params))
+            self.saveable = False
+        self._rng = np.random.default_rng(seed)
+        self._index: Optional[Tuple[np.ndarray, List[np.ndarray]]] = None
+
+    def _build(self) -> Tuple[np.ndarray, List[np.ndarray]]:
+        if self._index is not None:
+            return self._index
+        vectors = self._vectors
+        nlist = max(1, min(int(self.plan.build_params["nlist"]), len(vectors)))
+        centroids = vectors[self._rng.choice(len(vectors), size=nlist, replace=False)].copy()
+        for _ in range(10):
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = vectors[assign == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+        assign = np.argmax(vectors @ centroids.T, axis=1)
+        self._index = (centroids, [np.flatnonzero(assign == c) for c in range(nlist)])
+        return self._index
+
+    def fetch_vectors(self, domain: str) -> Tuple[List[str], np.ndarray]:
+        rows = np.flatnonzero(self._domains == domain)
+        return self._ids[rows].tolist(), self._vectors[rows]
+
+    def search(self, query: np.ndarray, top_k: int, domain: str, params: Dict[str, Any]) -> List[str]:
+        centroids, lists = self._build()
+        nprobe = int(params.get("nprobe", 1))
+        probe = np.argsort(-(centroids @ query))[:nprobe]
+        candidates = np.concatenate([lists[c] for c in probe]) if len(probe) else np.array([], dtype=int)
+        candidates = candidates[self._domains[candidates] == domain]
+        if not len(candidates):
+            return []
+        scores = self._vectors[candidates] @ query
+        order = np.argsort(-scores)[:top_k]
+        return self._ids[candidates[order]].tolist()
+
+
+def _sweep_values(index_type: str, build_params: Dict[str, Any], top_k: int) -> List[Dict[str, Any]]:
+    if index_type.startswith("IVF"):
+        nlist = int(build_params.get("nlist", 1024))
+        values: List[int] = []
+        nprobe = 1
+        while nprobe < nlist:
+            values.append(nprobe)
+            nprobe *= 2
+        values.append(nlist)
+        return [{"nprobe": v} for v in values]
+    if index_type == "HNSW":
+        values = sorted({max(top_k, v) for v in (16, 32, 64, 128, 256, 512)})
+        return [{"ef": v} for v in values]
+    return [{}]
+
+
+def _exact_top_k(
+    queries: np.ndarray,
+    corpus: np.ndarray,
+    ids: Sequence[str],
+    top_k: int,
+    held_out: Optional[np.ndarray] = None,
+) -> List[set]:
+    scores = queries @ corpus.T
+    if held_out is not None:
+        scores[np.arange(len(held_out)), held_out] = -np.inf
+    k = min(top_k, corpus.shape[0] - (1 if held_out is not None else 0))
+    if k <= 0:
+        return [set() for _ in range(len(queries))]
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [{ids[i] for i in row} for row in top]
+
+
+def load_queries_file(path: str) -> Dict[str, List[str]]:
+    """
+    domain -> questions; "" collects lines without a domain prefix.
+    """
+    questions: Dict[str, List[str]] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            domain, _, question = line.partition("\t") if "\t" in line else ("", "", line)
+            questions.setdefault(domain.strip(), []).append(question.strip())
+    return questions
+
+
+def embed_questions(questions: List[str]) -> np.ndarray:
+    from services.embedding_service import embed_texts
+
+    return np.asarray(embed_texts(questions), dtype=np.float32)
+
+
+def tune_domain(
+    backend: Any,
+    domain: str,
+    sample_size: int,
+    top_k: int,
+    target_recall: float,
+    seed: int = 7,
+    queries: Optional[np.ndarray] = None,
+) -> Optional[Dict[str, Any]]:
+    ids, corpus = backend.fetch_vectors(domain)
+    if len(ids) == 0:
+        print(f"[{domain}] no vectors, skipping")
+        return None
+
+    held_out: Optional[np.ndarray] = None
+    if queries is None or not len(queries):
+        rng = np.random.default_rng(seed)
+        held_out = rng.choice(len(ids), size=min(sample_size, len(ids)), replace=False)
+        queries = corpus[held_out]
+    truth = _exact_top_k(queries, corpus, ids, top_k, held_out)
+    own_ids = [ids[i] for i in held_out] if held_out is not None else [None] * len(queries)
+    query_source = "held_out" if held_out is not None else "queries_file"
+
+    plan = backend.plan
+    index_type = plan.index_type if plan else "FLAT"
+    build_params = dict(plan.build_params) if plan else {}
+
+    chosen: Optional[Dict[str, Any]] = None
+    best: Optional[Dict[str, Any]] = None
+    for params in _sweep_values(index_type, build_params, top_k):
+        hits = 0
+        start = time.perf_counter()
+        for query, expected, own_id in zip(queries, truth, own_ids):
+            if own_id is None:
+                found = backend.search(query, top_k, domain, params)
+            else:
+                found = [cid for cid in backend.search(query, top_k + 1, domain, params) if cid != own_id]
+            hits += len(expected.intersection(found[:top_k]))
+        latency_ms = (time.perf_counter() - start) * 1000.0 / len(queries)
+        recall = hits / float(sum(len(t) for t in truth) or 1)
+        print(f"[{domain}] {index_type} {params or '-'} recall@{top_k}={recall:.4f} latency={latency_ms:.2f}ms")
+        best = {"search_params": params, "recall": recall, "latency_ms": latency_ms}
+        if recall >= target_recall:
+            chosen = best
+            break
+
+    result = chosen or best
+    if result is None:
+        return None
+    return {
+        "index_type": index_type,
+        "build_params": build_params,
+        "search_params": result["search_params"],
+        "recall": round(result["recall"], 4),
+        "latency_ms": round(result["latency_ms"], 3),
+        "target_recall": target_recall,
+        "met_target": chosen is not None,
+        "top_k": top_k,
+        "sample_size": int(len(queries)),
+        "query_source": query_source,
+        "num_vectors": int(len(ids)),
+        "tuned_at": datetime.utcnow().isoformat(),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    from services.milvus_index_manager import save_tuned_params
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backend", choices=["milvus", "memory"], default="milvus")
+    parser.add_argument("--collection", default=None, help="Milvus collection (default: MILVUS_COLLECTION)")
+    parser.add_argument("--vectors-file", default=None, help=".npz for the in-memory backend")
+    parser.add_argument(
+        "--queries-file",
+        default=None,
+        help="eval questions, one per line, optionally 'domain<TAB>question' (default: held-out vectors)",
+    )
+    parser.add_argument("--domains", nargs="*", default=sorted(BASE_DOMAINS))
+    parser.add_argument("--sample", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=int(os.getenv("MILVUS_TOP_K", "5")))
+    parser.add_argument("--target-recall", type=float, default=float(os.getenv("MILVUS_TARGET_RECALL", "0.95")))
+    parser.add_argument("--dry-run", action="store_true", help="Print results without writing the params file")
+    args = parser.parse_args(argv)
+
+    if args.backend == "memory":
+        from services.milvus_service import get_collection_name
+
+        if not args.vectors_file:
+            parser.error("--vectors-file is required for the memory backend")
+        backend: Any = InMemoryIVFBackend(args.vectors_file, args.collection or get_collection_name())
+    else:
+        backend = MilvusTuningBackend(args.collection)
+
+    questions = load_queries_file(args.queries_file) if args.queries_file else {}
+    for domain in args.domains:
+        queries = None
+        if questions:
+            domain_questions = questions.get(domain, []) + questions.get("", [])
+            if not domain_questions:
+                print(f"[{domain}] no questions in {args.queries_file}, skipping")
+                continue
+            queries = embed_questions(domain_questions)
+        entry = tune_domain(backend, domain, args.sample, args.top_k, args.target_recall, queries=queries)
+        if entry is None:
+            continue
+        if not entry["met_target"]:
+            print(f"[{domain}] target {args.target_recall} not reached; recording the widest setting")
+        if args.dry_run:
+            continue
+        if not getattr(backend, "saveable", True):
+            print(f"[{domain}] stand-in index differs from the served plan; not saving")
+            continue
+        save_tuned_params(backend.collection_name, domain, entry)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pymongo.errors import DuplicateKeyError
+
+from logger import enhanced_logger
+from services.mongo_service import get_db
+
+
+# domain -> (loaded_at, routing vectors [n, dim], file_id per row)
+_routing_cache: Dict[str, Tuple[float, np.ndarray, List[str]]] = {}
+_cache_lock = threading.Lock()
+
+# Running per-domain centroids (normalised), refreshed from Mongo.
+_domain_centroids: Dict[str, np.ndarray] = {}
+_domain_centroids_loaded_at = 0.0
+
+
+def file_routing_enabled() -> bool:
+    flag = os.getenv("FILE_ROUTING_ENABLED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _routing_top_m() -> int:
+    return max(1, int(os.getenv("FILE_ROUTING_TOP_M", "8")))
+
+
+def _routing_min_files() -> int:
+    # Below this many files a plain filtered search is already cheap.
+    return int(os.getenv("FILE_ROUTING_MIN_FILES", "50"))
+
+
+def _cache_ttl_seconds() -> float:
+    return float(os.getenv("FILE_ROUTING_CACHE_TTL_SECONDS", "60"))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def compute_file_vectors(embeddings: Sequence[Sequence[float]], num_medoids: Optional[int] = None) -> np.ndarray:
+    """
+    Routing vectors for one file: a few medoids (FILE_ROUTING_MEDOIDS) from a
+    short k-means over its chunks so multi-topic files can still be found, or
+    the normalised centroid when set to 1.
+    """
+    vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+    k = num_medoids if num_medoids is not None else int(os.getenv("FILE_ROUTING_MEDOIDS", "2"))
+    k = max(1, min(k, len(vectors)))
+    if k == 1:
+        return _normalize(vectors.mean(axis=0, keepdims=True))
+
+    rng = np.random.default_rng(0)
+    centers = vectors[rng.choice(len(vectors), size=k, replace=False)]
+    for _ in range(10):
+        assign = np.argmax(vectors @ centers.T, axis=1)
+        for c in range(k):
+            members = vectors[assign == c]
+            if len(members):
+                centers[c] = members.mean(axis=0)
+        centers = _normalize(centers)
+    # Medoid = the real chunk closest to each center.
+    medoid_rows = sorted({int(np.argmax(vectors @ center)) for center in centers})
+    return vectors[medoid_rows]
+
+
+def rank_files(
+    query: np.ndarray,
+    vectors: np.ndarray,
+    row_file_ids: List[str],
+    top_m: int,
+    allowed: Optional[set] = None,
+) -> List[str]:
+    """
+    Best top_m files by max similarity over each file's routing vectors.
+    """
+    if not len(vectors):
+        return []
+    scores = vectors @ _normalize(np.asarray(query, dtype=np.float32))
+    best: Dict[str, float] = {}
+    for row in np.argsort(-scores):
+        file_id = row_file_ids[row]
+        if allowed is not None and file_id not in allowed:
+            continue
+        if file_id not in best:
+            best[file_id] = float(scores[row])
+            if len(best) >= top_m:
+                break
+    return list(best)
+
+
+async def _add_to_domain_centroid(domain: str, sum_vector: np.ndarray, count: int) -> None:
+    """
+    Fold a file's embedding sum into the domain's running sum with $inc, so
+    concurrent ingests never overwrite each other.
+    """
+    db = get_db()
+    # $inc alone would create sum_vector as an object, hence the seed upsert.
+    try:
+        await db["domain_centroids"].update_one(
+            {"domain": domain},
+            {"$setOnInsert": {"domain": domain, "sum_vector": [0.0] * len(sum_vector), "count": 0}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Lost a race to create the domain's document; it exists now.
+        pass
+    inc: Dict[str, float] = {f"sum_vector.{i}": float(value) for i, value in enumerate(sum_vector)}
+    inc["count"] = count
+    await db["domain_centroids"].update_one(
+        {"domain": domain},
+        {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}},
+    )
+
+
+async def upsert_file_centroids(file_id: str, domain: str, embeddings: Sequence[Sequence[float]]) -> None:
+    if not embeddings:
+        return
+    vectors = compute_file_vectors(embeddings)
+    sum_vector = _normalize(np.asarray(embeddings, dtype=np.float32)).sum(axis=0)
+    db = get_db()
+    await db["file_centroids"].update_one(
+        {"file_id": file_id},
+        {
+            "$set": {
+                "file_id": file_id,
+                "domain": domain,
+                "vectors": vectors.tolist(),
+                "sum_vector": sum_vector.tolist(),
+                "num_chunks": len(embeddings),
+                "updated_at": datetime.utcnow(),
+            }
+        },
+        upsert=True,
+    )
+    await _add_to_domain_centroid(domain, sum_vector, len(embeddings))
+    invalidate_routing_cache(domain)
+
+
+async def delete_file_centroids(file_id: str) -> None:
+    db = get_db()
+    doc = await db["file_centroids"].find_one_and_delete(
+        {"file_id": file_id},
+        {"domain": 1, "sum_vector": 1, "num_chunks": 1},
+    )
+    if not doc:
+        return
+    if doc.get("sum_vector"):
+        await _add_to_domain_centroid(
+            doc["domain"],
+            -np.asarray(doc["sum_vector"], dtype=np.float32),
+            -int(doc.get("num_chunks", 0)),
+        )
+    invalidate_routing_cache(doc.get("domain"))
+
+
+def invalidate_routing_cache(domain: Optional[str] = None) -> None:
+    with _cache_lock:
+        if domain is None:
+            _routing_cache.clear()
+        else:
+            _routing_cache.pop(domain, None)
+
+
+async def _load_domain(domain: str) -> Tuple[np.ndarray, List[str]]:
+    with _cache_lock:
+        cached = _routing_cache.get(domain)
+    if cached and time.time() - cached[0] < _cache_ttl_seconds():
+        return cached[1], cached[2]
+
+    db = get_db()
+    rows: List[List[float]] = []
+    row_file_ids: List[str] = []
+    async for doc in db["file_centroids"].find({"domain": domain}, {"_id": 0, "file_id": 1, "vectors": 1}):
+        for vector in doc.get("vectors") or []:
+            rows.append(vector)
+            row_file_ids.append(doc["file_id"])
+    matrix = np.asarray(rows, dtype=np.float32) if rows else np.zeros((0, 0), dtype=np.float32)
+    with _cache_lock:
+        _routing_cache[domain] = (time.time(), matrix, row_file_ids)
+    return matrix, row_file_ids
+
+
+async def route_files(
+    query_embedding: List[float],
+    domain: str,
+    file_ids: Optional[List[str]] = None,
+) -> Optional[List[str]]:
+    """
+    Stage one of two-stage retrieval: pick the top-M files for this query.
+    Returns None when routing should not apply (disabled, or too few files
+    for it to pay off), in which case the caller searches as before.
+    """
+    if not file_routing_enabled() or not domain:
+        return None
+    top_m = _routing_top_m()
+    if file_ids and len(file_ids) <= top_m:
+        return None
+
+    start = time.time()
+    vectors, row_file_ids = await _load_domain(domain)
+    num_files = len(set(row_file_ids))
+    if num_files < max(_routing_min_files(), top_m + 1):
+        return None
+
+    selected = rank_files(
+        np.asarray(query_embedding, dtype=np.float32),
+        vectors,
+        row_file_ids,
+        top_m,
+        allowed=set(file_ids) if file_ids else None,
+    )
+    enhanced_logger.debug(
+        "FILE_ROUTING_SELECTED",
+        extra_data={
+            "domain": domain,
+            "files_total": num_files,
+            "files_selected": len(selected),
+            "latency_ms": round((time.time() - start) * 1000.0, 2),
+        },
+    )
+    return selected or None
+
+
+def domain_routing_enabled() -> bool:
+    flag = os.getenv("DOMAIN_ROUTING_ENABLED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+async def refresh_domain_centroids(force: bool = False) -> None:
+    """
+    Reload the per-domain centroids when the in-process copy is older than
+    DOMAIN_ROUTING_CACHE_TTL_SECONDS.
+    """
+    global _domain_centroids, _domain_centroids_loaded_at
+    ttl = float(os.getenv("DOMAIN_ROUTING_CACHE_TTL_SECONDS", "60"))
+    if not force and time.time() - _domain_centroids_loaded_at < ttl:
+        return
+    db = get_db()
+    centroids: Dict[str, np.ndarray] = {}
+    async for doc in db["domain_centroids"].find({}, {"_id": 0, "domain": 1, "sum_vector": 1, "count": 1}):
+        if int(doc.get("count", 0)) <= 0 or not doc.get("sum_vector"):
+            continue
+        centroids[doc["domain"]] = _normalize(np.asarray(doc["sum_vector"], dtype=np.float32))
+    _domain_centroids = centroids
+    _domain_centroids_loaded_at = time.time()
+
+
+def select_domains(query_embedding: Sequence[float], domains: Sequence[str]) -> List[str]:
+    """
+    Domains worth searching for a general query: those within
+    DOMAIN_ROUTING_MARGIN of the best centroid similarity. Returns every
+    domain when routing is off, a centroid is missing, or the best match is
+    too weak to trust (DOMAIN_ROUTING_MIN_SCORE).
+    """
+    domains = list(domains)
+    centroids = _domain_centroids
+    if not domain_routing_enabled() or any(d not in centroids for d in domains):
+        return domains
+    query = _normalize(np.asarray(query_embedding, dtype=np.float32))
+    scores = {d: float(centroids[d] @ query) for d in domains}
+    best = max(scores.values())
+    margin = float(os.getenv("DOMAIN_ROUTING_MARGIN", "0.05"))
+    if best < float(os.getenv("DOMAIN_ROUTING_MIN_SCORE", "0.2")):
+        return domains
+    selected = [d for d in domains if scores[d] >= best - margin]
+    pruned = [d for d in domains if d not in selected]
+    if pruned:
+        enhanced_logger.info(
+            "DOMAIN_ROUTING_PRUNED",
+            extra_data={
+                "selected": selected,
+                "pruned": pruned,
+                "scores": {d: round(v, 4) for d, v in scores.items()},
+            },
+        )
+    return selected
@@ -0,0 +1,221 @@
+from __future__ import annotations
+
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+from logger import enhanced_logger
+from utils.database import get_database
+
+# Compressed chunks carry text_z (zstd frame) + text_codec instead of text.
+CODEC = "zstd"
+
+# dict_id -> ZstdCompressionDict; domain -> dict_id of its newest dictionary.
+_dicts: Dict[int, Any] = {}
+_active: Dict[str, int] = {}
+_compressors: Dict[Any, Any] = {}
+_decompressors: Dict[int, Any] = {}
+_loaded_at = 0.0
+_stats: Dict[str, int] = {
+    "compressed_writes": 0,
+    "plain_writes": 0,
+    "raw_bytes_written": 0,
+    "stored_bytes_written": 0,
+    "decoded_reads": 0,
+    "raw_bytes_read": 0,
+    "stored_bytes_read": 0,
+}
+
+
+def _load_zstd():
+    """
+    zstandard is needed to write or read compressed chunks; without it
+    inserts stay plain text.
+    """
+    try:
+        import zstandard
+    except Exception:
+        return None
+    return zstandard
+
+
+def zstd_available() -> bool:
+    return _load_zstd() is not None
+
+
+def compression_enabled() -> bool:
+    flag = os.getenv("CHUNK_TEXT_COMPRESSION_ENABLED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"} and zstd_available()
+
+
+def _level() -> int:
+    return int(os.getenv("CHUNK_TEXT_ZSTD_LEVEL", "3"))
+
+
+def _min_bytes() -> int:
+    return int(os.getenv("CHUNK_TEXT_COMPRESS_MIN_BYTES", "128"))
+
+
+def _refresh_seconds() -> float:
+    return float(os.getenv("CHUNK_TEXT_DICT_REFRESH_SECONDS", "300"))
+
+
+def register_dictionary(domain: str, zdict: Any) -> int:
+    dict_id = int(zdict.dict_id())
+    _dicts[dict_id] = zdict
+    _active[domain] = dict_id
+    return dict_id
+
+
+def active_dictionary_id(domain: str) -> Optional[int]:
+    return _active.get(domain)
+
+
+async def load_dictionaries(force: bool = False) -> None:
+    """
+    Load every stored dictionary, newest per domain becoming active.
+    Refreshed every CHUNK_TEXT_DICT_REFRESH_SECONDS so workers pick up
+    dictionaries trained by the migration tool.
+    """
+    global _loaded_at
+    if not force and time.time() - _loaded_at < _refresh_seconds():
+        return
+    zstd = _load_zstd()
+    _loaded_at = time.time()
+    if zstd is None:
+        return
+    db = get_database()
+    cursor = db["chunk_dictionaries"].find({}, {"_id": 0, "domain": 1, "dict_id": 1, "data": 1}).sort("created_at", 1)
+    async for doc in cursor:
+        _dicts[int(doc["dict_id"])] = zstd.ZstdCompressionDict(bytes(doc["data"]))
+        _active[doc["domain"]] = int(doc["dict_id"])
+
+
+async def _fetch_dictionary(dict_id: int) -> None:
+    zstd = _load_zstd()
+    doc = await get_database()["chunk_dictionaries"].find_one({"dict_id": dict_id}, {"_id": 0, "data": 1})
+    if doc is None:
+        raise RuntimeError(f"Chunk text dictionary {dict_id} not found")
+    _dicts[dict_id] = zstd.ZstdCompressionDict(bytes(doc["data"]))
+
+
+def train_dictionary(samples: List[str], dict_size: int) -> Any:
+    zstd = _load_zstd()
+    if zstd is None:
+        raise RuntimeError("zstandard is not installed")
+    return zstd.train_dictionary(dict_size, [s.encode("utf-8") for s in samples if s])
+
+
+async def save_dictionary(domain: str, zdict: Any, samples: int) -> int:
+    data = zdict.as_bytes()
+    dict_id = register_dictionary(domain, zdict)
+    await get_database()["chunk_dictionaries"].insert_one(
+        {
+            "domain": domain,
+            "dict_id": dict_id,
+            "data": data,
+            "dict_size": len(data),
+            "samples": samples,
+            "created_at": datetime.utcnow(),
+        }
+    )
+    enhanced_logger.info(
+        "CHUNK_TEXT_DICTIONARY_SAVED",
+        extra_data={"domain": domain, "dict_id": dict_id, "dict_size": len(data), "samples": samples},
+    )
+    return dict_id
+
+
+def compress_text(text: str, domain: Optional[str]) -> Optional[bytes]:
+    """
+    zstd frame for text using the domain's dictionary, or None when the
+    text is too short or would not shrink.
+    """
+    zstd = _load_zstd()
+    raw = text.encode("utf-8")
+    if zstd is None or len(raw) < _min_bytes():
+        return None
+    dict_id = _active.get(domain or "")
+    key = (dict_id, _level())
+    compressor = _compressors.get(key)
+    if compressor is None:
+        zdict = _dicts.get(dict_id) if dict_id is not None else None
+        compressor = zstd.ZstdCompressor(level=key[1], dict_data=zdict, write_content_size=True)
+        _compressors[key] = compressor
+    blob = compressor.compress(raw)
+    return blob if len(blob) < len(raw) else None
+
+
+def _decompress(blob: bytes) -> str:
+    zstd = _load_zstd()
+    if zstd is None:
+        raise RuntimeError("zstandard is not installed; cannot read compressed chunk text")
+    dict_id = int(zstd.get_frame_parameters(blob).dict_id)
+    decompressor = _decompressors.get(dict_id)
+    if decompressor is None:
+        decompressor = zstd.ZstdDecompressor(dict_data=_dicts[dict_id] if dict_id else None)
+        _decompressors[dict_id] = decompressor
+    return decompressor.decompress(blob).decode("utf-8")
+
+
+def encode_chunk_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Storage form of a chunk doc; the input is left untouched.
+    """
+    stored = dict(doc)
+    text = doc.get("text")
+    blob = compress_text(text, doc.get("domain")) if text else None
+    if blob is None:
+        _stats["plain_writes"] += 1
+        return stored
+    del stored["text"]
+    stored["text_z"] = blob
+    stored["text_codec"] = CODEC
+    _stats["compressed_writes"] += 1
+    _stats["raw_bytes_written"] += len(text.encode("utf-8"))
+    _stats["stored_bytes_written"] += len(blob)
+    return stored
+
+
+async def encode_chunk_docs(docs: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    if not compression_enabled():
+        return [dict(doc) for doc in docs]
+    await load_dictionaries()
+    return [encode_chunk_doc(doc) for doc in docs]
+
+
+async def decode_chunk_docs(docs: Iterable[Dict[str, Any]]) -> None:
+    """
+    Restore "text" in place on any compressed docs.
+    """
+    compressed = [doc for doc in docs if doc.get("text_z") is not None]
+    if not compressed:
+        return
+    zstd = _load_zstd()
+    if zstd is None:
+        raise RuntimeError("zstandard is not installed; cannot read compressed chunk text")
+    for doc in compressed:
+        blob = bytes(doc["text_z"])
+        dict_id = int(zstd.get_frame_parameters(blob).dict_id)
+        if dict_id and dict_id not in _dicts:
+            await _fetch_dictionary(dict_id)
+        doc["text"] = _decompress(blob)
+        del doc["text_z"]
+        doc.pop("text_codec", None)
+        _stats["decoded_reads"] += 1
+        _stats["stored_bytes_read"] += len(blob)
+        _stats["raw_bytes_read"] += len(doc["text"].encode("utf-8"))
+
+
+def get_stats() -> Dict[str, Any]:
+    written = _stats["raw_bytes_written"]
+    read = _stats["raw_bytes_read"]
+    return {
+        **_stats,
+        "enabled": compression_enabled(),
+        "dictionaries": len(_dicts),
+        "active_dictionaries": dict(_active),
+        "write_ratio": round(_stats["stored_bytes_written"] / written, 4) if written else None,
+        "read_ratio": round(_stats["stored_bytes_read"] / read, 4) if read else None,
+    }
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from logger import enhanced_logger
+
+
+# chunk_id -> (file_id, domain, zlib-compressed text), most recently used last.
+_entries: "OrderedDict[str, Tuple[str, str, bytes]]" = OrderedDict()
+_chunks_by_file: Dict[str, Set[str]] = {}
+_size_bytes = 0
+_hits = 0
+_misses = 0
+_lock = threading.Lock()
+
+# Invalidation sequence: fills read from Mongo before an invalidation of
+# their file or domain are dropped instead of repopulating stale text.
+_seq = 0
+_file_invalidated: "OrderedDict[str, int]" = OrderedDict()
+_domain_invalidated: Dict[str, int] = {}
+_forgotten_seq = 0
+# domain -> data version last seen (bumped by ingest on every worker's data)
+_domain_versions: Dict[str, int] = {}
+
+
+def chunk_text_store_enabled() -> bool:
+    flag = os.getenv("CHUNK_TEXT_CACHE_ENABLED", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _max_bytes() -> int:
+    return int(os.getenv("CHUNK_TEXT_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+
+def _compress_level() -> int:
+    return int(os.getenv("CHUNK_TEXT_CACHE_COMPRESS_LEVEL", "1"))
+
+
+def _max_tracked_invalidations() -> int:
+    return int(os.getenv("CHUNK_TEXT_CACHE_MAX_INVALIDATIONS", "10000"))
+
+
+def _drop(chunk_id: str) -> None:
+    global _size_bytes
+    file_id, _domain, blob = _entries.pop(chunk_id)
+    _size_bytes -= len(blob)
+    ids = _chunks_by_file.get(file_id)
+    if ids is not None:
+        ids.discard(chunk_id)
+        if not ids:
+            del _chunks_by_file[file_id]
+
+
+def fill_token() -> int:
+    """
+    Take before reading chunks from Mongo and pass to put_chunks(since=...).
+    """
+    with _lock:
+        return _seq
+
+
+def _invalidated_since(file_id: str, domain: str, since: int) -> bool:
+    if since < _forgotten_seq:
+        return True
+    return _file_invalidated.get(file_id, 0) > since or _domain_invalidated.get(domain, 0) > since
+
+
+def put_chunks(chunk_docs: Iterable[Dict[str, Any]], since: Optional[int] = None) -> None:
+    """
+    Cache chunk text keyed by chunk_id, evicting least recently used entries
+    once the compressed size exceeds CHUNK_TEXT_CACHE_MAX_MB. With `since`
+    (a fill_token), docs whose file or domain was invalidated after the
+    token was taken are skipped.
+    """
+    global _size_bytes
+    if not chunk_text_store_enabled():
+        return
+    level = _compress_level()
+    max_bytes = _max_bytes()
+    with _lock:
+        for doc in chunk_docs:
+            chunk_id = doc.get("chunk_id")
+            text = doc.get("text")
+            if not chunk_id or text is None:
+                continue
+            file_id = str(doc.get("file_id") or "")
+            domain = str(doc.get("domain") or "")
+            if since is not None and _invalidated_since(file_id, domain, since):
+                continue
+            if chunk_id in _entries:
+                _drop(chunk_id)
+            blob = zlib.compress(text.encode("utf-8"), level)
+            _entries[chunk_id] = (file_id, domain, blob)
+            _chunks_by_file.setdefault(file_id, set()).add(chunk_id)
+            _size_bytes += len(blob)
+        while _entries and _size_bytes > max_bytes:
+            _drop(next(iter(_entries)))
+
+
+def get_texts(chunk_ids: List[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Return (texts found in the store, chunk_ids that still need a lookup).
+    """
+    global _hits, _misses
+    if not chunk_text_store_enabled():
+        return {}, list(chunk_ids)
+    found: Dict[str, str] = {}
+    missing: List[str] = []
+    with _lock:
+        for chunk_id in chunk_ids:
+            entry = _entries.get(chunk_id)
+            if entry is None:
+                missing.append(chunk_id)
+                continue
+            _entries.move_to_end(chunk_id)
+            found[chunk_id] = entry[2]
+        _hits += len(found)
+        _misses += len(missing)
+    # Decompress outside the lock.
+    return {cid: zlib.decompress(blob).decode("utf-8") for cid, blob in found.items()}, missing
+
+
+def invalidate_file(file_id: str) -> int:
+    global _seq, _forgotten_seq
+    with _lock:
+        _seq += 1
+        _file_invalidated[file_id] = _seq
+        _file_invalidated.move_to_end(file_id)
+        while len(_file_invalidated) > _max_tracked_invalidations():
+            # Fills older than a forgotten invalidation are dropped outright.
+            _, forgotten = _file_invalidated.popitem(last=False)
+            _forgotten_seq = max(_forgotten_seq, forgotten)
+        chunk_ids = list(_chunks_by_file.get(file_id, ()))
+        for chunk_id in chunk_ids:
+            _drop(chunk_id)
+    if chunk_ids:
+        enhanced_logger.debug(
+            "CHUNK_TEXT_CACHE_INVALIDATED",
+            extra_data={"file_id": file_id, "chunks": len(chunk_ids)},
+        )
+    return len(chunk_ids)
+
+
+def sync_domain_versions(versions: Dict[str, int]) -> List[str]:
+    """
+    invalidate_file only reaches this worker. Ingest bumps the domain's
+    data version in Mongo, so a version change seen here drops every cached
+    chunk of that domain (and any fill in flight). Returns those domains.
+    """
+    global _seq
+    changed: List[str] = []
+    with _lock:
+        for domain, version in versions.items():
+            previous = _domain_versions.get(domain)
+            _domain_versions[domain] = version
+            if previous is None or previous == version:
+                continue
+            changed.append(domain)
+            _seq += 1
+            _domain_invalidated[domain] = _seq
+            for chunk_id in [cid for cid, entry in _entries.items() if entry[1] == domain]:
+                _drop(chunk_id)
+    if changed:
+        enhanced_logger.debug("CHUNK_TEXT_CACHE_DOMAINS_INVALIDATED", extra_data={"domains": changed})
+    return changed
+
+
+def get_stats() -> Dict[str, Any]:
+    with _lock:
+        lookups = _hits + _misses
+        return {
+            "entries": len(_entries),
+            "files": len(_chunks_by_file),
+            "size_bytes": _size_bytes,
+            "hits": _hits,
+            "misses": _misses,
+            "hit_rate": round(_hits / lookups, 4) if lookups else 0.0,
+        }
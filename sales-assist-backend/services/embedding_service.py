@@ -2,6 +2,7 @@ from __future__ import annotations
 
 import asyncio
 import os
+from collections import OrderedDict
 from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
 
@@ -10,6 +11,7 @@ from sentence_transformers import SentenceTransformer
 
 _model: Optional[SentenceTransformer] = None
 _executor: Optional[ThreadPoolExecutor] = None
+_query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
 
 
 def _load_model() -> SentenceTransformer:
@@ -77,13 +79,23 @@ async def embed_texts_async(texts: List[str]) -> List[List[float]]:
 
 async def embed_query_async(query: str) -> List[float]:
     """
-    Convenience wrapper for a single query embedding.
+    Convenience wrapper for a single query embedding, with a small LRU for
+    repeated queries.
     """
     if not query:
         return []
+    key = " ".join(query.split())
+    cached = _query_cache.get(key)
+    if cached is not None:
+        _query_cache.move_to_end(key)
+        return cached
     embeddings = await embed_texts_async([query])
     if not embeddings:
         return []
+    _query_cache[key] = embeddings[0]
+    max_size = int(os.getenv("EMBEDDING_QUERY_CACHE_SIZE", "1024"))
+    while len(_query_cache) > max_size:
+        _query_cache.popitem(last=False)
     return embeddings[0]
 
 
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+TERMINAL_STATUSES = frozenset({"completed", "failed"})
+
+
+@dataclass(eq=False)
+class Subscription:
+    queue: asyncio.Queue
+    domain: Optional[str] = None
+    file_ids: FrozenSet[str] = field(default_factory=frozenset)
+
+    def matches(self, event: Dict[str, Any]) -> bool:
+        if self.file_ids and event.get("file_id") not in self.file_ids:
+            return False
+        if self.domain and event.get("domain") != self.domain:
+            return False
+        return True
+
+
+_subscriptions: Set[Subscription] = set()
+# file_id -> latest event, so new subscribers start from the current state.
+_latest: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_sequence = 0
+
+
+def embedding_status_for(processing_status: str) -> str:
+    if processing_status in TERMINAL_STATUSES or processing_status == "processing":
+        return processing_status
+    return "pending"
+
+
+def _queue_size() -> int:
+    return int(os.getenv("FILE_EVENTS_QUEUE_SIZE", "256"))
+
+
+def _max_tracked_files() -> int:
+    return int(os.getenv("FILE_EVENTS_MAX_TRACKED", "2048"))
+
+
+def publish(
+    file_id: str,
+    domain: str,
+    processing_status: str,
+    embedding_status: str,
+    **progress: Any,
+) -> Dict[str, Any]:
+    """
+    Push a status/progress update to every matching subscriber. Slow
+    subscribers lose their oldest queued events rather than blocking
+    ingestion.
+    """
+    global _sequence
+    _sequence += 1
+    event = {
+        "id": _sequence,
+        "file_id": file_id,
+        "domain": domain,
+        "processing_status": processing_status,
+        "embedding_status": embedding_status,
+        "ts": time.time(),
+        **progress,
+    }
+    _latest[file_id] = event
+    _latest.move_to_end(file_id)
+    while len(_latest) > _max_tracked_files():
+        _latest.popitem(last=False)
+    for sub in list(_subscriptions):
+        if not sub.matches(event):
+            continue
+        if sub.queue.full():
+            try:
+                sub.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+        sub.queue.put_nowait(event)
+    return event
+
+
+def subscribe(domain: Optional[str] = None, file_ids: Optional[List[str]] = None) -> Subscription:
+    sub = Subscription(
+        queue=asyncio.Queue(maxsize=_queue_size()),
+        domain=domain,
+        file_ids=frozenset(file_ids or ()),
+    )
+    _subscriptions.add(sub)
+    return sub
+
+
+def unsubscribe(sub: Subscription) -> None:
+    _subscriptions.discard(sub)
+
+
+def latest(file_id: str) -> Optional[Dict[str, Any]]:
+    event = _latest.get(file_id)
+    return dict(event) if event is not None else None
+
+
+def subscriber_count() -> int:
+    return len(_subscriptions)
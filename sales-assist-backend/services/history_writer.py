@@ -0,0 +1,281 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from logger import enhanced_logger
+from services.mongo_service import (
+    ChatWrite,
+    append_chat_messages as _append_now,
+    get_chat_history,
+    get_chat_history_page,
+    stamp_chat_messages,
+    write_chat_batch,
+)
+
+
+class _Queued:
+    __slots__ = ("write", "enqueued_at", "durable_gen")
+
+    def __init__(self, write: ChatWrite):
+        self.write = write
+        self.enqueued_at = time.time()
+        self.durable_gen: Optional[int] = None
+
+
+# Writes waiting for the next flush, oldest first, and the ones being flushed.
+_queue: List[_Queued] = []
+_inflight: List[_Queued] = []
+# Recently persisted writes, so a read that raced a flush can still see them.
+_recent: Deque[_Queued] = deque(maxlen=256)
+_generation = 0
+_wake: Optional[asyncio.Event] = None
+_task: Optional[asyncio.Task] = None
+_lags_ms: Deque[float] = deque(maxlen=1024)
+_stats = {"enqueued": 0, "flushed": 0, "flushes": 0, "errors": 0}
+
+
+def write_behind_enabled() -> bool:
+    flag = os.getenv("HISTORY_WRITE_BEHIND_ENABLED", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _interval_seconds() -> float:
+    return float(os.getenv("HISTORY_WRITE_BEHIND_INTERVAL_MS", "5")) / 1000.0
+
+
+def _max_batch() -> int:
+    return int(os.getenv("HISTORY_WRITE_BEHIND_MAX_BATCH", "256"))
+
+
+def _max_pending() -> int:
+    return int(os.getenv("HISTORY_WRITE_BEHIND_MAX_PENDING", "10000"))
+
+
+def _ensure_flusher() -> asyncio.Event:
+    global _wake, _task
+    if _wake is None:
+        _wake = asyncio.Event()
+    if _task is None or _task.done():
+        _task = asyncio.get_running_loop().create_task(_flush_loop())
+    return _wake
+
+
+async def append_chat_messages(session_id: str, domain: str, messages: List[Dict[str, Any]]) -> None:
+    """
+    Acknowledge chat messages as soon as they are queued; a background task
+    persists them within HISTORY_WRITE_BEHIND_INTERVAL_MS. Falls back to a
+    direct write when write-behind is disabled.
+    """
+    if not messages:
+        return
+    if not write_behind_enabled():
+        await _append_now(session_id, domain, messages)
+        return
+    if len(_queue) >= _max_pending():
+        # Backpressure: the store is not keeping up, so pay for a flush here.
+        await flush()
+    _queue.append(_Queued(ChatWrite(session_id, domain, stamp_chat_messages(messages))))
+    _stats["enqueued"] += len(messages)
+    _ensure_flusher().set()
+
+
+def _take_batch() -> List[_Queued]:
+    # Coalesce per (session, domain) in queue order so each pair is one write.
+    taken = _queue[:_max_batch()]
+    del _queue[:len(taken)]
+    merged: Dict[Tuple[str, str], _Queued] = {}
+    batch: List[_Queued] = []
+    for item in taken:
+        write = item.write
+        key = (write.session_id, write.domain)
+        if write.first_index is not None:
+            batch.append(item)
+            continue
+        target = merged.get(key)
+        if target is None:
+            merged[key] = item
+            batch.append(item)
+        else:
+            target.write.messages.extend(write.messages)
+    return batch
+
+
+async def _flush_once() -> int:
+    global _inflight, _generation
+    if _inflight or not _queue:
+        return 0
+    _inflight = _take_batch()
+    try:
+        await write_chat_batch([item.write for item in _inflight])
+    except Exception as exc:
+        _stats["errors"] += 1
+        enhanced_logger.warning(
+            "HISTORY_FLUSH_FAILED",
+            extra_data={"writes": len(_inflight), "error": str(exc)},
+        )
+        # Back at the front, keeping any reserved indexes, so order holds.
+        _queue[:0] = _inflight
+        _inflight = []
+        raise
+    now = time.time()
+    _generation += 1
+    flushed = 0
+    for item in _inflight:
+        item.durable_gen = _generation
+        _recent.append(item)
+        _lags_ms.append((now - item.enqueued_at) * 1000.0)
+        flushed += len(item.write.messages)
+    _inflight = []
+    _stats["flushed"] += flushed
+    _stats["flushes"] += 1
+    return flushed
+
+
+async def _flush_loop() -> None:
+    backoff = _interval_seconds()
+    while True:
+        await _wake.wait()
+        _wake.clear()
+        # Let writes from concurrent requests join this batch.
+        await asyncio.sleep(_interval_seconds())
+        try:
+            # A backpressure flush() may own the current batch; it drains the rest.
+            while _queue and not _inflight:
+                await _flush_once()
+            backoff = _interval_seconds()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backoff = min(max(backoff * 2, 0.05), 5.0)
+            await asyncio.sleep(backoff)
+            _wake.set()
+
+
+async def flush(timeout: Optional[float] = None) -> None:
+    """
+    Persist everything queued so far (used for backpressure and shutdown).
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    while _queue or _inflight:
+        if deadline is not None and time.time() > deadline:
+            raise TimeoutError("history write-behind flush timed out")
+        if _inflight:
+            # The background task owns the current batch; wait for it.
+            await asyncio.sleep(_interval_seconds())
+            continue
+        await _flush_once()
+
+
+async def shutdown(timeout: float = 10.0) -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
+    pending = sum(len(item.write.messages) for item in _queue + _inflight)
+    _queue[:0] = [item for item in _inflight if item not in _queue]
+    _inflight.clear()
+    try:
+        await flush(timeout)
+    except Exception as exc:
+        enhanced_logger.warning(
+            "HISTORY_SHUTDOWN_FLUSH_FAILED",
+            extra_data={"pending_messages": pending, "error": str(exc)},
+        )
+        return
+    enhanced_logger.info("HISTORY_SHUTDOWN_FLUSHED", extra_data={"messages": pending})
+
+
+def _unpersisted(session_id: str, domain: str, since_gen: int, seen: set) -> List[Dict[str, Any]]:
+    # Messages a committed read may have missed: persisted after it began,
+    # in flight, or still queued, in write order.
+    items = [item for item in _recent if item.durable_gen is not None and item.durable_gen > since_gen]
+    items += list(_inflight) + list(_queue)
+    result: List[Dict[str, Any]] = []
+    for item in items:
+        write = item.write
+        if write.session_id != session_id or write.domain != domain:
+            continue
+        for msg in write.messages:
+            if msg.get("index") is None or msg["index"] not in seen:
+                result.append(dict(msg))
+    return result
+
+
+async def read_chat_history(
+    session_id: str,
+    domain: str,
+    max_tokens: Optional[int] = None,
+    since_index: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    get_chat_history plus this worker's messages that are not durable yet.
+    """
+    since_gen = _generation
+    pending_tokens = sum(
+        int(msg.get("tokens") or 0)
+        for item in _inflight + _queue
+        if item.write.session_id == session_id and item.write.domain == domain
+        for msg in item.write.messages
+    )
+    budget = max_tokens
+    if budget is not None and budget > 0 and pending_tokens:
+        budget = max(budget - pending_tokens, 1)
+    committed = await get_chat_history(session_id, domain, max_tokens=budget, since_index=since_index)
+    seen = {msg.get("index") for msg in committed}
+    return committed + _unpersisted(session_id, domain, since_gen, seen)
+
+
+async def read_chat_history_page(
+    session_id: str,
+    domain: str,
+    before: Optional[int] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    get_chat_history_page; the newest page also carries queued messages.
+    """
+    since_gen = _generation
+    page, next_cursor = await get_chat_history_page(session_id, domain, before=before, limit=limit)
+    if before is not None:
+        return page, next_cursor
+    seen = {msg.get("index") for msg in page}
+    page = page + _unpersisted(session_id, domain, since_gen, seen)
+    if len(page) > limit:
+        page = page[-limit:]
+        first_index = page[0].get("index")
+        if first_index is not None:
+            next_cursor = first_index if first_index > 0 else None
+    return page, next_cursor
+
+
+def get_stats() -> Dict[str, Any]:
+    """
+    Durability lag: how long acknowledged messages waited before they were
+    persisted, over the last 1024 writes, plus what is waiting right now.
+    """
+    pending = _queue + _inflight
+    lags = np.asarray(_lags_ms) if _lags_ms else None
+    oldest = min((item.enqueued_at for item in pending), default=None)
+    return {
+        "enabled": write_behind_enabled(),
+        "pending_writes": len(pending),
+        "pending_messages": sum(len(item.write.messages) for item in pending),
+        "oldest_pending_ms": round((time.time() - oldest) * 1000.0, 2) if oldest else 0.0,
+        "lag_p50_ms": round(float(np.percentile(lags, 50)), 2) if lags is not None else 0.0,
+        "lag_p95_ms": round(float(np.percentile(lags, 95)), 2) if lags is not None else 0.0,
+        "lag_max_ms": round(float(lags.max()), 2) if lags is not None else 0.0,
+        "enqueued_messages": _stats["enqueued"],
+        "flushed_messages": _stats["flushed"],
+        "flushes": _stats["flushes"],
+        "flush_errors": _stats["errors"],
+    }
@@ -1,12 +1,21 @@
 from __future__ import annotations
 
+import asyncio
+import os
 import time
+from functools import partial
 from typing import List
 
 from logger import enhanced_logger
 from rag.ingest_pipeline import extract_text_from_file, chunk_text_for_ingestion
+from rag.retrieval_cache import bump_domain_version
+from rag.tokenizer import count_tokens
 from config.domains import is_ingest_domain
+from services import file_events
+from services.centroid_service import delete_file_centroids, upsert_file_centroids
 from services.embedding_service import embed_texts_async
+from services.kb_stats_service import record_file_contribution, release_file_contribution
+from services.keyword_index_service import index_chunks, remove_file_from_keyword_index
 from services.milvus_service import (
     delete_embeddings_by_file_id,
     insert_embeddings,
@@ -25,6 +34,31 @@ def _build_chunk_id(file_id: str, chunk_index: int) -> str:
     return f"{file_id}:{chunk_index}"
 
 
+def _progress_batch_size() -> int:
+    return max(1, int(os.getenv("INGEST_PROGRESS_BATCH_SIZE", "256")))
+
+
+async def _embed_with_progress(file_id: str, domain: str, chunks: List[str]) -> List[List[float]]:
+    """
+    Embed in slices so subscribers see chunks_embedded advance.
+    """
+    total = len(chunks)
+    step = _progress_batch_size()
+    embeddings: List[List[float]] = []
+    for start in range(0, total, step):
+        embeddings.extend(await embed_texts_async(chunks[start : start + step]))
+        file_events.publish(
+            file_id,
+            domain,
+            "processing",
+            "processing",
+            stage="embedding",
+            chunks_embedded=len(embeddings),
+            chunks_total=total,
+        )
+    return embeddings
+
+
 async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
     if not is_ingest_domain(domain):
         raise ValueError(f"Invalid domain: {domain}")
@@ -41,12 +75,22 @@ async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
             return
 
     await update_file_status(file_id, "processing")
+    file_events.publish(file_id, domain, "processing", "pending", stage="extracting")
 
     try:
         start_time = time.time()
         # Clean up any partial data before re-ingesting
+        await release_file_contribution(file_id)
         await delete_chunks_for_file(file_id)
-        delete_embeddings_by_file_id(file_id)
+        await remove_file_from_keyword_index(file_id)
+        await delete_file_centroids(file_id)
+        # Milvus writes pause while another worker swaps an index rebuild in;
+        # keep that wait off the event loop.
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, delete_embeddings_by_file_id, file_id)
+        # Cached retrievals may point at the chunks just removed; drop them
+        # now rather than serving dead chunk_ids for the whole ingest.
+        await bump_domain_version(domain)
 
         # Extract text
         text = extract_text_from_file(file_path)
@@ -58,9 +102,19 @@ async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
         if not chunks:
             raise ValueError("No chunks created from document")
 
+        file_events.publish(
+            file_id,
+            domain,
+            "processing",
+            "processing",
+            stage="embedding",
+            chunks_embedded=0,
+            chunks_total=len(chunks),
+        )
+
         # Embed chunks
         embed_start = time.time()
-        embeddings = await embed_texts_async(chunks)
+        embeddings = await _embed_with_progress(file_id, domain, chunks)
         embedding_time_ms = (time.time() - embed_start) * 1000.0
 
         # Insert into Milvus
@@ -74,9 +128,20 @@ async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
                 {"file_id": file_id, "domain": domain, "chunk_index": idx}
             )
 
-        insert_embeddings(ids, embeddings, metadata, batch_size=128)
-        insert_embeddings_general(ids, embeddings, metadata, batch_size=128)
+        await loop.run_in_executor(None, partial(insert_embeddings, ids, embeddings, metadata, batch_size=128))
+        await loop.run_in_executor(
+            None, partial(insert_embeddings_general, ids, embeddings, metadata, batch_size=128)
+        )
         milvus_insert_time_ms = (time.time() - milvus_start) * 1000.0
+        file_events.publish(
+            file_id,
+            domain,
+            "processing",
+            "completed",
+            stage="indexing",
+            chunks_embedded=len(chunks),
+            chunks_total=len(chunks),
+        )
 
         # Insert chunk metadata into Mongo
         chunk_docs = []
@@ -94,6 +159,16 @@ async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
             )
 
         await insert_chunks(chunk_docs)
+        await index_chunks(chunk_docs)
+        await upsert_file_centroids(file_id, domain, embeddings)
+        await record_file_contribution(
+            file_id,
+            domain,
+            chunks=len(chunks),
+            tokens=sum(count_tokens(chunk) for chunk in chunks),
+            # One vector per chunk in each of the default and general collections.
+            vectors=2 * len(ids),
+        )
 
         await update_file_status(
             file_id,
@@ -103,6 +178,15 @@ async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
                 "processing_time_ms": int((time.time() - start_time) * 1000.0),
             },
         )
+        file_events.publish(
+            file_id,
+            domain,
+            "completed",
+            "completed",
+            stage="completed",
+            chunks_embedded=len(chunks),
+            chunks_total=len(chunks),
+        )
 
         enhanced_logger.info(
             "INGESTION_COMPLETED",
@@ -126,4 +210,8 @@ async def ingest_file(file_path: str, domain: str, file_id: str) -> None:
             "failed",
             extra_fields={"error": str(exc)},
         )
+        file_events.publish(file_id, domain, "failed", "failed", stage="failed", error=str(exc))
         raise
+    finally:
+        # Chunks for this file were replaced or removed either way.
+        await bump_domain_version(domain)
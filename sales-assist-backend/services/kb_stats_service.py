@@ -0,0 +1,222 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config.domains import BASE_DOMAINS
+from logger import enhanced_logger
+from utils.database import get_database
+
+# One kb_stats document per domain:
+#   {domain, files: {<processing_status>: n}, chunks, tokens, vectors, updated_at, reconciled_at}
+# Every write goes through $inc, so reads never count anything.
+_COUNTERS = ("chunks", "tokens", "vectors")
+_task: Optional[asyncio.Task] = None
+
+
+def reconcile_enabled() -> bool:
+    flag = os.getenv("KB_STATS_RECONCILE_ENABLED", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _reconcile_seconds() -> float:
+    return float(os.getenv("KB_STATS_RECONCILE_SECONDS", "3600"))
+
+
+async def _inc(domain: str, inc: Dict[str, int]) -> None:
+    inc = {key: value for key, value in inc.items() if value}
+    if not inc or not domain:
+        return
+    db = get_database()
+    update = {"$inc": inc, "$set": {"updated_at": datetime.utcnow()}}
+    try:
+        await db["kb_stats"].update_one({"domain": domain}, update, upsert=True)
+    except DuplicateKeyError:
+        # Lost a race to create the domain's document; it exists now.
+        await db["kb_stats"].update_one({"domain": domain}, update)
+
+
+async def record_file_added(domain: str, status: str) -> None:
+    await _inc(domain, {f"files.{status}": 1})
+
+
+async def record_status_change(domain: str, old_status: Optional[str], new_status: str) -> None:
+    if old_status == new_status:
+        return
+    inc = {f"files.{new_status}": 1}
+    if old_status:
+        inc[f"files.{old_status}"] = -1
+    await _inc(domain, inc)
+
+
+async def record_file_contribution(file_id: str, domain: str, chunks: int, tokens: int, vectors: int) -> None:
+    """
+    Count an ingested file's chunks/tokens/vectors once. The amounts are
+    kept on the file (kb_counted) so a re-ingest can take them back out.
+    """
+    db = get_database()
+    counted = {"chunks": chunks, "tokens": tokens, "vectors": vectors}
+    result = await db["files"].update_one(
+        {"_id": ObjectId(file_id), "kb_counted": {"$exists": False}},
+        {"$set": {"kb_counted": counted}},
+    )
+    if result.modified_count:
+        await _inc(domain, counted)
+
+
+async def release_file_contribution(file_id: str) -> None:
+    """
+    Subtract what record_file_contribution added, before the file's chunks
+    and vectors are deleted. Claiming kb_counted makes this run at most once.
+    """
+    db = get_database()
+    doc = await db["files"].find_one_and_update(
+        {"_id": ObjectId(file_id), "kb_counted": {"$exists": True}},
+        {"$unset": {"kb_counted": ""}},
+        projection={"domain": 1, "kb_counted": 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if doc:
+        counted = doc.get("kb_counted") or {}
+        await _inc(doc.get("domain", ""), {key: -int(counted.get(key) or 0) for key in _COUNTERS})
+
+
+def _normalize(doc: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    doc = doc or {}
+    files = {status: int(n) for status, n in (doc.get("files") or {}).items() if n}
+    row: Dict[str, Any] = {"files": files, "total_files": sum(files.values())}
+    for key in _COUNTERS:
+        row[key] = int(doc.get(key) or 0)
+    return row
+
+
+async def get_kb_stats(domain: Optional[str] = None) -> Dict[str, Any]:
+    db = get_database()
+    query = {"domain": domain} if domain else {}
+    domains: Dict[str, Dict[str, Any]] = {}
+    reconciled_at = None
+    async for doc in db["kb_stats"].find(query, {"_id": 0}):
+        domains[doc["domain"]] = _normalize(doc)
+        if doc.get("reconciled_at") and (reconciled_at is None or doc["reconciled_at"] < reconciled_at):
+            reconciled_at = doc["reconciled_at"]
+    totals: Dict[str, Any] = {"files": {}, "total_files": 0, **{key: 0 for key in _COUNTERS}}
+    for row in domains.values():
+        for status, n in row["files"].items():
+            totals["files"][status] = totals["files"].get(status, 0) + n
+        totals["total_files"] += row["total_files"]
+        for key in _COUNTERS:
+            totals[key] += row[key]
+    return {"domains": domains, "totals": totals, "reconciled_at": reconciled_at}
+
+
+async def _actual_counts(db, domain: str) -> Dict[str, Any]:
+    files: Dict[str, int] = {}
+    async for row in db["files"].aggregate(
+        [{"$match": {"domain": domain}}, {"$group": {"_id": "$processing_status", "n": {"$sum": 1}}}]
+    ):
+        files[str(row["_id"] or "uploaded")] = int(row["n"])
+    counted: Dict[str, int] = {key: 0 for key in _COUNTERS}
+    async for row in db["files"].aggregate(
+        [
+            {"$match": {"domain": domain, "kb_counted": {"$exists": True}}},
+            {
+                "$group": {
+                    "_id": None,
+                    **{key: {"$sum": f"$kb_counted.{key}"} for key in _COUNTERS},
+                }
+            },
+        ]
+    ):
+        counted = {key: int(row.get(key) or 0) for key in _COUNTERS}
+    # Every counter comes from the per-file amounts recorded at ingest, the
+    # same source the $inc path uses. Counting chunk docs instead would see a
+    # file's chunks between insert_chunks and record_file_contribution and
+    # double-count them once that $inc lands.
+    return {"files": files, **counted}
+
+
+async def reconcile_kb_stats() -> Dict[str, Dict[str, Any]]:
+    """
+    Recount every domain from files and repair counters that drifted
+    (e.g. a crash between a status write and its $inc). Returns the repaired
+    domains with the before/after values.
+    """
+    db = get_database()
+    start = time.time()
+    repaired: Dict[str, Dict[str, Any]] = {}
+    domains = set(BASE_DOMAINS)
+    async for doc in db["kb_stats"].find({}, {"domain": 1}):
+        domains.add(doc["domain"])
+    for domain in sorted(domains):
+        current = await db["kb_stats"].find_one({"domain": domain}) or {}
+        actual = await _actual_counts(db, domain)
+        now = datetime.utcnow()
+        before = _normalize(current)
+        after = _normalize(actual)
+        if before == after:
+            if current:
+                await db["kb_stats"].update_one({"_id": current["_id"]}, {"$set": {"reconciled_at": now}})
+            continue
+        # Compare-and-set on updated_at: if an $inc landed while we counted,
+        # leave this domain for the next pass rather than overwrite it.
+        try:
+            result = await db["kb_stats"].update_one(
+                {"domain": domain, "updated_at": current.get("updated_at")},
+                {
+                    "$set": {
+                        "files": after["files"],
+                        **{key: after[key] for key in _COUNTERS},
+                        "updated_at": now,
+                        "reconciled_at": now,
+                    }
+                },
+                upsert=not current,
+            )
+        except DuplicateKeyError:
+            continue
+        if result.matched_count or result.upserted_id is not None:
+            repaired[domain] = {"before": before, "after": after}
+    enhanced_logger.info(
+        "KB_STATS_RECONCILED",
+        extra_data={
+            "domains": len(domains),
+            "repaired": repaired,
+            "latency_ms": round((time.time() - start) * 1000.0, 2),
+        },
+    )
+    return repaired
+
+
+async def _reconcile_loop() -> None:
+    while True:
+        try:
+            await reconcile_kb_stats()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            enhanced_logger.warning("KB_STATS_RECONCILE_FAILED", extra_data={"error": str(exc)})
+        await asyncio.sleep(_reconcile_seconds())
+
+
+def start_reconciler() -> None:
+    global _task
+    if reconcile_enabled() and (_task is None or _task.done()):
+        _task = asyncio.get_running_loop().create_task(_reconcile_loop())
+
+
+async def stop_reconciler() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        try:
+            await _task
+        except (asyncio.CancelledError, Exception):
+            pass
+        _task = None
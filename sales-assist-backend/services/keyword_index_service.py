@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import UpdateOne
+
+from logger import enhanced_logger
+from services.mongo_service import get_db
+
+
+# Keeps SKUs / contract numbers ("ab-1234", "po#88/12") as one token and
+# also indexes their parts.
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-_./#][a-z0-9]+)*")
+_SPLIT_RE = re.compile(r"[-_./#]")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "have",
+    "how", "in", "is", "it", "its", "of", "on", "or", "that", "the", "this", "to",
+    "was", "we", "what", "when", "which", "who", "will", "with", "you", "your",
+}
+
+
+def _k1() -> float:
+    return float(os.getenv("BM25_K1", "1.2"))
+
+
+def _b() -> float:
+    return float(os.getenv("BM25_B", "0.75"))
+
+
+def tokenize(text: str) -> List[str]:
+    tokens: List[str] = []
+    for match in _TOKEN_RE.findall((text or "").lower()):
+        parts = [p for p in _SPLIT_RE.split(match) if p]
+        candidates = [match] + (parts if len(parts) > 1 else [])
+        for token in candidates:
+            if token in _STOPWORDS:
+                continue
+            if len(token) == 1 and not token.isdigit():
+                continue
+            tokens.append(token)
+    return tokens
+
+
+async def index_chunks(chunk_docs: List[Dict[str, Any]]) -> None:
+    """
+    Add postings for freshly ingested chunks. Term document frequencies and
+    per-domain length stats are maintained with $inc so reads stay cheap.
+    """
+    if not chunk_docs:
+        return
+    db = get_db()
+    postings: List[Dict[str, Any]] = []
+    df: Counter = Counter()
+    stats: Dict[str, Dict[str, int]] = {}
+    for doc in chunk_docs:
+        tokens = tokenize(doc.get("text", ""))
+        if not tokens:
+            continue
+        counts = Counter(tokens)
+        domain = doc["domain"]
+        for term, tf in counts.items():
+            postings.append(
+                {
+                    "term": term,
+                    "chunk_id": doc["chunk_id"],
+                    "file_id": doc["file_id"],
+                    "domain": domain,
+                    "chunk_index": doc["chunk_index"],
+                    "tf": tf,
+                    "doc_len": len(tokens),
+                }
+            )
+            df[(domain, term)] += 1
+        domain_stats = stats.setdefault(domain, {"doc_count": 0, "total_len": 0})
+        domain_stats["doc_count"] += 1
+        domain_stats["total_len"] += len(tokens)
+
+    if not postings:
+        return
+    await db["keyword_postings"].insert_many(postings, ordered=False)
+    await db["keyword_terms"].bulk_write(
+        [
+            UpdateOne({"domain": domain, "term": term}, {"$inc": {"df": count}}, upsert=True)
+            for (domain, term), count in df.items()
+        ],
+        ordered=False,
+    )
+    await db["keyword_stats"].bulk_write(
+        [
+            UpdateOne({"domain": domain}, {"$inc": values}, upsert=True)
+            for domain, values in stats.items()
+        ],
+        ordered=False,
+    )
+    enhanced_logger.debug(
+        "KEYWORD_INDEX_UPDATED",
+        extra_data={"chunks": len(chunk_docs), "postings": len(postings)},
+    )
+
+
+async def remove_file_from_keyword_index(file_id: str) -> int:
+    db = get_db()
+    per_term = db["keyword_postings"].aggregate(
+        [
+            {"$match": {"file_id": file_id}},
+            {"$group": {"_id": {"domain": "$domain", "term": "$term"}, "count": {"$sum": 1}}},
+        ]
+    )
+    term_updates: List[UpdateOne] = []
+    touched: Dict[str, List[str]] = {}
+    async for row in per_term:
+        touched.setdefault(row["_id"]["domain"], []).append(row["_id"]["term"])
+        term_updates.append(
+            UpdateOne(
+                {"domain": row["_id"]["domain"], "term": row["_id"]["term"]},
+                {"$inc": {"df": -row["count"]}},
+            )
+        )
+    if not term_updates:
+        return 0
+
+    per_chunk = db["keyword_postings"].aggregate(
+        [
+            {"$match": {"file_id": file_id}},
+            {"$group": {"_id": "$chunk_id", "domain": {"$first": "$domain"}, "doc_len": {"$first": "$doc_len"}}},
+            {"$group": {"_id": "$domain", "doc_count": {"$sum": 1}, "total_len": {"$sum": "$doc_len"}}},
+        ]
+    )
+    stat_updates: List[UpdateOne] = []
+    async for row in per_chunk:
+        stat_updates.append(
+            UpdateOne(
+                {"domain": row["_id"]},
+                {"$inc": {"doc_count": -row["doc_count"], "total_len": -row["total_len"]}},
+            )
+        )
+
+    await db["keyword_terms"].bulk_write(term_updates, ordered=False)
+    if stat_updates:
+        await db["keyword_stats"].bulk_write(stat_updates, ordered=False)
+    # Only terms this file contributed to can have dropped to zero.
+    for domain, terms in touched.items():
+        await db["keyword_terms"].delete_many({"domain": domain, "term": {"$in": terms}, "df": {"$lte": 0}})
+    result = await db["keyword_postings"].delete_many({"file_id": file_id})
+    return int(result.deleted_count)
+
+
+async def keyword_search(
+    query: str,
+    top_k: int,
+    domains: Iterable[str],
+    file_ids: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    BM25 over the chunk postings. Returns records ordered by score with the
+    same metadata keys as the dense path.
+    """
+    terms = sorted(set(tokenize(query)))
+    domains = sorted(set(domains))
+    if not terms or not domains:
+        return []
+    db = get_db()
+
+    stats_cursor = db["keyword_stats"].find({"domain": {"$in": domains}})
+    doc_count = 0
+    total_len = 0
+    async for row in stats_cursor:
+        doc_count += int(row.get("doc_count", 0))
+        total_len += int(row.get("total_len", 0))
+    if doc_count <= 0:
+        return []
+    avg_len = total_len / float(doc_count)
+
+    df: Counter = Counter()
+    async for row in db["keyword_terms"].find({"domain": {"$in": domains}, "term": {"$in": terms}}):
+        df[row["term"]] += int(row.get("df", 0))
+    idf = {
+        term: math.log(1.0 + (doc_count - n + 0.5) / (n + 0.5))
+        for term, n in df.items()
+        if n > 0
+    }
+    if not idf:
+        return []
+    # Terms in most chunks add little to the ranking but most of the postings;
+    # drop them unless nothing rarer was asked for.
+    max_df_ratio = float(os.getenv("KEYWORD_MAX_DF_RATIO", "0.5"))
+    selective = {term: weight for term, weight in idf.items() if df[term] <= max_df_ratio * doc_count}
+    if selective:
+        idf = selective
+    else:
+        rarest = max(idf, key=idf.get)
+        idf = {rarest: idf[rarest]}
+
+    per_term = int(os.getenv("KEYWORD_MAX_POSTINGS_PER_TERM", "5000"))
+    projection = {"_id": 0, "term": 1, "chunk_id": 1, "file_id": 1, "domain": 1, "chunk_index": 1, "tf": 1, "doc_len": 1}
+
+    async def _postings(term: str) -> List[Dict[str, Any]]:
+        match: Dict[str, Any] = {"term": term, "domain": {"$in": domains}}
+        if file_ids:
+            match["file_id"] = {"$in": list(file_ids)}
+        # Capped per term by highest tf, so what gets scored does not depend
+        # on storage order.
+        cursor = db["keyword_postings"].find(match, projection).sort("tf", -1).limit(per_term)
+        return [post async for post in cursor]
+
+    k1, b = _k1(), _b()
+    scores: Dict[str, float] = {}
+    meta: Dict[str, Dict[str, Any]] = {}
+    postings = await asyncio.gather(*(_postings(term) for term in sorted(idf)))
+    for post in (post for term_postings in postings for post in term_postings):
+        tf = float(post["tf"])
+        norm = k1 * (1.0 - b + b * float(post["doc_len"]) / avg_len)
+        chunk_id = post["chunk_id"]
+        scores[chunk_id] = scores.get(chunk_id, 0.0) + idf[post["term"]] * tf * (k1 + 1.0) / (tf + norm)
+        meta.setdefault(chunk_id, post)
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+    return [
+        {
+            "chunk_id": chunk_id,
+            "file_id": meta[chunk_id]["file_id"],
+            "domain": meta[chunk_id]["domain"],
+            "chunk_index": meta[chunk_id]["chunk_index"],
+            "keyword_score": score,
+        }
+        for chunk_id, score in ranked
+    ]
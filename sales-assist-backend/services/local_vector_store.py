@@ -0,0 +1,572 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single worker
+    fcntl = None
+
+from logger import enhanced_logger
+from services.quantization import (
+    binarize,
+    binary_scores,
+    get_quantization_mode,
+    get_rescore_multiplier,
+    int8_scores,
+    quantize_int8,
+    rescore,
+)
+
+
+def _load_hnswlib():
+    """
+    hnswlib is optional; without it the store falls back to exact NumPy search.
+    """
+    try:
+        import hnswlib
+    except Exception:
+        return None
+    return hnswlib
+
+
+class LocalHit:
+    """
+    Mirrors the bits of a pymilvus Hit that rag/retrieve reads.
+    """
+
+    __slots__ = ("id", "score", "distance", "entity")
+
+    def __init__(self, chunk_id: str, score: float, entity: Dict[str, Any]):
+        self.id = chunk_id
+        self.score = score
+        self.distance = score
+        self.entity = entity
+
+
+def _save_atomic(path: str, array: np.ndarray) -> None:
+    # Other processes may load the same cache file concurrently.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+class _Segment:
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(path)
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.ids: List[str] = meta["ids"]
+        self.file_ids = np.asarray(meta["file_ids"], dtype=object)
+        self.domains = np.asarray(meta["domains"], dtype=object)
+        self.chunk_indices = np.asarray(meta["chunk_indices"], dtype=np.int64)
+        self.live = np.ones(len(self.ids), dtype=bool)
+        self._codes: Dict[str, Any] = {}
+        self._rows_by_file: Optional[Dict[str, np.ndarray]] = None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def rows_for_files(self, file_ids: Sequence[str]) -> np.ndarray:
+        """
+        Row numbers belonging to the given files, without scanning the segment.
+        """
+        if self._rows_by_file is None:
+            grouped: Dict[str, List[int]] = {}
+            for row, file_id in enumerate(self.file_ids):
+                grouped.setdefault(str(file_id), []).append(row)
+            self._rows_by_file = {fid: np.asarray(rows, dtype=np.int64) for fid, rows in grouped.items()}
+        parts = [self._rows_by_file[fid] for fid in file_ids if fid in self._rows_by_file]
+        if not parts:
+            return np.zeros(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def codes(self, mode: str):
+        """
+        Quantized codes held in RAM; the float32 rows stay memory-mapped and
+        are only touched for rescoring. Cached next to the segment on first use.
+        """
+        if mode in self._codes:
+            return self._codes[mode]
+        if mode == "sq8":
+            codes_path = os.path.join(self.path, "codes_sq8.npy")
+            scales_path = os.path.join(self.path, "scales_sq8.npy")
+            if os.path.exists(codes_path) and os.path.exists(scales_path):
+                value = (np.load(codes_path), np.load(scales_path))
+            else:
+                value = quantize_int8(self.vectors)
+                _save_atomic(codes_path, value[0])
+                _save_atomic(scales_path, value[1])
+        else:
+            codes_path = os.path.join(self.path, "codes_binary.npy")
+            if os.path.exists(codes_path):
+                value = np.load(codes_path)
+            else:
+                value = binarize(self.vectors)
+                _save_atomic(codes_path, value)
+        self._codes[mode] = value
+        return value
+
+
+class LocalVectorCollection:
+    """
+    Append-only, memory-mapped segments plus per-row tombstones.
+    Optional HNSW graph (hnswlib) over all live rows; exact search otherwise.
+
+    Safe to share between worker processes: manifest.json names the live
+    segments and their tombstones and is only ever replaced atomically, under
+    an exclusive flock on the store directory. Every call first picks up
+    manifest changes made by other processes.
+    """
+
+    def __init__(self, root: str, dim: int):
+        self.root = root
+        self.dim = dim
+        self._lock = threading.RLock()
+        self._segments: List[_Segment] = []
+        self._row_of: Dict[str, tuple[int, int]] = {}
+        self._hnsw: Optional[Dict[str, Any]] = None
+        self._hnsw_labels: Dict[str, List[tuple[int, int]]] = {}
+        self._label_of: Dict[tuple[int, int], tuple[str, int]] = {}
+        self._hnsw_live: Dict[str, int] = {}
+        self._generation = 0
+        self._manifest_stat: Optional[tuple[int, int]] = None
+        os.makedirs(root, exist_ok=True)
+        self._lock_file = open(os.path.join(root, ".lock"), "a+")
+        self._lock_depth = 0
+        with self._locked(exclusive=True):
+            if self._stat_manifest() is None:
+                # Adopt a store written before the manifest existed.
+                self._persist_manifest()
+
+    # ---- persistence -------------------------------------------------
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        """
+        Thread lock plus a shared (reads) or exclusive (writes) flock, then
+        catch up with the manifest. Re-entrant within a thread.
+        """
+        with self._lock:
+            if self._lock_depth == 0 and fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    self._refresh()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if self._lock_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _segment_dirs(self) -> List[str]:
+        names = sorted(
+            n for n in os.listdir(self.root) if n.startswith("seg_") and not n.endswith(".tmp")
+        )
+        return [os.path.join(self.root, n) for n in names]
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.root, "manifest.json")
+
+    def _tombstone_path(self) -> str:
+        # Stores written before the manifest kept tombstones here.
+        return os.path.join(self.root, "deleted.json")
+
+    def _stat_manifest(self) -> Optional[tuple[int, int]]:
+        try:
+            st = os.stat(self._manifest_path())
+        except FileNotFoundError:
+            return None
+        # os.replace gives every new manifest a new inode.
+        return st.st_ino, st.st_mtime_ns
+
+    def _read_manifest(self) -> Dict[str, Any]:
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(), "r", encoding="utf-8") as f:
+                return json.load(f)
+        deleted: Dict[str, List[int]] = {}
+        if os.path.exists(self._tombstone_path()):
+            with open(self._tombstone_path(), "r", encoding="utf-8") as f:
+                deleted = json.load(f) or {}
+        names = [os.path.basename(path) for path in self._segment_dirs()]
+        return {"generation": 0, "segments": names, "deleted": deleted}
+
+    def _refresh(self) -> None:
+        stat = self._stat_manifest()
+        if stat is not None and stat == self._manifest_stat:
+            return
+        manifest = self._read_manifest()
+        names = [seg.name for seg in self._segments]
+        if self._manifest_stat is not None and manifest["segments"][: len(names)] == names:
+            self._apply_manifest(manifest)
+        else:
+            self._load(manifest)
+        self._generation = int(manifest.get("generation", 0))
+        self._manifest_stat = stat
+
+    def _load(self, manifest: Dict[str, Any]) -> None:
+        self._segments = [_Segment(os.path.join(self.root, name)) for name in manifest["segments"]]
+        deleted = manifest.get("deleted") or {}
+        for seg in self._segments:
+            rows = deleted.get(seg.name) or []
+            if rows:
+                seg.live[rows] = False
+        self._row_of = {}
+        for seg_no, seg in enumerate(self._segments):
+            for row in np.flatnonzero(seg.live):
+                self._row_of[seg.ids[row]] = (seg_no, int(row))
+        self._build_hnsw()
+
+    def _apply_manifest(self, manifest: Dict[str, Any]) -> None:
+        # Another process appended segments and/or deleted rows: apply just
+        # that, keeping the loaded segments and HNSW graphs.
+        deleted = manifest.get("deleted") or {}
+        for seg_no, seg in enumerate(self._segments):
+            for row in deleted.get(seg.name) or []:
+                if seg.live[row]:
+                    self._kill(seg_no, int(row))
+        for name in manifest["segments"][len(self._segments):]:
+            seg = _Segment(os.path.join(self.root, name))
+            rows = deleted.get(name) or []
+            if rows:
+                seg.live[rows] = False
+            self._add_segment(seg)
+
+    def _persist_manifest(self) -> None:
+        self._generation += 1
+        manifest = {
+            "generation": self._generation,
+            "segments": [seg.name for seg in self._segments],
+            "deleted": {
+                seg.name: np.flatnonzero(~seg.live).tolist()
+                for seg in self._segments
+                if not seg.live.all()
+            },
+        }
+        tmp_path = f"{self._manifest_path()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, self._manifest_path())
+        self._manifest_stat = self._stat_manifest()
+        if os.path.exists(self._tombstone_path()):
+            os.remove(self._tombstone_path())
+
+    def _write_segment(self, vectors: np.ndarray, meta: Dict[str, Any]) -> _Segment:
+        # Numbered past every directory on disk, including segments a crashed
+        # writer left out of the manifest.
+        existing = self._segment_dirs()
+        next_no = int(os.path.basename(existing[-1])[4:]) + 1 if existing else 0
+        path = os.path.join(self.root, f"seg_{next_no:06d}")
+        tmp_path = f"{path}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        np.save(os.path.join(tmp_path, "vectors.npy"), vectors)
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+        return _Segment(path)
+
+    # ---- hnsw ----------------------------------------------------------
+
+    def _hnsw_enabled(self) -> bool:
+        mode = os.getenv("LOCAL_VECTOR_STORE_INDEX", "auto").lower()
+        if mode == "flat":
+            return False
+        if get_quantization_mode() != "none":
+            # hnswlib keeps its own float32 copy in RAM, which defeats quantization.
+            return False
+        if _load_hnswlib() is None:
+            if mode == "hnsw":
+                enhanced_logger.warning("LOCAL_VECTOR_STORE_HNSWLIB_MISSING")
+            return False
+        if mode == "hnsw":
+            return True
+        return len(self._row_of) >= int(os.getenv("LOCAL_VECTOR_STORE_HNSW_MIN", "20000"))
+
+    def _build_hnsw(self) -> None:
+        # One graph per domain: the domain filter is on every app query, so
+        # searching a per-domain graph avoids filtered HNSW traversal.
+        self._hnsw = None
+        self._hnsw_labels = {}
+        self._label_of = {}
+        self._hnsw_live = {}
+        if not self._hnsw_enabled():
+            return
+        self._hnsw = {}
+        for seg_no, seg in enumerate(self._segments):
+            self._hnsw_add(seg_no, seg)
+
+    def _hnsw_index(self, domain: str):
+        index = self._hnsw.get(domain)
+        if index is None:
+            hnswlib = _load_hnswlib()
+            index = hnswlib.Index(space="ip", dim=self.dim)
+            index.init_index(
+                max_elements=max(len(self._row_of), 1024),
+                M=int(os.getenv("LOCAL_VECTOR_STORE_HNSW_M", "16")),
+                ef_construction=int(os.getenv("LOCAL_VECTOR_STORE_HNSW_EF_CONSTRUCTION", "200")),
+            )
+            self._hnsw[domain] = index
+            self._hnsw_labels[domain] = []
+        return index
+
+    def _hnsw_add(self, seg_no: int, seg: _Segment) -> None:
+        if self._hnsw is None:
+            return
+        for domain in set(seg.domains[seg.live].tolist()):
+            rows = np.flatnonzero(seg.live & (seg.domains == domain))
+            index = self._hnsw_index(domain)
+            labels_list = self._hnsw_labels[domain]
+            needed = len(labels_list) + len(rows)
+            if needed > index.get_max_elements():
+                index.resize_index(needed * 2)
+            labels = np.arange(len(labels_list), needed)
+            index.add_items(np.asarray(seg.vectors[rows], dtype=np.float32), labels)
+            for label, row in zip(labels, rows):
+                location = (seg_no, int(row))
+                labels_list.append(location)
+                self._label_of[location] = (domain, int(label))
+            self._hnsw_live[domain] = self._hnsw_live.get(domain, 0) + len(rows)
+
+    # ---- public api ------------------------------------------------------
+
+    def insert(
+        self,
+        ids: Sequence[str],
+        embeddings: Sequence[Sequence[float]],
+        metadata: Sequence[Dict[str, object]],
+    ) -> None:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2 or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape}")
+        meta = {
+            "ids": [str(i) for i in ids],
+            "file_ids": [str(m["file_id"]) for m in metadata],
+            "domains": [str(m["domain"]) for m in metadata],
+            "chunk_indices": [int(m["chunk_index"]) for m in metadata],
+        }
+        with self._locked(exclusive=True):
+            # Re-inserting an id supersedes the old row, like a Milvus upsert.
+            self._tombstone(meta["ids"])
+            self._add_segment(self._write_segment(vectors, meta))
+            self._persist_manifest()
+
+    def _add_segment(self, seg: _Segment) -> None:
+        self._segments.append(seg)
+        seg_no = len(self._segments) - 1
+        for row in np.flatnonzero(seg.live):
+            self._row_of[seg.ids[row]] = (seg_no, int(row))
+        if self._hnsw is None and self._hnsw_enabled():
+            self._build_hnsw()
+        else:
+            self._hnsw_add(seg_no, seg)
+
+    def _kill(self, seg_no: int, row: int) -> None:
+        seg = self._segments[seg_no]
+        seg.live[row] = False
+        if self._row_of.get(seg.ids[row]) == (seg_no, row):
+            self._row_of.pop(seg.ids[row], None)
+        graph_label = self._label_of.pop((seg_no, row), None)
+        if self._hnsw is not None and graph_label is not None:
+            domain, label = graph_label
+            self._hnsw[domain].mark_deleted(label)
+            self._hnsw_live[domain] -= 1
+
+    def _tombstone(self, chunk_ids: Sequence[str]) -> int:
+        removed = 0
+        for chunk_id in chunk_ids:
+            location = self._row_of.get(chunk_id)
+            if location is None:
+                continue
+            self._kill(*location)
+            removed += 1
+        return removed
+
+    def delete_by_file_id(self, file_id: str) -> int:
+        with self._locked(exclusive=True):
+            doomed: List[str] = []
+            for seg in self._segments:
+                rows = np.flatnonzero((seg.file_ids == file_id) & seg.live)
+                doomed.extend(seg.ids[r] for r in rows)
+            removed = self._tombstone(doomed)
+            if removed:
+                self._persist_manifest()
+                self._maybe_compact()
+            return removed
+
+    def count(self) -> int:
+        with self._locked(exclusive=False):
+            return len(self._row_of)
+
+    def _maybe_compact(self) -> None:
+        total = sum(len(seg) for seg in self._segments)
+        ratio = float(os.getenv("LOCAL_VECTOR_STORE_COMPACT_RATIO", "0.3"))
+        if not total or (total - len(self._row_of)) / total < ratio:
+            return
+        self.compact()
+
+    def compact(self) -> None:
+        """
+        Rewrite live rows into a single segment and drop tombstones. The new
+        segment only goes live when the manifest is swapped to it, so a crash
+        at any point leaves either the old segments or the new one, never both.
+        """
+        with self._locked(exclusive=True):
+            vectors: List[np.ndarray] = []
+            meta: Dict[str, List[Any]] = {"ids": [], "file_ids": [], "domains": [], "chunk_indices": []}
+            for seg in self._segments:
+                live = np.flatnonzero(seg.live)
+                if not len(live):
+                    continue
+                vectors.append(np.asarray(seg.vectors[live], dtype=np.float32))
+                meta["ids"].extend(seg.ids[r] for r in live)
+                meta["file_ids"].extend(str(seg.file_ids[r]) for r in live)
+                meta["domains"].extend(str(seg.domains[r]) for r in live)
+                meta["chunk_indices"].extend(int(seg.chunk_indices[r]) for r in live)
+            compacted = [self._write_segment(np.concatenate(vectors), meta)] if vectors else []
+            self._segments = compacted
+            self._persist_manifest()
+            # Old segments (and anything a crashed writer left behind) are no
+            # longer referenced; other processes reload on their next call.
+            for path in self._segment_dirs():
+                if os.path.basename(path) not in {seg.name for seg in compacted}:
+                    shutil.rmtree(path, ignore_errors=True)
+            self._load(self._read_manifest())
+            enhanced_logger.info(
+                "LOCAL_VECTOR_STORE_COMPACTED",
+                extra_data={"path": self.root, "rows": len(meta["ids"])},
+            )
+
+    def _row_mask(self, seg: _Segment, domain: Optional[str]) -> np.ndarray:
+        mask = seg.live.copy()
+        if domain:
+            mask &= seg.domains == domain
+        return mask
+
+    def _candidate_rows(self, seg: _Segment, file_ids: Optional[List[str]], domain: Optional[str]) -> np.ndarray:
+        if not file_ids:
+            return np.flatnonzero(self._row_mask(seg, domain))
+        # File-filtered searches only touch the rows of those files.
+        rows = seg.rows_for_files(file_ids)
+        keep = seg.live[rows]
+        if domain:
+            keep &= seg.domains[rows] == domain
+        return rows[keep]
+
+    def _hit(self, seg: _Segment, row: int, score: float) -> LocalHit:
+        entity = {
+            "id": seg.ids[row],
+            "file_id": str(seg.file_ids[row]),
+            "domain": str(seg.domains[row]),
+            "chunk_index": int(seg.chunk_indices[row]),
+        }
+        return LocalHit(seg.ids[row], float(score), entity)
+
+    def _search_exact(
+        self,
+        query: np.ndarray,
+        top_k: int,
+        file_ids: Optional[List[str]],
+        domain: Optional[str],
+    ) -> List[LocalHit]:
+        mode = get_quantization_mode()
+        shortlist = top_k * get_rescore_multiplier() if mode != "none" else top_k
+        candidates: List[tuple[float, int, int]] = []
+        for seg_no, seg in enumerate(self._segments):
+            rows = self._candidate_rows(seg, file_ids, domain)
+            if not len(rows):
+                continue
+            if mode == "sq8":
+                codes, scales = seg.codes(mode)
+                scores = int8_scores(codes[rows], scales[rows], query)
+            elif mode == "binary":
+                scores = binary_scores(seg.codes(mode)[rows], query)
+            else:
+                scores = np.asarray(seg.vectors[rows], dtype=np.float32) @ query
+            k = min(shortlist, len(rows))
+            order = np.argpartition(-scores, k - 1)[:k]
+            best_rows, best_scores = rows[order], scores[order]
+            if mode != "none":
+                # Second pass: exact float32 scores for the shortlist only.
+                sorted_at = np.argsort(best_rows)
+                best_rows = best_rows[sorted_at]
+                best_scores = rescore(query, seg.vectors[best_rows])
+            candidates.extend((float(sc), seg_no, int(r)) for sc, r in zip(best_scores, best_rows))
+        candidates.sort(key=lambda item: item[0], reverse=True)
+        return [self._hit(self._segments[s], r, score) for score, s, r in candidates[:top_k]]
+
+    def _search_hnsw(self, query: np.ndarray, top_k: int, domain: str, ef: int) -> List[LocalHit]:
+        index = self._hnsw.get(domain)
+        if index is None:
+            return []
+        k = min(top_k, self._hnsw_live.get(domain, 0))
+        if k <= 0:
+            return []
+        index.set_ef(max(ef, top_k))
+        labels, distances = index.knn_query(query, k=k)
+        hits: List[LocalHit] = []
+        for label, distance in zip(labels[0], distances[0]):
+            seg_no, row = self._hnsw_labels[domain][int(label)]
+            # hnswlib "ip" space returns 1 - <q, v>.
+            hits.append(self._hit(self._segments[seg_no], row, 1.0 - float(distance)))
+        return hits
+
+    def search(
+        self,
+        query_embedding: Sequence[float],
+        top_k: int,
+        file_ids: Optional[List[str]] = None,
+        domain: Optional[str] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        include_vectors: bool = False,
+        radius: Optional[float] = None,
+    ) -> List[LocalHit]:
+        query = np.asarray(query_embedding, dtype=np.float32)
+        params = (search_params or {}).get("params", {}) if search_params else {}
+        with self._locked(exclusive=False):
+            # A file_id filter narrows to a handful of files; exact search
+            # over those rows is cheaper and exact.
+            if self._hnsw is not None and domain and not file_ids:
+                ef = int(params.get("ef", os.getenv("LOCAL_VECTOR_STORE_HNSW_EF", "128")))
+                hits = self._search_hnsw(query, top_k, domain, ef)
+            else:
+                hits = self._search_exact(query, top_k, file_ids, domain)
+            if radius is not None:
+                hits = [hit for hit in hits if hit.score >= radius]
+            if include_vectors:
+                for hit in hits:
+                    seg_no, row = self._row_of[hit.id]
+                    hit.entity["embedding"] = np.asarray(self._segments[seg_no].vectors[row], dtype=np.float32).tolist()
+            return hits
+
+
+_collections: Dict[str, LocalVectorCollection] = {}
+_collections_lock = threading.Lock()
+
+
+def _store_root() -> str:
+    return os.getenv("LOCAL_VECTOR_STORE_DIR", "vector_store")
+
+
+def get_local_collection(collection_name: str) -> LocalVectorCollection:
+    with _collections_lock:
+        collection = _collections.get(collection_name)
+        if collection is None:
+            dim = int(os.getenv("MILVUS_DIMENSION", "384"))
+            collection = LocalVectorCollection(os.path.join(_store_root(), collection_name), dim)
+            _collections[collection_name] = collection
+            enhanced_logger.info(
+                "LOCAL_VECTOR_COLLECTION_LOADED",
+                extra_data={"collection": collection_name, "rows": collection.count(), "dimension": dim},
+            )
+        return collection
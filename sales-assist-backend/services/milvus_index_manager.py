@@ -0,0 +1,925 @@
+from __future__ import annotations
+
+import json
+import math
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from config.domains import list_domains
+from logger import enhanced_logger
+from services.quantization import get_quantization_mode
+
+
+@dataclass(frozen=True)
+class IndexPlan:
+    index_type: str
+    build_params: Dict[str, Any] = field(default_factory=dict)
+    search_params: Dict[str, Any] = field(default_factory=dict)
+
+    def index_params(self) -> Dict[str, Any]:
+        return {
+            "index_type": self.index_type,
+            "metric_type": "IP",
+            "params": dict(self.build_params),
+        }
+
+
+_active_plans: Dict[str, IndexPlan] = {}
+_last_checked: Dict[str, float] = {}
+_rebuild_locks: Dict[str, threading.Lock] = {}
+_state_lock = threading.Lock()
+
+# collection -> {domain: entity count}, refreshed on every size check.
+_domain_entities: Dict[str, Dict[str, int]] = {}
+
+# Rebuilds are coordinated across workers through one document per
+# collection in milvus_index_state: a lease (lease_owner/lease_expires), the
+# rebuild phase writers must honour, the file_ids written during the copy,
+# and the plan/physical collection the alias points at after the last swap.
+_STATE_COLLECTION = "milvus_index_state"
+_ACTIVE_PHASES = {"copying", "swapping"}
+_worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# collection -> (fetched_at, state document)
+_shared_states: Dict[str, tuple[float, Dict[str, Any]]] = {}
+
+_COPY_FIELDS = ["id", "embedding", "file_id", "domain", "chunk_index"]
+
+_tuned_params: Dict[str, Dict[str, Dict[str, Any]]] = {}
+_tuned_params_mtime: Optional[float] = None
+_tuned_params_checked = 0.0
+
+
+def _target_recall() -> float:
+    return float(os.getenv("MILVUS_TARGET_RECALL", "0.95"))
+
+
+def _flat_max_entities() -> int:
+    return int(os.getenv("MILVUS_FLAT_MAX_ENTITIES", "50000"))
+
+
+def _hnsw_min_entities() -> int:
+    return int(os.getenv("MILVUS_HNSW_MIN_ENTITIES", "2000000"))
+
+
+def _reindex_interval_seconds() -> float:
+    return float(os.getenv("MILVUS_REINDEX_INTERVAL_SECONDS", "300"))
+
+
+def _shadow_rebuild_enabled() -> bool:
+    flag = os.getenv("MILVUS_SHADOW_REBUILD", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _maintenance_window() -> Optional[tuple[int, int]]:
+    """
+    MILVUS_REINDEX_WINDOW="HH:MM-HH:MM" (UTC, may wrap midnight) as minutes
+    of the day; None when unset or malformed.
+    """
+    value = os.getenv("MILVUS_REINDEX_WINDOW", "").strip()
+    if not value:
+        return None
+    try:
+        start, end = (part.strip() for part in value.split("-", 1))
+        bounds = []
+        for part in (start, end):
+            hours, minutes = part.split(":", 1)
+            bounds.append(int(hours) * 60 + int(minutes))
+    except ValueError:
+        enhanced_logger.warning("MILVUS_REINDEX_WINDOW_INVALID", extra_data={"value": value})
+        return None
+    return bounds[0], bounds[1]
+
+
+def _in_maintenance_window(now: Optional[datetime] = None) -> bool:
+    window = _maintenance_window()
+    if window is None:
+        return False
+    now = now or datetime.utcnow()
+    minute = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= minute < end
+    return minute >= start or minute < end
+
+
+def _copy_batch_size() -> int:
+    return int(os.getenv("MILVUS_REBUILD_COPY_BATCH", "1000"))
+
+
+def _drop_delay_seconds() -> float:
+    return float(os.getenv("MILVUS_REBUILD_DROP_DELAY_SECONDS", "30"))
+
+
+def _lease_seconds() -> float:
+    return float(os.getenv("MILVUS_REBUILD_LEASE_SECONDS", "120"))
+
+
+def _state_check_seconds() -> float:
+    return float(os.getenv("MILVUS_REBUILD_STATE_CHECK_SECONDS", "2"))
+
+
+def _phase_grace_seconds() -> float:
+    # Longer than any worker's cached view of the state document, so every
+    # writer has seen a phase change before the rebuild relies on it.
+    return _state_check_seconds() + 1.0
+
+
+def _writer_wait_seconds() -> float:
+    return float(os.getenv("MILVUS_REBUILD_WRITER_WAIT_SECONDS", "30"))
+
+
+def get_tuned_params_path() -> str:
+    return os.getenv("MILVUS_SEARCH_PARAMS_PATH", "search_params.json")
+
+
+def _forced_index_type() -> Optional[str]:
+    value = os.getenv("MILVUS_INDEX_TYPE", "AUTO").strip().upper()
+    if not value or value == "AUTO":
+        return None
+    return value
+
+
+def _ivf_nlist(num_entities: int) -> int:
+    # ~4 * sqrt(n) clusters, rounded to a power of two.
+    raw = 4 * math.sqrt(max(num_entities, 1))
+    nlist = 2 ** int(round(math.log2(max(raw, 1))))
+    return max(128, min(nlist, 65536))
+
+
+def _ivf_nprobe(nlist: int, target_recall: float) -> int:
+    if target_recall <= 0.90:
+        fraction = 1 / 64
+    elif target_recall <= 0.95:
+        fraction = 1 / 32
+    elif target_recall <= 0.98:
+        fraction = 1 / 16
+    else:
+        fraction = 1 / 8
+    return max(8, min(int(math.ceil(nlist * fraction)), nlist))
+
+
+def _hnsw_params(target_recall: float) -> tuple[int, int, int]:
+    if target_recall <= 0.90:
+        return 16, 200, 64
+    if target_recall <= 0.95:
+        return 16, 200, 128
+    if target_recall <= 0.98:
+        return 32, 360, 256
+    return 32, 500, 512
+
+
+def plan_for_size(
+    num_entities: int,
+    target_recall: Optional[float] = None,
+    index_type: Optional[str] = None,
+) -> IndexPlan:
+    """
+    Pick an index type and build/search params for a collection of this size.
+    """
+    recall = target_recall if target_recall is not None else _target_recall()
+    chosen = index_type or _forced_index_type()
+    tiered = chosen is None
+    if tiered:
+        if num_entities < _flat_max_entities():
+            chosen = "FLAT"
+        elif num_entities < _hnsw_min_entities():
+            chosen = "IVF_FLAT"
+        else:
+            chosen = "HNSW"
+
+    if chosen == "FLAT":
+        return IndexPlan(index_type="FLAT")
+
+    if tiered and chosen == "IVF_FLAT" and get_quantization_mode() == "sq8":
+        # int8 codes in memory; exact float32 rescoring happens after search.
+        # The HNSW tier and an explicit index type are left as chosen.
+        chosen = "IVF_SQ8"
+
+    if chosen.startswith("IVF"):
+        nlist = _ivf_nlist(num_entities)
+        return IndexPlan(
+            index_type=chosen,
+            build_params={"nlist": nlist},
+            search_params={"nprobe": _ivf_nprobe(nlist, recall)},
+        )
+
+    if chosen == "HNSW":
+        m, ef_construction, ef = _hnsw_params(recall)
+        return IndexPlan(
+            index_type="HNSW",
+            build_params={"M": m, "efConstruction": ef_construction},
+            search_params={"ef": ef},
+        )
+
+    return IndexPlan(index_type=chosen)
+
+
+def plan_for_domain(plan: IndexPlan, domain_entities: Optional[int], num_entities: int) -> IndexPlan:
+    """
+    Adjust a collection plan for one domain's share of it. Milvus keeps one
+    vector index per collection, so the index type follows the collection;
+    what differs per domain is how hard a domain-filtered search has to look.
+    A domain small enough for FLAT is searched exhaustively, and a minority
+    domain probes more lists / a wider HNSW beam than the collection default.
+    """
+    if plan.index_type == "FLAT" or domain_entities is None or num_entities <= 0:
+        return plan
+    share = max(domain_entities, 1) / num_entities
+    if plan.index_type.startswith("IVF"):
+        nlist = int(plan.build_params.get("nlist", 1))
+        nprobe = int(plan.search_params.get("nprobe", 1))
+        if domain_entities < _flat_max_entities():
+            nprobe = nlist
+        elif share < 1.0:
+            nprobe = min(nlist, int(math.ceil(nprobe / math.sqrt(share))))
+        return IndexPlan(plan.index_type, dict(plan.build_params), {**plan.search_params, "nprobe": nprobe})
+    if plan.index_type == "HNSW":
+        ef = int(plan.search_params.get("ef", 64))
+        if share < 1.0:
+            ef = min(4096, int(math.ceil(ef / math.sqrt(share))))
+        if domain_entities < _flat_max_entities():
+            ef = max(ef, min(domain_entities, 4096))
+        return IndexPlan(plan.index_type, dict(plan.build_params), {**plan.search_params, "ef": ef})
+    return plan
+
+
+def _plan_from_index_info(index_type: str, build_params: Dict[str, Any]) -> IndexPlan:
+    defaults = plan_for_size(0, index_type=index_type)
+    if index_type.startswith("IVF"):
+        nlist = int(build_params.get("nlist", 1024))
+        return IndexPlan(
+            index_type=index_type,
+            build_params={"nlist": nlist},
+            search_params={"nprobe": _ivf_nprobe(nlist, _target_recall())},
+        )
+    if index_type == "HNSW":
+        return IndexPlan(
+            index_type="HNSW",
+            build_params={
+                "M": int(build_params.get("M", 16)),
+                "efConstruction": int(build_params.get("efConstruction", 200)),
+            },
+            search_params=dict(defaults.search_params),
+        )
+    return IndexPlan(index_type=index_type, build_params=dict(build_params))
+
+
+def _describe_index(collection: Any) -> Optional[IndexPlan]:
+    for index in getattr(collection, "indexes", None) or []:
+        if getattr(index, "field_name", None) != "embedding":
+            continue
+        params = dict(getattr(index, "params", None) or {})
+        index_type = str(params.get("index_type", "")).upper()
+        if not index_type:
+            return None
+        build_params = params.get("params") or {}
+        if isinstance(build_params, str):
+            try:
+                build_params = json.loads(build_params)
+            except ValueError:
+                build_params = {}
+        return _plan_from_index_info(index_type, dict(build_params))
+    return None
+
+
+def _needs_rebuild(current: Optional[IndexPlan], desired: IndexPlan, num_entities: int) -> bool:
+    if current is None:
+        return True
+    if current.index_type != desired.index_type:
+        # Hysteresis: only step down a tier once the collection has shrunk well
+        # below the threshold, so deletes near a boundary do not flip-flop.
+        if current.index_type == "HNSW" and num_entities > _hnsw_min_entities() // 2:
+            return False
+        if current.index_type.startswith("IVF") and desired.index_type == "FLAT":
+            return num_entities < _flat_max_entities() // 2
+        return True
+    if current.index_type.startswith("IVF"):
+        current_nlist = int(current.build_params.get("nlist", 1))
+        desired_nlist = int(desired.build_params.get("nlist", 1))
+        ratio = max(current_nlist, desired_nlist) / max(min(current_nlist, desired_nlist), 1)
+        return ratio >= 4
+    if current.index_type == "HNSW":
+        return current.build_params.get("M") != desired.build_params.get("M")
+    return False
+
+
+def register_collection(collection_name: str, collection: Any) -> IndexPlan:
+    """
+    Record the active index of a loaded collection, creating one if missing.
+    """
+    plan = _describe_index(collection)
+    if plan is None:
+        plan = plan_for_size(int(getattr(collection, "num_entities", 0) or 0))
+        collection.create_index(field_name="embedding", index_params=plan.index_params())
+        enhanced_logger.info(
+            "MILVUS_INDEX_CREATED",
+            extra_data={"collection": collection_name, "index_type": plan.index_type, "params": plan.build_params},
+        )
+    with _state_lock:
+        _active_plans[collection_name] = plan
+    return plan
+
+
+def get_active_plan(collection_name: str) -> Optional[IndexPlan]:
+    with _state_lock:
+        return _active_plans.get(collection_name)
+
+
+def get_domain_entities(collection_name: str) -> Dict[str, int]:
+    with _state_lock:
+        return dict(_domain_entities.get(collection_name, {}))
+
+
+def _count_domains(collection_name: str, collection: Any) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for domain in list_domains():
+        try:
+            rows = collection.query(expr=f'domain == "{domain}"', output_fields=["count(*)"])
+        except Exception as exc:
+            enhanced_logger.warning(
+                "MILVUS_DOMAIN_COUNT_FAILED",
+                extra_data={"collection": collection_name, "domain": domain, "error": str(exc)},
+            )
+            return get_domain_entities(collection_name)
+        count = int(rows[0].get("count(*)", 0)) if rows else 0
+        if count:
+            counts[domain] = count
+    with _state_lock:
+        _domain_entities[collection_name] = counts
+    return counts
+
+
+def physical_collection_name(collection_name: str) -> str:
+    """
+    Name for a new physical collection served under the collection_name alias.
+    """
+    return f"{collection_name}__v{int(time.time() * 1000)}"
+
+
+def resolve_alias(collection_name: str) -> Optional[str]:
+    """
+    Physical collection currently behind the collection_name alias, or None
+    when collection_name is a plain collection (or does not exist).
+    """
+    from pymilvus import utility
+
+    prefix = f"{collection_name}__v"
+    for name in sorted(utility.list_collections(), reverse=True):
+        if name.startswith(prefix) and collection_name in (utility.list_aliases(name) or []):
+            return name
+    return None
+
+
+def _state_collection() -> Any:
+    from utils.database import get_sync_database
+
+    return get_sync_database()[_STATE_COLLECTION]
+
+
+def _plan_to_doc(plan: IndexPlan) -> Dict[str, Any]:
+    return {
+        "index_type": plan.index_type,
+        "build_params": dict(plan.build_params),
+        "search_params": dict(plan.search_params),
+    }
+
+
+def _plan_from_doc(doc: Optional[Dict[str, Any]]) -> Optional[IndexPlan]:
+    if not doc or not doc.get("index_type"):
+        return None
+    return IndexPlan(
+        index_type=str(doc["index_type"]),
+        build_params=dict(doc.get("build_params") or {}),
+        search_params=dict(doc.get("search_params") or {}),
+    )
+
+
+def _rebuild_active(state: Dict[str, Any], now: Optional[float] = None) -> bool:
+    # A crashed rebuilder leaves its phase behind; it stops counting once the
+    # lease runs out.
+    now = time.time() if now is None else now
+    return state.get("phase") in _ACTIVE_PHASES and float(state.get("lease_expires") or 0.0) > now
+
+
+def _shared_state(collection_name: str, fresh: bool = False) -> Dict[str, Any]:
+    """
+    The collection's rebuild state document, cached for
+    MILVUS_REBUILD_STATE_CHECK_SECONDS. A plan published by another worker's
+    swap is adopted here, so every worker searches with the live index's params.
+    """
+    now = time.time()
+    with _state_lock:
+        cached = _shared_states.get(collection_name)
+    if not fresh and cached is not None and now - cached[0] < _state_check_seconds():
+        return cached[1]
+    try:
+        state = _state_collection().find_one({"_id": collection_name}) or {}
+    except Exception as exc:
+        enhanced_logger.debug(
+            "MILVUS_REBUILD_STATE_UNAVAILABLE",
+            extra_data={"collection": collection_name, "error": str(exc)},
+        )
+        state = cached[1] if cached is not None else {}
+    plan = _plan_from_doc(state.get("plan"))
+    with _state_lock:
+        _shared_states[collection_name] = (now, state)
+        if plan is not None and not _rebuild_active(state, now):
+            _active_plans[collection_name] = plan
+    return state
+
+
+def refresh_shared_state(collection_name: str) -> None:
+    """
+    Pick up index swaps made by other workers (cheap; cached).
+    """
+    _shared_state(collection_name)
+
+
+def swap_in_progress(collection_name: str) -> bool:
+    state = _shared_state(collection_name, fresh=True)
+    return state.get("phase") == "swapping" and _rebuild_active(state)
+
+
+def _enter_write(collection_name: str) -> bool:
+    """
+    Block while any worker swaps this collection. During a copy, register as
+    an in-flight writer so the rebuilder can wait for us before its final
+    resync. Returns True when registered.
+    """
+    deadline = time.time() + _writer_wait_seconds() + _lease_seconds()
+    state = _shared_state(collection_name)
+    while True:
+        if state.get("phase") in _ACTIVE_PHASES:
+            state = _shared_state(collection_name, fresh=True)
+        if not _rebuild_active(state):
+            return False
+        if state.get("phase") == "copying":
+            try:
+                result = _state_collection().update_one(
+                    {"_id": collection_name, "phase": "copying"},
+                    {"$inc": {"writers": 1}},
+                )
+            except Exception:
+                return False
+            if result.matched_count:
+                return True
+        elif time.time() >= deadline:
+            enhanced_logger.warning("MILVUS_REBUILD_WRITE_WAIT_EXPIRED", extra_data={"collection": collection_name})
+            return False
+        else:
+            time.sleep(0.2)
+        state = _shared_state(collection_name, fresh=True)
+
+
+@contextmanager
+def tracked_write(collection_name: str, file_ids: Iterable[str]) -> Iterator[None]:
+    """
+    Wrap every insert/delete on a collection. While any worker rebuilds it,
+    the file_ids written are recorded on the shared state document so the
+    rebuild can resync them, and writes pause while the alias is swapped.
+    """
+    file_ids = sorted({str(fid) for fid in file_ids})
+    registered = _enter_write(collection_name)
+    try:
+        yield
+    finally:
+        update: Dict[str, Any] = {}
+        if registered:
+            update["$inc"] = {"writers": -1}
+        if registered or _rebuild_active(_shared_state(collection_name)):
+            update["$addToSet"] = {"touched": {"$each": file_ids}}
+        if update:
+            try:
+                _state_collection().update_one({"_id": collection_name}, update)
+            except Exception as exc:
+                enhanced_logger.warning(
+                    "MILVUS_REBUILD_TOUCH_FAILED",
+                    extra_data={"collection": collection_name, "file_ids": file_ids, "error": str(exc)},
+                )
+
+
+def _acquire_lease(collection_name: str) -> bool:
+    now = time.time()
+    try:
+        state = _state_collection().find_one_and_update(
+            {
+                "_id": collection_name,
+                "$or": [
+                    {"lease_owner": None},
+                    {"lease_owner": _worker_id},
+                    {"lease_expires": {"$lt": now}},
+                ],
+            },
+            {"$set": {"lease_owner": _worker_id, "lease_expires": now + _lease_seconds()}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The document exists and the filter missed: another worker holds it.
+        return False
+    return bool(state) and state.get("lease_owner") == _worker_id
+
+
+def _update_lease(collection_name: str, update: Optional[Dict[str, Any]] = None) -> None:
+    """
+    Renew our lease (applying `update` alongside); raises once it is lost so
+    the rebuild aborts instead of racing the new holder.
+    """
+    update = dict(update or {})
+    update["$set"] = {**update.get("$set", {}), "lease_expires": time.time() + _lease_seconds()}
+    result = _state_collection().update_one({"_id": collection_name, "lease_owner": _worker_id}, update)
+    if not result.matched_count:
+        raise RuntimeError(f"Milvus rebuild lease for {collection_name} was lost")
+
+
+def _release_lease(collection_name: str, update: Optional[Dict[str, Any]] = None) -> None:
+    update = dict(update or {})
+    update["$set"] = {**update.get("$set", {}), "phase": "idle", "lease_owner": None, "lease_expires": 0.0}
+    update["$unset"] = {"touched": "", "writers": ""}
+    try:
+        _state_collection().update_one({"_id": collection_name, "lease_owner": _worker_id}, update)
+    except Exception as exc:
+        enhanced_logger.warning(
+            "MILVUS_REBUILD_LEASE_RELEASE_FAILED",
+            extra_data={"collection": collection_name, "error": str(exc)},
+        )
+    with _state_lock:
+        _shared_states.pop(collection_name, None)
+
+
+def _tuned_params_refresh_seconds() -> float:
+    return float(os.getenv("MILVUS_SEARCH_PARAMS_REFRESH_SECONDS", "30"))
+
+
+def _load_tuned_params() -> Dict[str, Dict[str, Dict[str, Any]]]:
+    # Searches read the parsed file; it is only re-stat'ed once per refresh interval.
+    global _tuned_params, _tuned_params_mtime, _tuned_params_checked
+    now = time.time()
+    if now - _tuned_params_checked < _tuned_params_refresh_seconds():
+        return _tuned_params
+    _tuned_params_checked = now
+    path = get_tuned_params_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        _tuned_params, _tuned_params_mtime = {}, None
+        return _tuned_params
+    if mtime != _tuned_params_mtime:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                _tuned_params = json.load(f) or {}
+        except (OSError, ValueError) as exc:
+            enhanced_logger.warning(
+                "MILVUS_TUNED_PARAMS_UNREADABLE",
+                extra_data={"path": path, "error": str(exc)},
+            )
+            _tuned_params = {}
+        _tuned_params_mtime = mtime
+    return _tuned_params
+
+
+def _tuned_search_params(collection_name: str, domain: Optional[str], plan: IndexPlan) -> Optional[Dict[str, Any]]:
+    if not domain:
+        return None
+    entry = _load_tuned_params().get(collection_name, {}).get(domain)
+    if not entry:
+        return None
+    # Tuned values only hold for the exact index they were measured against.
+    if entry.get("index_type") != plan.index_type or entry.get("build_params", {}) != plan.build_params:
+        return None
+    return dict(entry.get("search_params") or {})
+
+
+def save_tuned_params(collection_name: str, domain: str, entry: Dict[str, Any]) -> None:
+    """
+    Merge one tuned (collection, domain) entry into the search params file.
+    """
+    global _tuned_params_checked
+    path = get_tuned_params_path()
+    data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f) or {}
+    data.setdefault(collection_name, {})[domain] = entry
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+    # Let this process see the new values on its next search.
+    _tuned_params_checked = 0.0
+
+
+def get_search_params(collection_name: str, top_k: int, domain: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Search params that match the index currently serving this collection,
+    preferring per-domain values written by the tuner, then the domain's
+    share of the collection.
+    """
+    plan = get_active_plan(collection_name) or plan_for_size(0)
+    params = _tuned_search_params(collection_name, domain, plan)
+    if params is None:
+        if domain:
+            domains = get_domain_entities(collection_name)
+            if domains:
+                plan = plan_for_domain(plan, domains.get(domain, 0), sum(domains.values()))
+        params = dict(plan.search_params)
+    if "ef" in params:
+        params["ef"] = max(int(params["ef"]), int(top_k))
+    return {"metric_type": "IP", "params": params}
+
+
+def _rebuild(collection_name: str, collection: Any, desired: IndexPlan, num_entities: int) -> None:
+    """
+    In-place swap: Milvus refuses to drop an index on a loaded collection, so
+    this is release -> drop -> create -> load and the collection cannot be
+    searched meanwhile. Only used with MILVUS_SHADOW_REBUILD off, inside the
+    maintenance window.
+    """
+    previous = get_active_plan(collection_name)
+    start = time.time()
+    collection.release()
+    try:
+        collection.drop_index()
+        collection.create_index(field_name="embedding", index_params=desired.index_params())
+    finally:
+        collection.load()
+    with _state_lock:
+        _active_plans[collection_name] = desired
+    _log_rebuilt(collection_name, "in_place", previous, desired, num_entities, start)
+
+
+def _log_rebuilt(
+    collection_name: str,
+    mode: str,
+    previous: Optional[IndexPlan],
+    desired: IndexPlan,
+    num_entities: int,
+    start: float,
+) -> None:
+    enhanced_logger.info(
+        "MILVUS_INDEX_REBUILT",
+        extra_data={
+            "collection": collection_name,
+            "mode": mode,
+            "num_entities": num_entities,
+            "previous_index_type": previous.index_type if previous else None,
+            "index_type": desired.index_type,
+            "params": desired.build_params,
+            "rebuild_time_ms": round((time.time() - start) * 1000.0, 2),
+        },
+    )
+
+
+def _copy_rows(source: Any, target: Any, expr: str, collection_name: Optional[str] = None) -> int:
+    iterator = source.query_iterator(
+        batch_size=_copy_batch_size(),
+        expr=expr,
+        output_fields=_COPY_FIELDS,
+        consistency_level="Strong",
+    )
+    copied = 0
+    try:
+        while True:
+            rows = iterator.next()
+            if not rows:
+                break
+            target.insert([[row[name] for row in rows] for name in _COPY_FIELDS])
+            copied += len(rows)
+            if collection_name is not None:
+                _update_lease(collection_name)
+    finally:
+        iterator.close()
+    return copied
+
+
+def _take_touched(collection_name: str) -> List[str]:
+    state = _state_collection().find_one_and_update(
+        {"_id": collection_name, "lease_owner": _worker_id},
+        {"$set": {"touched": [], "lease_expires": time.time() + _lease_seconds()}},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if state is None:
+        raise RuntimeError(f"Milvus rebuild lease for {collection_name} was lost")
+    return sorted(state.get("touched") or [])
+
+
+def _resync_files(source: Any, target: Any, file_ids: List[str]) -> None:
+    for file_id in file_ids:
+        expr = f'file_id == "{file_id}"'
+        target.delete(expr)
+        _copy_rows(source, target, expr)
+
+
+def _wait_for_writers(collection_name: str) -> None:
+    deadline = time.time() + _writer_wait_seconds()
+    while time.time() < deadline:
+        state = _state_collection().find_one({"_id": collection_name}) or {}
+        if int(state.get("writers") or 0) <= 0:
+            return
+        time.sleep(0.2)
+    enhanced_logger.warning("MILVUS_REBUILD_WRITERS_TIMEOUT", extra_data={"collection": collection_name})
+
+
+def _drop_collection(name: str) -> None:
+    from pymilvus import Collection
+
+    try:
+        old = Collection(name)
+        old.release()
+        old.drop()
+    except Exception as exc:
+        enhanced_logger.warning(
+            "MILVUS_OLD_COLLECTION_DROP_FAILED",
+            extra_data={"collection": name, "error": str(exc)},
+        )
+
+
+def _point_alias(collection_name: str, collection: Any, shadow_name: str, old_physical: Optional[str]) -> None:
+    from pymilvus import utility
+
+    if old_physical is not None:
+        utility.alter_alias(collection_name=shadow_name, alias=collection_name)
+        return
+    # A collection created before aliasing: the name is taken by the
+    # collection itself, so it has to go before the alias can claim it.
+    # Writers are paused and searches retry through the gap.
+    collection.release()
+    utility.drop_collection(collection_name)
+    for attempt in range(3):
+        try:
+            utility.create_alias(collection_name=shadow_name, alias=collection_name)
+            return
+        except Exception as exc:
+            enhanced_logger.error(
+                "MILVUS_ALIAS_CREATE_FAILED",
+                extra_data={"alias": collection_name, "physical": shadow_name, "attempt": attempt + 1, "error": str(exc)},
+            )
+            time.sleep(1.0)
+    raise RuntimeError(f"could not alias {collection_name} to {shadow_name}")
+
+
+def _rebuild_shadow(
+    collection_name: str,
+    collection: Any,
+    old_physical: Optional[str],
+    desired: IndexPlan,
+    num_entities: int,
+) -> None:
+    """
+    Online swap, run under the cluster-wide lease: build the new index on a
+    shadow collection and copy the data across while the alias keeps serving
+    the old one. Files any worker writes during the copy are resynced; writes
+    then pause cluster-wide for the final resync and the alias switch.
+    old_physical is None for a collection created before aliasing, which is
+    migrated behind an alias the same way.
+    """
+    from pymilvus import Collection
+
+    previous = get_active_plan(collection_name)
+    start = time.time()
+    shadow_name = physical_collection_name(collection_name)
+    shadow = None
+    swapped = False
+    try:
+        _update_lease(collection_name, {"$set": {"phase": "copying", "touched": [], "writers": 0}})
+        time.sleep(_phase_grace_seconds())
+        shadow = Collection(name=shadow_name, schema=collection.schema)
+        shadow.create_index(field_name="embedding", index_params=desired.index_params())
+        copied = _copy_rows(collection, shadow, 'id != ""', collection_name)
+        # Catch up on files written during the copy; a couple of passes
+        # while writes still flow keep the paused final pass short.
+        for _ in range(3):
+            touched = _take_touched(collection_name)
+            if not touched:
+                break
+            _resync_files(collection, shadow, touched)
+        shadow.flush()
+        shadow.load()
+        _update_lease(collection_name, {"$set": {"phase": "swapping"}})
+        time.sleep(_phase_grace_seconds())
+        _wait_for_writers(collection_name)
+        _resync_files(collection, shadow, _take_touched(collection_name))
+        shadow.flush()
+        if old_physical is None:
+            # Past this point the shadow holds the only copy of the data.
+            swapped = True
+        _point_alias(collection_name, collection, shadow_name, old_physical)
+        swapped = True
+        with _state_lock:
+            _active_plans[collection_name] = desired
+        _release_lease(collection_name, {"$set": {"plan": _plan_to_doc(desired), "physical": shadow_name}})
+    except BaseException:
+        _release_lease(collection_name)
+        if not swapped and shadow is not None:
+            try:
+                shadow.drop()
+            except Exception:
+                pass
+        raise
+    _log_rebuilt(collection_name, "shadow", previous, desired, num_entities, start)
+    enhanced_logger.info(
+        "MILVUS_ALIAS_SWAPPED",
+        extra_data={"alias": collection_name, "from": old_physical or collection_name, "to": shadow_name, "copied": copied},
+    )
+    if old_physical is not None:
+        # Searches already routed to the old collection get a grace period;
+        # the drop runs off this thread so nothing waits on it.
+        timer = threading.Timer(_drop_delay_seconds(), _drop_collection, args=(old_physical,))
+        timer.daemon = True
+        timer.start()
+
+
+def maybe_reindex(collection_name: str, collection: Any, force: bool = False) -> bool:
+    """
+    Rebuild the embedding index when the collection crossed a size threshold.
+    Only the worker holding the collection's lease in milvus_index_state
+    rebuilds. With MILVUS_SHADOW_REBUILD (default) the rebuild is online
+    through a shadow collection; otherwise it is in place, inside
+    MILVUS_REINDEX_WINDOW (or when forced). Returns True when a rebuild happened.
+    """
+    with _state_lock:
+        lock = _rebuild_locks.setdefault(collection_name, threading.Lock())
+    if not lock.acquire(blocking=False):
+        return False
+    leased = False
+    try:
+        now = time.time()
+        if not force and now - _last_checked.get(collection_name, 0.0) < _reindex_interval_seconds():
+            return False
+        _last_checked[collection_name] = now
+
+        collection.flush()
+        num_entities = int(collection.num_entities)
+        _count_domains(collection_name, collection)
+        _shared_state(collection_name, fresh=True)
+        current = get_active_plan(collection_name) or _describe_index(collection)
+        desired = plan_for_size(num_entities)
+        if not force and not _needs_rebuild(current, desired, num_entities):
+            return False
+        shadow = _shadow_rebuild_enabled()
+        if not shadow and not force and not _in_maintenance_window():
+            enhanced_logger.info(
+                "MILVUS_REINDEX_DEFERRED",
+                extra_data={
+                    "collection": collection_name,
+                    "num_entities": num_entities,
+                    "index_type": current.index_type if current else None,
+                    "desired_index_type": desired.index_type,
+                    "window": os.getenv("MILVUS_REINDEX_WINDOW", ""),
+                },
+            )
+            return False
+        leased = _acquire_lease(collection_name)
+        if not leased:
+            enhanced_logger.info("MILVUS_REINDEX_LEASE_HELD", extra_data={"collection": collection_name})
+            return False
+        # Another worker may have swapped while we were sizing.
+        _shared_state(collection_name, fresh=True)
+        current = get_active_plan(collection_name) or current
+        if not force and not _needs_rebuild(current, desired, num_entities):
+            return False
+        if shadow:
+            leased = False  # _rebuild_shadow releases it
+            _rebuild_shadow(collection_name, collection, resolve_alias(collection_name), desired, num_entities)
+            return True
+        _rebuild(collection_name, collection, desired, num_entities)
+        leased = False
+        _release_lease(collection_name, {"$set": {"plan": _plan_to_doc(desired)}})
+        return True
+    except Exception as exc:
+        enhanced_logger.exception(
+            "MILVUS_REINDEX_FAILED",
+            exc_info=exc,
+            extra_data={"collection": collection_name},
+        )
+        return False
+    finally:
+        if leased:
+            _release_lease(collection_name)
+        lock.release()
+
+
+def schedule_reindex_check(collection_name: str, collection: Any) -> None:
+    """
+    Fire-and-forget size check after inserts; throttled per collection.
+    """
+    last = _last_checked.get(collection_name, 0.0)
+    if time.time() - last < _reindex_interval_seconds():
+        return
+    thread = threading.Thread(
+        target=maybe_reindex,
+        args=(collection_name, collection),
+        name=f"milvus-reindex-{collection_name}",
+        daemon=True,
+    )
+    thread.start()
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 import os
+import time
 from typing import Dict, List, Sequence
 
 from pymilvus import (
@@ -13,22 +14,47 @@ from pymilvus import (
 )
 
 from logger import enhanced_logger
+from services.local_vector_store import get_local_collection
+from services.milvus_index_manager import (
+    get_active_plan,
+    get_search_params,
+    physical_collection_name,
+    refresh_shared_state,
+    register_collection,
+    resolve_alias,
+    schedule_reindex_check,
+    swap_in_progress,
+    tracked_write,
+)
+from services.quantization import get_rescore_multiplier, rescore
 
 
 _connected = False
 _collections: Dict[str, Collection] = {}
 
 
+def _use_local_store() -> bool:
+    """
+    VECTOR_STORE=local swaps Milvus for the in-process NumPy/HNSW store.
+    """
+    return os.getenv("VECTOR_STORE", "milvus").strip().lower() == "local"
+
+
 def _connect() -> None:
     global _connected
     if _connected:
         return
 
-    connections.connect(
-        alias="default",
-        host=os.getenv("MILVUS_HOST"),
-        port=os.getenv("MILVUS_PORT"),
-    )
+    uri = os.getenv("MILVUS_URI")
+    if uri:
+        # Milvus Lite (a local .db path) or a full server URI.
+        connections.connect(alias="default", uri=uri)
+    else:
+        connections.connect(
+            alias="default",
+            host=os.getenv("MILVUS_HOST"),
+            port=os.getenv("MILVUS_PORT"),
+        )
     _connected = True
 
 
@@ -47,6 +73,14 @@ def get_general_collection_name() -> str:
     return _get_general_collection_name()
 
 
+def get_collection_name() -> str:
+    return _get_collection_name()
+
+
+def get_collection(collection_name: str | None = None) -> Collection:
+    return _ensure_collection(collection_name or _get_collection_name())
+
+
 def _build_schema(dim: int) -> CollectionSchema:
     fields = [
         FieldSchema(
@@ -89,20 +123,16 @@ def _ensure_collection(collection_name: str) -> Collection:
 
     dim = int(os.getenv("MILVUS_DIMENSION", "384"))
 
-    if not utility.has_collection(collection_name):
-        schema = _build_schema(dim)
-        collection = Collection(name=collection_name, schema=schema)
-        collection.create_index(
-            field_name="embedding",
-            index_params={
-                "index_type": "IVF_FLAT",
-                "metric_type": "IP",
-                "params": {"nlist": 1024},
-            },
-        )
+    if not utility.has_collection(collection_name) and resolve_alias(collection_name) is None:
+        # Served through an alias so index rebuilds can swap in a shadow
+        # collection without taking search offline.
+        physical_name = physical_collection_name(collection_name)
+        Collection(name=physical_name, schema=_build_schema(dim))
+        utility.create_alias(collection_name=physical_name, alias=collection_name)
+        collection = Collection(collection_name)
         enhanced_logger.info(
             "MILVUS_COLLECTION_CREATED",
-            extra_data={"collection": collection_name, "dimension": dim},
+            extra_data={"collection": collection_name, "physical": physical_name, "dimension": dim},
         )
     else:
         collection = Collection(collection_name)
@@ -126,6 +156,7 @@ def _ensure_collection(collection_name: str) -> Collection:
                 f"Milvus collection dimension validation failed: {exc}"
             ) from exc
 
+    register_collection(collection_name, collection)
     collection.load()
     _collections[collection_name] = collection
     return collection
@@ -136,6 +167,10 @@ def init_milvus() -> None:
     Initialize Milvus connection and ensure collections exist.
     Intended to be called on application startup.
     """
+    if _use_local_store():
+        get_local_collection(_get_collection_name())
+        get_local_collection(_get_general_collection_name())
+        return
     _ensure_collection(_get_collection_name())
     _ensure_collection(_get_general_collection_name())
 
@@ -153,6 +188,9 @@ def insert_embeddings(
         raise ValueError("ids, embeddings, and metadata must be the same length")
 
     name = collection_name or _get_collection_name()
+    if _use_local_store():
+        get_local_collection(name).insert(ids, embeddings, metadata)
+        return
     collection = _ensure_collection(name)
 
     for start in range(0, len(ids), batch_size):
@@ -172,7 +210,10 @@ def insert_embeddings(
             domains,
             chunk_indices,
         ]
-        collection.insert(entities)
+        with tracked_write(name, file_ids):
+            collection.insert(entities)
+
+    schedule_reindex_check(name, collection)
 
 
 def insert_embeddings_general(
@@ -191,11 +232,17 @@ def insert_embeddings_general(
 
 
 def delete_embeddings_by_file_id(file_id: str) -> None:
+    if _use_local_store():
+        get_local_collection(_get_collection_name()).delete_by_file_id(file_id)
+        get_local_collection(_get_general_collection_name()).delete_by_file_id(file_id)
+        return
     default_collection = _ensure_collection(_get_collection_name())
     general_collection = _ensure_collection(_get_general_collection_name())
     expr = f'file_id == "{file_id}"'
-    default_collection.delete(expr)
-    general_collection.delete(expr)
+    with tracked_write(_get_collection_name(), [file_id]):
+        default_collection.delete(expr)
+    with tracked_write(_get_general_collection_name(), [file_id]):
+        general_collection.delete(expr)
 
 
 def search_embeddings(
@@ -204,8 +251,25 @@ def search_embeddings(
     file_ids: List[str] | None = None,
     domain: str | None = None,
     collection_name: str | None = None,
+    search_params: Dict[str, object] | None = None,
+    include_vectors: bool = False,
+    radius: float | None = None,
 ):
+    """
+    Top-k IP search. With `radius`, runs as a range search and only returns
+    hits scoring above it, so low-signal queries come back short or empty.
+    """
     name = collection_name or _get_collection_name()
+    if _use_local_store():
+        return get_local_collection(name).search(
+            query_embedding,
+            top_k,
+            file_ids=file_ids,
+            domain=domain,
+            search_params=search_params,
+            include_vectors=include_vectors,
+            radius=radius,
+        )
     collection = _ensure_collection(name)
 
     expr_parts = []
@@ -217,12 +281,85 @@ def search_embeddings(
 
     expr = " and ".join(expr_parts) if expr_parts else None
 
-    results = collection.search(
+    refresh_shared_state(name)
+    plan = get_active_plan(name)
+    quantized = plan is not None and plan.index_type.endswith("SQ8")
+    limit = top_k * get_rescore_multiplier() if quantized else top_k
+
+    output_fields = ["id", "file_id", "chunk_index", "domain"]
+    if include_vectors and not quantized:
+        output_fields.append("embedding")
+
+    param = dict(search_params or get_search_params(name, limit, domain=domain))
+    if radius is not None:
+        range_params = dict(param.get("params") or {})
+        # SQ8 scores are approximate; widen the first pass and apply the exact
+        # floor after rescoring.
+        margin = float(os.getenv("VECTOR_RESCORE_RADIUS_MARGIN", "0.02")) if quantized else 0.0
+        range_params["radius"] = float(radius) - margin
+        param["params"] = range_params
+
+    search_kwargs = dict(
         data=[query_embedding],
         anns_field="embedding",
-        param={"metric_type": "IP", "params": {"nprobe": 10}},
-        limit=top_k,
+        param=param,
+        limit=limit,
         expr=expr,
-        output_fields=["id", "file_id", "chunk_index", "domain"],
+        output_fields=output_fields,
     )
+    try:
+        results = collection.search(**search_kwargs)
+    except Exception:
+        # Migrating a pre-alias collection drops it just before the alias
+        # takes its name; ride out that gap once.
+        if not swap_in_progress(name):
+            raise
+        time.sleep(float(os.getenv("MILVUS_SWAP_RETRY_SECONDS", "1.0")))
+        results = collection.search(**search_kwargs)
+    if quantized:
+        hits = _rescore_hits(collection, query_embedding, results[0], top_k, include_vectors)
+        if radius is not None:
+            hits = [hit for hit in hits if hit.score >= radius]
+        return hits
     return results[0]
+
+
+def _rescore_hits(
+    collection: Collection,
+    query_embedding: List[float],
+    hits,
+    top_k: int,
+    include_vectors: bool = False,
+):
+    """
+    Re-rank an SQ8 shortlist with the exact float32 vectors, fetched in one
+    query. Returns the Milvus hits re-ordered, with exact scores as distance.
+    """
+    candidates = list(hits)
+    if not candidates:
+        return []
+    quoted = ", ".join(f'"{hit.id}"' for hit in candidates)
+    try:
+        rows = collection.query(expr=f"id in [{quoted}]", output_fields=["id", "embedding"])
+    except Exception as exc:
+        enhanced_logger.warning(
+            "MILVUS_RESCORE_FETCH_FAILED",
+            extra_data={"collection": collection.name, "error": str(exc)},
+        )
+        return candidates[:top_k]
+
+    vectors = {str(row["id"]): row["embedding"] for row in rows}
+    kept = [hit for hit in candidates if str(hit.id) in vectors]
+    if not kept:
+        return candidates[:top_k]
+    scores = rescore(query_embedding, [vectors[str(hit.id)] for hit in kept])
+
+    # pymilvus >=2.4 (pinned in requirements.txt) returns dict hits; update
+    # them in place so callers keep getting the same hit type as an
+    # unquantized search.
+    for hit, score in zip(kept, scores):
+        hit["distance"] = float(score)
+        if include_vectors:
+            hit["entity"]["embedding"] = list(vectors[str(hit.id)])
+    kept.sort(key=lambda h: h.distance, reverse=True)
+    return kept[:top_k]
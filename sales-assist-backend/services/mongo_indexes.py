@@ -0,0 +1,161 @@
+from __future__ import annotations
+
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from logger import enhanced_logger
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    unique: bool = False
+
+
+@dataclass(frozen=True)
+class QueryShape:
+    """
+    A query a service issues, with placeholder values, for plan checks.
+    """
+    name: str
+    collection: str
+    filter: Dict[str, Any]
+    sort: Optional[Tuple[Tuple[str, int], ...]] = None
+    projection: Optional[Dict[str, Any]] = None
+    # Only for collections that are small by construction and read whole.
+    allow_collscan: bool = False
+    notes: str = ""
+
+
+# Every index the services rely on. Created at startup by ensure_indexes().
+INDEXES: Tuple[IndexSpec, ...] = (
+    IndexSpec("sessions", (("session_id", ASCENDING),), unique=True),
+    IndexSpec("sessions", (("user_id", ASCENDING), ("is_active", ASCENDING))),
+    IndexSpec("chat_history", (("session_id", ASCENDING), ("domain", ASCENDING))),
+    IndexSpec("chat_history_buckets", (("session_id", ASCENDING), ("domain", ASCENDING), ("seq", ASCENDING)), unique=True),
+    IndexSpec("chat_summaries", (("session_id", ASCENDING), ("domain", ASCENDING)), unique=True),
+    IndexSpec("files", (("file_hash", ASCENDING), ("domain", ASCENDING))),
+    IndexSpec("files", (("domain", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING))),
+    IndexSpec(
+        "files",
+        (("domain", ASCENDING), ("processing_status", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)),
+    ),
+    IndexSpec("files", (("created_at", DESCENDING), ("_id", DESCENDING))),
+    IndexSpec("chunks", (("chunk_id", ASCENDING),)),
+    IndexSpec("chunks", (("file_id", ASCENDING), ("chunk_index", ASCENDING))),
+    IndexSpec("chunks", (("domain", ASCENDING),)),
+    IndexSpec("chunk_dictionaries", (("dict_id", ASCENDING),), unique=True),
+    IndexSpec("chunk_dictionaries", (("created_at", ASCENDING),)),
+    IndexSpec("keyword_postings", (("term", ASCENDING), ("domain", ASCENDING), ("tf", DESCENDING))),
+    IndexSpec("keyword_postings", (("file_id", ASCENDING),)),
+    IndexSpec("keyword_terms", (("domain", ASCENDING), ("term", ASCENDING)), unique=True),
+    IndexSpec("keyword_stats", (("domain", ASCENDING),), unique=True),
+    IndexSpec("file_centroids", (("file_id", ASCENDING),), unique=True),
+    IndexSpec("file_centroids", (("domain", ASCENDING),)),
+    IndexSpec("domain_centroids", (("domain", ASCENDING),), unique=True),
+    IndexSpec("domain_versions", (("domain", ASCENDING),), unique=True),
+    IndexSpec("kb_stats", (("domain", ASCENDING),), unique=True),
+)
+
+
+_FILE_PAGE_SORT = (("created_at", DESCENDING), ("_id", DESCENDING))
+
+# The filters services send, checked by scripts/check_query_plans.py.
+QUERY_SHAPES: Tuple[QueryShape, ...] = (
+    QueryShape("get_session", "sessions", {"session_id": "s"}),
+    QueryShape("chat_history_header", "chat_history", {"session_id": "s", "domain": "it"}),
+    QueryShape(
+        "chat_history_tail",
+        "chat_history_buckets",
+        {"session_id": "s", "domain": "it", "seq": {"$gte": 0}},
+        sort=(("seq", DESCENDING),),
+    ),
+    QueryShape(
+        "chat_history_range",
+        "chat_history_buckets",
+        {"session_id": "s", "domain": "it", "seq": {"$gte": 0, "$lte": 2}},
+        sort=(("seq", ASCENDING),),
+    ),
+    QueryShape("get_chat_summary", "chat_summaries", {"session_id": "s", "domain": "it"}),
+    QueryShape("get_file", "files", {"_id": ObjectId("000000000000000000000000")}),
+    QueryShape("find_file_by_hash", "files", {"file_hash": "h", "domain": "it"}),
+    QueryShape("find_file_by_hash_any_domain", "files", {"file_hash": "h"}),
+    QueryShape("list_files_domain", "files", {"domain": "it"}, sort=_FILE_PAGE_SORT),
+    QueryShape(
+        "list_files_domain_status",
+        "files",
+        {"domain": "it", "processing_status": "completed"},
+        sort=_FILE_PAGE_SORT,
+    ),
+    QueryShape(
+        "list_files_next_page",
+        "files",
+        {
+            "domain": "it",
+            "$or": [
+                {"created_at": {"$lt": datetime(2024, 1, 1)}},
+                {"created_at": datetime(2024, 1, 1), "_id": {"$lt": ObjectId("000000000000000000000000")}},
+            ],
+        },
+        sort=_FILE_PAGE_SORT,
+    ),
+    QueryShape("list_files_all", "files", {}, sort=_FILE_PAGE_SORT),
+    QueryShape("get_chunks_by_ids", "chunks", {"chunk_id": {"$in": ["f:0", "f:1"]}}),
+    QueryShape("chunks_for_file", "chunks", {"file_id": "f"}, notes="delete_chunks_for_file, count_chunks_for_file"),
+    QueryShape(
+        "get_chunk_windows",
+        "chunks",
+        {"$or": [{"file_id": "f", "chunk_index": {"$gte": 0, "$lte": 3}}]},
+    ),
+    QueryShape("chunks_for_domain", "chunks", {"domain": "it"}, notes="scripts/compress_chunks.py"),
+    QueryShape("chunk_dictionary", "chunk_dictionaries", {"dict_id": 1}),
+    QueryShape(
+        "chunk_dictionaries_all",
+        "chunk_dictionaries",
+        {},
+        sort=(("created_at", ASCENDING),),
+    ),
+    QueryShape(
+        "keyword_postings_search",
+        "keyword_postings",
+        {"term": "a", "domain": {"$in": ["it"]}},
+        sort=(("tf", DESCENDING),),
+    ),
+    QueryShape("keyword_postings_for_file", "keyword_postings", {"file_id": "f"}),
+    QueryShape("keyword_terms_df", "keyword_terms", {"domain": {"$in": ["it"]}, "term": {"$in": ["a"]}}),
+    QueryShape(
+        "keyword_terms_prune",
+        "keyword_terms",
+        {"domain": "it", "term": {"$in": ["a"]}, "df": {"$lte": 0}},
+    ),
+    QueryShape("keyword_stats", "keyword_stats", {"domain": {"$in": ["it"]}}),
+    QueryShape("file_centroids_domain", "file_centroids", {"domain": "it"}),
+    QueryShape("file_centroids_file", "file_centroids", {"file_id": "f"}),
+    QueryShape("domain_centroids_all", "domain_centroids", {}, allow_collscan=True, notes="one document per domain"),
+    QueryShape("domain_versions", "domain_versions", {"domain": {"$in": ["it"]}}),
+    QueryShape("kb_stats_domain", "kb_stats", {"domain": "it"}),
+    QueryShape("kb_stats_all", "kb_stats", {}, allow_collscan=True, notes="one document per domain"),
+)
+
+
+async def ensure_indexes(db) -> int:
+    """
+    Create every registered index (a no-op for ones that already exist).
+    Returns how many index specs were submitted.
+    """
+    by_collection: Dict[str, List[IndexModel]] = defaultdict(list)
+    for spec in INDEXES:
+        by_collection[spec.collection].append(IndexModel(list(spec.keys), unique=spec.unique))
+    for collection, models in by_collection.items():
+        await db[collection].create_indexes(models)
+    enhanced_logger.info(
+        "MONGO_INDEXES_ENSURED",
+        extra_data={"collections": len(by_collection), "indexes": len(INDEXES)},
+    )
+    return len(INDEXES)
@@ -1,12 +1,25 @@
 from __future__ import annotations
 
+import asyncio
+import base64
+from dataclasses import dataclass
 from datetime import datetime
+import os
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 
 from logger import enhanced_logger
+from rag.tokenizer import count_tokens
+from services import session_cache
+from services.chunk_compression import decode_chunk_docs, encode_chunk_docs
+from services.kb_stats_service import record_file_added, record_status_change
+from services.chunk_text_store import fill_token, get_texts, invalidate_file, put_chunks, sync_domain_versions
+from services.mongo_indexes import ensure_indexes as ensure_registered_indexes
 from utils.database import get_database
 
 
@@ -22,9 +35,7 @@ def get_db():
 
 
 async def ensure_indexes() -> None:
-    db = get_db()
-    await db["chat_history"].create_index([("session_id", 1), ("domain", 1)])
-    await db["sessions"].create_index([("user_id", 1), ("is_active", 1)])
+    await ensure_registered_indexes(get_db())
 
 
 async def insert_file_metadata(
@@ -48,6 +59,7 @@ async def insert_file_metadata(
         doc["file_hash"] = file_hash
 
     result = await db["files"].insert_one(doc)
+    await record_file_added(domain, doc["processing_status"])
     return str(result.inserted_id)
 
 
@@ -64,10 +76,14 @@ async def update_file_status(
     if extra_fields:
         update_doc.update(extra_fields)
 
-    await db["files"].update_one(
+    previous = await db["files"].find_one_and_update(
         {"_id": _to_object_id(file_id)},
         {"$set": update_doc},
+        projection={"domain": 1, "processing_status": 1},
+        return_document=ReturnDocument.BEFORE,
     )
+    if previous:
+        await record_status_change(previous.get("domain", ""), previous.get("processing_status"), status)
 
 
 async def get_file(file_id: str) -> Optional[Dict[str, Any]]:
@@ -79,7 +95,9 @@ async def insert_chunks(chunk_docs: List[Dict[str, Any]]) -> None:
     if not chunk_docs:
         return
     db = get_db()
-    await db["chunks"].insert_many(chunk_docs)
+    # Insert copies: callers keep using chunk_docs (with plain text) afterwards.
+    await db["chunks"].insert_many(await encode_chunk_docs(chunk_docs))
+    put_chunks(chunk_docs)
     enhanced_logger.debug(
         "MONGO_CHUNKS_INSERTED",
         extra_data={"count": len(chunk_docs)},
@@ -87,6 +105,7 @@ async def insert_chunks(chunk_docs: List[Dict[str, Any]]) -> None:
 
 
 async def delete_chunks_for_file(file_id: str) -> int:
+    invalidate_file(file_id)
     db = get_db()
     result = await db["chunks"].delete_many({"file_id": file_id})
     return int(result.deleted_count)
@@ -105,27 +124,143 @@ async def get_chunks_by_ids(chunk_ids: List[str]) -> Dict[str, Dict[str, Any]]:
     results: Dict[str, Dict[str, Any]] = {}
     async for doc in cursor:
         results[doc["chunk_id"]] = doc
+    await decode_chunk_docs(results.values())
     return results
 
 
-async def list_files(domain: Optional[str] = None) -> List[Dict[str, Any]]:
+_chunk_versions_checked_at = 0.0
+
+
+async def _sync_chunk_text_versions() -> None:
+    """
+    Pick up re-ingests done by other workers: at most every
+    CHUNK_TEXT_CACHE_VERSION_CHECK_SECONDS, compare domain data versions and
+    drop cached chunk text for domains that moved on.
+    """
+    global _chunk_versions_checked_at
+    interval = float(os.getenv("CHUNK_TEXT_CACHE_VERSION_CHECK_SECONDS", "5"))
+    if time.time() - _chunk_versions_checked_at < interval:
+        return
+    _chunk_versions_checked_at = time.time()
+    db = get_db()
+    versions: Dict[str, int] = {}
+    async for doc in db["domain_versions"].find({}, {"_id": 0, "domain": 1, "version": 1}):
+        versions[doc["domain"]] = int(doc.get("version", 0))
+    sync_domain_versions(versions)
+
+
+async def get_chunk_texts(chunk_ids: List[str]) -> Dict[str, str]:
+    """
+    chunk_id -> text, served from the in-process chunk text store and only
+    going to Mongo for misses (which are then cached).
+    """
+    if not chunk_ids:
+        return {}
+    await _sync_chunk_text_versions()
+    token = fill_token()
+    texts, missing = get_texts(chunk_ids)
+    if missing:
+        db = get_db()
+        cursor = db["chunks"].find(
+            {"chunk_id": {"$in": missing}},
+            {"_id": 0, "chunk_id": 1, "file_id": 1, "domain": 1, "text": 1, "text_z": 1},
+        )
+        fetched = [doc async for doc in cursor]
+        await decode_chunk_docs(fetched)
+        for doc in fetched:
+            texts[doc["chunk_id"]] = doc.get("text", "")
+        put_chunks(fetched, since=token)
+    return texts
+
+
+async def get_chunk_windows(windows: Dict[str, List[Tuple[int, int]]]) -> List[Dict[str, Any]]:
+    """
+    Fetch every chunk whose chunk_index falls in one of the inclusive
+    (start, end) ranges, per file_id, with a single query on (file_id, chunk_index).
+    """
+    clauses = [
+        {"file_id": file_id, "chunk_index": {"$gte": start, "$lte": end}}
+        for file_id, ranges in windows.items()
+        for start, end in ranges
+    ]
+    if not clauses:
+        return []
+    token = fill_token()
+    db = get_db()
+    cursor = db["chunks"].find(
+        {"$or": clauses},
+        {"_id": 0, "chunk_id": 1, "file_id": 1, "domain": 1, "chunk_index": 1, "text": 1, "text_z": 1},
+    )
+    docs = [doc async for doc in cursor]
+    await decode_chunk_docs(docs)
+    put_chunks(docs, since=token)
+    return docs
+
+
+_FILE_LIST_PROJECTION = {"_id": 1, "filename": 1, "created_at": 1, "processing_status": 1, "domain": 1}
+
+
+def encode_file_cursor(created_at: datetime, file_id: ObjectId) -> str:
+    raw = f"{created_at.isoformat()}|{file_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_file_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, file_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), ObjectId(file_id)
+    except Exception as exc:
+        raise ValueError(f"Invalid cursor: {cursor}") from exc
+
+
+async def list_files(
+    domain: Optional[str] = None,
+    status: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Newest files first, one page at a time. Keyset pagination on
+    (created_at, _id), so each page is an index range scan regardless of how
+    many files precede it. Returns (files, next_cursor).
+    """
     db = get_db()
+    limit = max(1, int(limit))
     query: Dict[str, Any] = {}
     if domain:
         query["domain"] = domain
-    cursor = db["files"].find(query).sort("created_at", -1)
-    results: List[Dict[str, Any]] = []
-    async for doc in cursor:
-        results.append(
-            {
-                "file_id": str(doc["_id"]),
-                "filename": doc.get("filename"),
-                "created_at": doc.get("created_at"),
-                "processing_status": doc.get("processing_status"),
-                "domain": doc.get("domain"),
-            }
-        )
-    return results
+    if status:
+        query["processing_status"] = status
+    if cursor:
+        created_at, last_id = decode_file_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": last_id}},
+        ]
+    docs = await (
+        db["files"]
+        .find(query, _FILE_LIST_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+        .to_list(length=limit + 1)
+    )
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        last = docs[-1]
+        next_cursor = encode_file_cursor(last["created_at"], last["_id"])
+    results = [
+        {
+            "file_id": str(doc["_id"]),
+            "filename": doc.get("filename"),
+            "created_at": doc.get("created_at"),
+            "processing_status": doc.get("processing_status"),
+            "domain": doc.get("domain"),
+        }
+        for doc in docs
+    ]
+    return results, next_cursor
 
 
 async def find_file_by_hash(file_hash: str, domain: Optional[str] = None) -> Optional[Dict[str, Any]]:
@@ -151,42 +286,496 @@ async def create_session(user_id: str) -> str:
 
 
 async def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    cached = session_cache.get_session(session_id)
+    if cached is not None:
+        return cached
     db = get_db()
-    return await db["sessions"].find_one({"session_id": session_id})
+    doc = await db["sessions"].find_one({"session_id": session_id})
+    if doc:
+        session_cache.put_session(doc)
+    return doc
 
 
 async def end_session(session_id: str) -> None:
     db = get_db()
-    await db["sessions"].update_one(
+    update: Dict[str, Any] = {"$set": {"is_active": False, "ended_at": datetime.utcnow()}}
+    if session_cache.versioned():
+        update["$inc"] = {"cache_version": 1}
+    await db["sessions"].update_one({"session_id": session_id}, update)
+    session_cache.invalidate_session(session_id)
+
+
+async def _bump_session_version(session_id: str) -> Optional[int]:
+    # Lets other workers notice that their cached history is out of date.
+    if not session_cache.versioned():
+        return None
+    db = get_db()
+    doc = await db["sessions"].find_one_and_update(
         {"session_id": session_id},
-        {"$set": {"is_active": False, "ended_at": datetime.utcnow()}},
+        {"$inc": {"cache_version": 1}},
+        projection={"cache_version": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return int(doc.get("cache_version") or 0) if doc else None
+
+
+def _history_bucket_size() -> int:
+    return max(1, int(os.getenv("CHAT_HISTORY_BUCKET_SIZE", "50")))
+
+
+@dataclass
+class ChatWrite:
+    """
+    Messages bound for one (session, domain) history. first_index is set
+    once header indexes have been reserved, so a retried write keeps its
+    place in the conversation.
+    """
+    session_id: str
+    domain: str
+    messages: List[Dict[str, Any]]
+    first_index: Optional[int] = None
+
+
+def stamp_chat_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [dict(msg, tokens=count_tokens(msg.get("content", ""))) for msg in messages]
+
+
+def _bucket_ops(write: ChatWrite, now: datetime) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+    bucket_size = _history_bucket_size()
+    by_bucket: Dict[int, List[Dict[str, Any]]] = {}
+    for offset, msg in enumerate(write.messages):
+        index = int(write.first_index or 0) + offset
+        msg["index"] = index
+        by_bucket.setdefault(index // bucket_size, []).append(msg)
+    ops: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for seq, bucket_messages in sorted(by_bucket.items()):
+        ops.append(
+            (
+                {
+                    "session_id": write.session_id,
+                    "domain": write.domain,
+                    "seq": seq,
+                    # Already pushed by an earlier attempt: the filter misses
+                    # and the upsert hits the unique index instead of pushing twice.
+                    "messages.index": {"$ne": bucket_messages[0]["index"]},
+                },
+                {
+                    "$setOnInsert": {"created_at": now},
+                    "$push": {"messages": {"$each": bucket_messages}},
+                    "$inc": {
+                        "count": len(bucket_messages),
+                        "tokens": sum(msg["tokens"] for msg in bucket_messages),
+                    },
+                },
+            )
+        )
+    return ops
+
+
+async def _settle_bucket_conflict(query: Dict[str, Any], update: Dict[str, Any]) -> None:
+    """
+    A bucket upsert hit the unique (session_id, domain, seq) index. Either an
+    earlier attempt already pushed these messages, or another writer created
+    the same bucket first and our messages still need pushing. Push into the
+    existing bucket, and accept the conflict only once the messages are there.
+    """
+    collection = get_db()["chat_history_buckets"]
+    push = {op: value for op, value in update.items() if op != "$setOnInsert"}
+    stored_query = {
+        "session_id": query["session_id"],
+        "domain": query["domain"],
+        "seq": query["seq"],
+        "messages.index": query["messages.index"]["$ne"],
+    }
+    for _ in range(3):
+        result = await collection.update_one(query, push)
+        if result.matched_count:
+            return
+        if await collection.find_one(stored_query, {"_id": 1}):
+            return
+        # Neither pushed nor stored: the bucket went away in between.
+        try:
+            await collection.update_one(query, update, upsert=True)
+            return
+        except DuplicateKeyError:
+            continue
+    raise RuntimeError(
+        f"chat history bucket {query['session_id']}/{query['domain']}/{query['seq']} kept conflicting"
     )
 
 
+async def _apply_bucket_ops(ops: List[Tuple[Dict[str, Any], Dict[str, Any]]]) -> None:
+    if not ops:
+        return
+    db = get_db()
+    try:
+        await db["chat_history_buckets"].bulk_write(
+            [UpdateOne(query, update, upsert=True) for query, update in ops],
+            ordered=False,
+        )
+    except BulkWriteError as exc:
+        errors = exc.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        for err in errors:
+            await _settle_bucket_conflict(*ops[err["index"]])
+
+
+async def _reserve_indexes(write: ChatWrite, now: datetime) -> None:
+    """
+    Atomically claim the next len(messages) indexes on the header. The
+    counter is read back from the same update, so concurrent writers never
+    share a range; first_index is recorded before anything else can fail.
+    """
+    db = get_db()
+    header = await db["chat_history"].find_one_and_update(
+        {"session_id": write.session_id, "domain": write.domain},
+        {
+            "$setOnInsert": {"created_at": now},
+            "$set": {"updated_at": now},
+            "$inc": {
+                "message_count": len(write.messages),
+                "total_tokens": sum(msg["tokens"] for msg in write.messages),
+            },
+        },
+        projection={"message_count": 1, "messages": {"$slice": 0}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    write.first_index = int(header.get("message_count", len(write.messages))) - len(write.messages)
+    if "messages" in header:
+        write.first_index += await _migrate_legacy_history(write.session_id, write.domain)
+
+
 async def append_chat_messages(
     session_id: str,
     domain: str,
     messages: List[Dict[str, Any]],
 ) -> None:
+    """
+    Append to the bucketed history. The header document reserves a
+    contiguous range of message indexes and keeps running counts; each
+    message lands in bucket index // CHAT_HISTORY_BUCKET_SIZE with its
+    token count stored next to it.
+    """
     if not messages:
         return
+    write = ChatWrite(session_id, domain, stamp_chat_messages(messages))
+    now = datetime.utcnow()
+    await _reserve_indexes(write, now)
+    await _apply_bucket_ops(_bucket_ops(write, now))
+    session_cache.advance_version(session_id, await _bump_session_version(session_id))
+    session_cache.append_tail(session_id, domain, write.messages, write.first_index + len(write.messages))
+
+
+async def write_chat_batch(writes: List[ChatWrite]) -> None:
+    """
+    Persist queued writes: index reservations run concurrently (one
+    find_one_and_update per write), then one bulk_write of bucket pushes.
+    Writes whose indexes were reserved by an earlier attempt keep them, so
+    a retry never claims a second range.
+    """
+    if not writes:
+        return
     db = get_db()
+    now = datetime.utcnow()
+    fresh = [w for w in writes if w.first_index is None]
+    if fresh:
+        # Let every reservation settle (and record its first_index) before
+        # surfacing a failure, so none is lost between attempts.
+        results = await asyncio.gather(*(_reserve_indexes(w, now) for w in fresh), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+
+    ops: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+    for w in writes:
+        ops.extend(_bucket_ops(w, now))
+    await _apply_bucket_ops(ops)
+
+    session_ids = sorted({w.session_id for w in writes})
+    versions: Dict[str, Optional[int]] = {sid: None for sid in session_ids}
+    if session_cache.versioned():
+        await db["sessions"].bulk_write(
+            [UpdateOne({"session_id": sid}, {"$inc": {"cache_version": 1}}) for sid in session_ids],
+            ordered=False,
+        )
+        async for doc in db["sessions"].find({"session_id": {"$in": session_ids}}, {"session_id": 1, "cache_version": 1}):
+            versions[doc["session_id"]] = int(doc.get("cache_version") or 0)
+    for sid in session_ids:
+        session_cache.advance_version(sid, versions[sid])
+    for w in writes:
+        session_cache.append_tail(
+            w.session_id, w.domain, w.messages, int(w.first_index or 0) + len(w.messages)
+        )
+
+
+async def _legacy_history(
+    session_id: str,
+    domain: str,
+    slice_spec: Any = None,
+) -> Optional[List[Dict[str, Any]]]:
+    # Histories written before bucketing keep their messages on the header.
+    db = get_db()
+    projection = {"messages": 1 if slice_spec is None else {"$slice": slice_spec}}
+    doc = await db["chat_history"].find_one(
+        {"session_id": session_id, "domain": domain, "messages": {"$exists": True}},
+        projection,
+    )
+    if doc is None:
+        return None
+    return list(doc.get("messages") or [])
+
+
+async def _migrate_legacy_history(session_id: str, domain: str) -> int:
+    """
+    Move a pre-bucketing messages array into buckets ahead of anything
+    appended since. Returns how many messages were moved.
+    """
+    db = get_db()
+    legacy = await _legacy_history(session_id, domain) or []
+    bucket_size = _history_bucket_size()
+    stamped = [dict(msg, tokens=_message_tokens(msg), index=idx) for idx, msg in enumerate(legacy)]
+    for start in range(0, len(stamped), bucket_size):
+        bucket_messages = stamped[start:start + bucket_size]
+        await db["chat_history_buckets"].update_one(
+            {"session_id": session_id, "domain": domain, "seq": start // bucket_size},
+            {
+                "$setOnInsert": {"created_at": datetime.utcnow()},
+                "$push": {"messages": {"$each": bucket_messages}},
+                "$inc": {
+                    "count": len(bucket_messages),
+                    "tokens": sum(msg["tokens"] for msg in bucket_messages),
+                },
+            },
+            upsert=True,
+        )
     await db["chat_history"].update_one(
         {"session_id": session_id, "domain": domain},
         {
-            "$setOnInsert": {"created_at": datetime.utcnow()},
-            "$set": {"updated_at": datetime.utcnow()},
-            "$push": {"messages": {"$each": messages}},
+            "$unset": {"messages": ""},
+            "$inc": {
+                "message_count": len(stamped),
+                "total_tokens": sum(msg["tokens"] for msg in stamped),
+            },
         },
-        upsert=True,
     )
+    enhanced_logger.info(
+        "CHAT_HISTORY_MIGRATED",
+        extra_data={"session_id": session_id, "domain": domain, "messages": len(stamped)},
+    )
+    return len(stamped)
+
 
+def _message_tokens(message: Dict[str, Any]) -> int:
+    tokens = message.get("tokens")
+    return int(tokens) if tokens is not None else count_tokens(message.get("content", ""))
 
-async def get_chat_history(session_id: str, domain: str) -> List[Dict[str, Any]]:
+
+async def get_chat_history(
+    session_id: str,
+    domain: str,
+    max_tokens: Optional[int] = None,
+    since_index: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Newest-first walk over the history buckets, stopping once max_tokens
+    worth of messages has been collected or since_index is reached.
+    Returns messages oldest first. With neither bound the whole history is
+    returned.
+    """
+    cached = session_cache.get_tail(session_id, domain, max_tokens, since_index)
+    if cached is not None:
+        return cached
     db = get_db()
-    doc = await db["chat_history"].find_one(
-        {"session_id": session_id, "domain": domain}
+    tail: List[Dict[str, Any]] = []
+    used = 0
+    query: Dict[str, Any] = {"session_id": session_id, "domain": domain}
+    if since_index:
+        query["seq"] = {"$gte": int(since_index) // _history_bucket_size()}
+    cursor = db["chat_history_buckets"].find(query, {"_id": 0, "messages": 1}).sort("seq", -1).batch_size(2)
+    found_buckets = False
+    async for bucket in cursor:
+        found_buckets = True
+        for message in sorted(bucket.get("messages") or [], key=lambda m: m.get("index", 0), reverse=True):
+            if since_index and message.get("index", 0) < since_index:
+                break
+            if max_tokens is not None and max_tokens > 0:
+                used += _message_tokens(message)
+                if used > max_tokens and tail:
+                    tail.reverse()
+                    session_cache.put_tail(session_id, domain, tail, complete=False)
+                    return tail
+            tail.append(message)
+    if found_buckets:
+        tail.reverse()
+        session_cache.put_tail(session_id, domain, tail, complete=not since_index)
+        return tail
+
+    slice_spec = None
+    if max_tokens is not None and max_tokens > 0:
+        slice_spec = -int(os.getenv("CHAT_HISTORY_LEGACY_TAIL", "200"))
+    legacy = await _legacy_history(session_id, domain, slice_spec)
+    if not legacy:
+        if legacy is None and not since_index:
+            # Nothing stored yet; remember that so the first turns skip the read.
+            session_cache.put_tail(session_id, domain, [], complete=True)
+        return []
+    for message in reversed(legacy):
+        if max_tokens is not None and max_tokens > 0:
+            used += _message_tokens(message)
+            if used > max_tokens and tail:
+                break
+        tail.append(message)
+    tail.reverse()
+    return tail
+
+
+async def get_chat_history_page(
+    session_id: str,
+    domain: str,
+    before: Optional[int] = None,
+    limit: int = 50,
+) -> Tuple[List[Dict[str, Any]], Optional[int]]:
+    """
+    One page of history ending just before message index `before` (the
+    newest page when omitted). Returns (messages oldest first, next_cursor);
+    next_cursor is None once the start of the conversation is reached.
+    """
+    cached = session_cache.get_page(session_id, domain, before, limit)
+    if cached is not None:
+        return cached
+    db = get_db()
+    limit = max(1, int(limit))
+    header = await db["chat_history"].find_one(
+        {"session_id": session_id, "domain": domain},
+        {"message_count": 1, "messages": {"$slice": 0}},
     )
-    if not doc:
+    if header is None:
+        return [], None
+
+    if "message_count" not in header:
+        # Legacy single-document history: page with $slice [skip, limit].
+        size_doc = await db["chat_history"].aggregate(
+            [
+                {"$match": {"session_id": session_id, "domain": domain}},
+                {"$project": {"size": {"$size": {"$ifNull": ["$messages", []]}}}},
+            ]
+        ).to_list(length=1)
+        total = int(size_doc[0]["size"]) if size_doc else 0
+        end = total if before is None else max(0, min(int(before), total))
+        start = max(0, end - limit)
+        if end <= start:
+            return [], None
+        page = await _legacy_history(session_id, domain, [start, end - start]) or []
+        return page, (start if start > 0 else None)
+
+    total = int(header.get("message_count") or 0)
+    end = total if before is None else max(0, min(int(before), total))
+    start = max(0, end - limit)
+    if end <= start:
+        return [], None
+    page = await get_chat_messages_range(session_id, domain, start, end)
+    return page, (start if start > 0 else None)
+
+
+async def get_chat_messages_range(
+    session_id: str,
+    domain: str,
+    start: int,
+    end: int,
+) -> List[Dict[str, Any]]:
+    """
+    Bucketed messages with start <= index < end, oldest first.
+    """
+    if end <= start:
         return []
-    return list(doc.get("messages") or [])
+    db = get_db()
+    bucket_size = _history_bucket_size()
+    messages: List[Dict[str, Any]] = []
+    cursor = db["chat_history_buckets"].find(
+        {
+            "session_id": session_id,
+            "domain": domain,
+            "seq": {"$gte": start // bucket_size, "$lte": (end - 1) // bucket_size},
+        },
+        {"_id": 0, "messages": 1},
+    ).sort("seq", 1)
+    async for bucket in cursor:
+        messages.extend(m for m in bucket.get("messages") or [] if start <= m.get("index", -1) < end)
+    messages.sort(key=lambda m: m["index"])
+    return messages
+
+
+async def get_chat_message_count(session_id: str, domain: str) -> int:
+    cached = session_cache.get_message_count(session_id, domain)
+    if cached is not None:
+        return cached
+    db = get_db()
+    header = await db["chat_history"].find_one(
+        {"session_id": session_id, "domain": domain},
+        {"message_count": 1},
+    )
+    return int((header or {}).get("message_count") or 0)
+
+
+async def get_chat_summary(session_id: str, domain: str) -> Optional[Dict[str, Any]]:
+    hit, cached = session_cache.get_summary(session_id, domain)
+    if hit:
+        return cached
+    db = get_db()
+    doc = await db["chat_summaries"].find_one(
+        {"session_id": session_id, "domain": domain},
+        {"_id": 0},
+    )
+    session_cache.put_summary(session_id, domain, doc)
+    return doc
+
+
+async def save_chat_summary(
+    session_id: str,
+    domain: str,
+    summary: str,
+    covered_until: int,
+    tokens: int,
+) -> bool:
+    """
+    Store a summary of messages [0, covered_until). A summary never
+    replaces one that already covers more of the conversation.
+    """
+    db = get_db()
+    try:
+        result = await db["chat_summaries"].update_one(
+            {
+                "session_id": session_id,
+                "domain": domain,
+                "covered_until": {"$lt": int(covered_until)},
+            },
+            {
+                "$set": {
+                    "summary": summary,
+                    "covered_until": int(covered_until),
+                    "tokens": int(tokens),
+                    "updated_at": datetime.utcnow(),
+                },
+            },
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # A newer summary won the race; the upsert collided with it.
+        return False
+    saved = bool(result.upserted_id or result.modified_count)
+    if saved:
+        session_cache.advance_version(session_id, await _bump_session_version(session_id))
+        session_cache.put_summary(
+            session_id,
+            domain,
+            {
+                "session_id": session_id,
+                "domain": domain,
+                "summary": summary,
+                "covered_until": int(covered_until),
+                "tokens": int(tokens),
+            },
+        )
+    return saved
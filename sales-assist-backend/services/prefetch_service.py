@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from agents.domain_router import build_llm_history, complete_domain_response, get_system_prompt
+from logger import enhanced_logger
+from rag.retrieval_cache import get_versions_for_domain
+from rag.retrieve import retrieve_chunk_records
+from rag.session_context import remember_prefetch, remember_typeahead
+from services.embedding_service import embed_query_async
+from services.summary_service import load_history_context
+from services.token_budget_service import enforce_input_budget, load_token_budget
+
+
+_tasks: Dict[str, Set[asyncio.Task]] = {}
+_semaphore: Optional[asyncio.Semaphore] = None
+_llm_executor: Optional[ThreadPoolExecutor] = None
+
+# (session_id, domain, normalised question) ->
+#   (payload, records it was generated from, input tokens, last message timestamp, stored_at)
+_speculative: "OrderedDict[Tuple[str, str, str], Tuple[Dict[str, Any], List[Dict[str, Any]], int, Optional[float], float]]" = (
+    OrderedDict()
+)
+# session_id -> (speculative answers generated, last generated at)
+_speculative_spent: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+
+# session_id -> in-flight typeahead task / time of the last accepted request
+_typeahead_tasks: Dict[str, asyncio.Task] = {}
+_typeahead_last: "OrderedDict[str, float]" = OrderedDict()
+
+
+def _flag(name: str, default: str) -> bool:
+    return str(os.getenv(name, default)).lower() in {"1", "true", "yes", "on"}
+
+
+def prefetch_enabled() -> bool:
+    return _flag("PREFETCH_ENABLED", "true")
+
+
+def speculative_answers_enabled() -> bool:
+    return _flag("PREFETCH_SPECULATIVE_ANSWERS", "false")
+
+
+def _ttl_seconds() -> float:
+    return float(os.getenv("PREFETCH_TTL_SECONDS", "600"))
+
+
+def _session_idle_seconds() -> float:
+    return float(os.getenv("PREFETCH_SESSION_IDLE_SECONDS", "1800"))
+
+
+def _max_entries() -> int:
+    return int(os.getenv("PREFETCH_MAX_ENTRIES", "5000"))
+
+
+def _evict(entries: "OrderedDict[Any, Any]", stamp: Callable[[Any], float], max_age: float) -> None:
+    """
+    Entries are kept in last-touched order; drop from the old end while over
+    PREFETCH_MAX_ENTRIES or older than max_age, so sessions that are never
+    ended do not accumulate.
+    """
+    cutoff = time.time() - max_age
+    max_entries = _max_entries()
+    while entries and (len(entries) > max_entries or stamp(next(iter(entries.values()))) < cutoff):
+        entries.popitem(last=False)
+
+
+def _normalize_question(text: str) -> str:
+    return " ".join((text or "").lower().split()).rstrip("?.! ")
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    # Prefetch never takes more than this many slots away from live requests.
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(max(1, int(os.getenv("PREFETCH_CONCURRENCY", "1"))))
+    return _semaphore
+
+
+def _get_llm_executor() -> ThreadPoolExecutor:
+    global _llm_executor
+    if _llm_executor is None:
+        _llm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch-llm")
+    return _llm_executor
+
+
+def track_task(session_id: str, task: asyncio.Task) -> None:
+    """
+    Register background work for a session so /session/end can cancel it.
+    """
+    tasks = _tasks.setdefault(session_id, set())
+    tasks.add(task)
+
+    def _done(finished: asyncio.Task) -> None:
+        remaining = _tasks.get(session_id)
+        if remaining is not None:
+            remaining.discard(finished)
+            if not remaining:
+                _tasks.pop(session_id, None)
+
+    task.add_done_callback(_done)
+
+
+def schedule_follow_up_prefetch(
+    session_id: str,
+    domain: str,
+    file_ids: List[str],
+    follow_up_questions: List[str],
+    history_marker: Optional[float],
+    top_k: Optional[int] = None,
+    min_score: Optional[float] = None,
+) -> None:
+    if not prefetch_enabled() or not follow_up_questions:
+        return
+    # A new answer supersedes whatever was still being prefetched for the last one.
+    for stale in list(_tasks.get(session_id, ())):
+        if stale is not _typeahead_tasks.get(session_id):
+            stale.cancel()
+    task = asyncio.get_running_loop().create_task(
+        _prefetch_follow_ups(session_id, domain, file_ids, follow_up_questions, history_marker, top_k, min_score)
+    )
+    track_task(session_id, task)
+
+
+async def _prefetch_follow_ups(
+    session_id: str,
+    domain: str,
+    file_ids: List[str],
+    follow_up_questions: List[str],
+    history_marker: Optional[float],
+    top_k: Optional[int],
+    min_score: Optional[float],
+) -> None:
+    start = time.time()
+    speculated = 0
+    try:
+        # Let the response go out before competing for the embedding workers.
+        await asyncio.sleep(float(os.getenv("PREFETCH_DELAY_SECONDS", "0.2")))
+        for question in follow_up_questions:
+            async with _get_semaphore():
+                versions = await get_versions_for_domain(domain)
+                records = await retrieve_chunk_records(
+                    query=question,
+                    file_ids=file_ids,
+                    domain=domain,
+                    top_k=top_k,
+                    min_score=min_score,
+                )
+                embedding = await embed_query_async(question)
+            remember_prefetch(session_id, domain, question, file_ids, embedding, records, versions)
+
+            if speculative_answers_enabled() and _reserve_speculation(session_id):
+                async with _get_semaphore():
+                    payload, used_records, tokens_input = await _speculate(session_id, domain, question, records)
+                key = (session_id, domain, _normalize_question(question))
+                _speculative[key] = (payload, used_records, tokens_input, history_marker, time.time())
+                _speculative.move_to_end(key)
+                _evict(_speculative, lambda entry: entry[4], _ttl_seconds())
+                speculated += 1
+    except asyncio.CancelledError:
+        enhanced_logger.debug("PREFETCH_CANCELLED", extra_data={"session_id": session_id, "domain": domain})
+        raise
+    except Exception as exc:
+        enhanced_logger.warning(
+            "PREFETCH_FAILED",
+            extra_data={"session_id": session_id, "domain": domain, "error": str(exc)},
+        )
+        return
+    enhanced_logger.debug(
+        "PREFETCH_COMPLETED",
+        extra_data={
+            "session_id": session_id,
+            "domain": domain,
+            "questions": len(follow_up_questions),
+            "speculative_answers": speculated,
+            "latency_ms": round((time.time() - start) * 1000.0, 2),
+        },
+    )
+
+
+def schedule_typeahead_prefetch(
+    session_id: str,
+    domain: str,
+    file_ids: List[str],
+    partial_message: str,
+    top_k: Optional[int] = None,
+    min_score: Optional[float] = None,
+) -> str:
+    """
+    Warm retrieval for a message that is still being typed. Returns
+    "scheduled", "rate_limited" or "skipped". A newer request cancels the
+    one in flight for the same session.
+    """
+    if not prefetch_enabled():
+        return "skipped"
+    if len((partial_message or "").strip()) < int(os.getenv("TYPEAHEAD_MIN_CHARS", "12")):
+        return "skipped"
+    now = time.time()
+    min_interval = float(os.getenv("TYPEAHEAD_MIN_INTERVAL_SECONDS", "0.5"))
+    if now - _typeahead_last.get(session_id, 0.0) < min_interval:
+        return "rate_limited"
+    _typeahead_last[session_id] = now
+    _typeahead_last.move_to_end(session_id)
+    _evict(_typeahead_last, lambda last: last, _session_idle_seconds())
+
+    previous = _typeahead_tasks.pop(session_id, None)
+    if previous is not None and not previous.done():
+        previous.cancel()
+    task = asyncio.get_running_loop().create_task(
+        _prefetch_typeahead(session_id, domain, file_ids, partial_message, top_k, min_score)
+    )
+    _typeahead_tasks[session_id] = task
+    track_task(session_id, task)
+    return "scheduled"
+
+
+async def _prefetch_typeahead(
+    session_id: str,
+    domain: str,
+    file_ids: List[str],
+    partial_message: str,
+    top_k: Optional[int],
+    min_score: Optional[float],
+) -> None:
+    try:
+        async with _get_semaphore():
+            versions = await get_versions_for_domain(domain)
+            records = await retrieve_chunk_records(
+                query=partial_message,
+                file_ids=file_ids,
+                domain=domain,
+                top_k=top_k,
+                min_score=min_score,
+            )
+            embedding = await embed_query_async(partial_message)
+        remember_typeahead(session_id, domain, file_ids, embedding, records, versions, query=partial_message)
+    except asyncio.CancelledError:
+        raise
+    except Exception as exc:
+        enhanced_logger.warning(
+            "TYPEAHEAD_PREFETCH_FAILED",
+            extra_data={"session_id": session_id, "domain": domain, "error": str(exc)},
+        )
+    finally:
+        if _typeahead_tasks.get(session_id) is asyncio.current_task():
+            _typeahead_tasks.pop(session_id, None)
+
+
+def _reserve_speculation(session_id: str) -> bool:
+    budget = int(os.getenv("PREFETCH_SPECULATIVE_BUDGET", "4"))
+    spent, _last = _speculative_spent.get(session_id, (0, 0.0))
+    if spent >= budget:
+        return False
+    _speculative_spent[session_id] = (spent + 1, time.time())
+    _speculative_spent.move_to_end(session_id)
+    _evict(_speculative_spent, lambda entry: entry[1], _session_idle_seconds())
+    return True
+
+
+async def _speculate(
+    session_id: str,
+    domain: str,
+    question: str,
+    records: List[Dict[str, Any]],
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], int]:
+    """
+    Generate an answer ahead of time. Returns it with the records that made
+    it into the prompt and the input token count, which /chat reports as
+    that turn's sources and usage.
+    """
+    budget = load_token_budget()
+    summary, stored_messages = await load_history_context(session_id, domain, budget.max_history_tokens)
+    history, records, usage = enforce_input_budget(
+        system_prompt=get_system_prompt(domain),
+        history=build_llm_history(stored_messages),
+        user_message=question,
+        rag_records=records,
+        budget=budget,
+        summary=summary,
+    )
+    rag_context = "\n\n".join(r.get("text", "") for r in records) if records else None
+    loop = asyncio.get_running_loop()
+    payload, _raw_text = await loop.run_in_executor(
+        _get_llm_executor(),
+        partial(
+            complete_domain_response,
+            domain,
+            question,
+            rag_context=rag_context,
+            history=history,
+            max_output_tokens=budget.max_output_tokens,
+            temperature=float(os.getenv("GEMINI_TEMPERATURE", "0.2")),
+            summary=summary,
+        ),
+    )
+    return payload, records, int(usage.get("total_tokens", 0))
+
+
+def pop_speculative_answer(
+    session_id: str,
+    domain: str,
+    message: str,
+    history_marker: Optional[float],
+) -> Optional[Tuple[Dict[str, Any], List[Dict[str, Any]], int]]:
+    """
+    A pre-generated answer for this exact follow-up, if it was produced
+    against the same conversation state, as (payload, records, input tokens).
+    """
+    entry = _speculative.pop((session_id, domain, _normalize_question(message)), None)
+    if entry is None:
+        return None
+    payload, records, tokens_input, expected_marker, stored_at = entry
+    if expected_marker != history_marker:
+        return None
+    if time.time() - stored_at > _ttl_seconds():
+        return None
+    return payload, records, tokens_input
+
+
+def cancel_session(session_id: str) -> int:
+    """
+    Cancel outstanding prefetch work and drop speculative answers for a session.
+    """
+    tasks = list(_tasks.pop(session_id, ()))
+    for task in tasks:
+        task.cancel()
+    for key in [key for key in _speculative if key[0] == session_id]:
+        _speculative.pop(key, None)
+    _speculative_spent.pop(session_id, None)
+    _typeahead_tasks.pop(session_id, None)
+    _typeahead_last.pop(session_id, None)
+    if tasks:
+        enhanced_logger.debug(
+            "PREFETCH_SESSION_CANCELLED",
+            extra_data={"session_id": session_id, "tasks": len(tasks)},
+        )
+    return len(tasks)
@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import os
+from typing import Tuple
+
+import numpy as np
+
+
+QUANTIZATION_MODES = {"none", "sq8", "binary"}
+
+# Popcount lookup for packed bit vectors (works on every NumPy version).
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def get_quantization_mode() -> str:
+    mode = os.getenv("VECTOR_QUANTIZATION", "none").strip().lower()
+    return mode if mode in QUANTIZATION_MODES else "none"
+
+
+def get_rescore_multiplier() -> int:
+    return max(1, int(os.getenv("VECTOR_RESCORE_MULTIPLIER", "4")))
+
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Symmetric per-vector int8 codes: v ~= codes * scale.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def int8_scores(codes: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    return (codes.astype(np.float32) @ np.asarray(query, dtype=np.float32)) * scales
+
+
+def binarize(vectors: np.ndarray) -> np.ndarray:
+    """
+    Sign bits packed 8 per byte (dim / 8 bytes per vector).
+    """
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    return np.packbits(vectors > 0, axis=1)
+
+
+def binary_scores(packed: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """
+    Negated Hamming distance between sign bits; higher is closer, ranking
+    the same as the number of agreeing bits.
+    """
+    query_bits = binarize(query)[0]
+    distance = _POPCOUNT[np.bitwise_xor(packed, query_bits)].sum(axis=1, dtype=np.int32)
+    return -distance.astype(np.float32)
+
+
+def rescore(query: np.ndarray, candidates: np.ndarray) -> np.ndarray:
+    """
+    Exact float32 inner product for the shortlisted candidates.
+    """
+    return np.asarray(candidates, dtype=np.float32) @ np.asarray(query, dtype=np.float32)
+
+
+def bytes_per_vector(dim: int, mode: str) -> int:
+    if mode == "sq8":
+        return dim + 4  # int8 codes + float32 scale
+    if mode == "binary":
+        return (dim + 7) // 8
+    return dim * 4
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import enhanced_logger
+
+
+_model: Optional[Any] = None
+_executor: Optional[ThreadPoolExecutor] = None
+# (query hash, chunk_id, chunk text hash) -> score; chunk_ids are reused on
+# re-ingest, so the text hash keeps scores for replaced text from matching.
+_score_cache: "OrderedDict[Tuple[str, str, str], float]" = OrderedDict()
+
+
+def rerank_enabled() -> bool:
+    flag = os.getenv("RERANK_ENABLED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def get_rerank_candidates(top_k: int) -> int:
+    return max(top_k, int(os.getenv("RERANK_CANDIDATES", "20")))
+
+
+def _load_model() -> Any:
+    # Imported here so sentence-transformers is only loaded with rerank on.
+    from sentence_transformers import CrossEncoder
+
+    model_name = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+    kwargs: Dict[str, Any] = {
+        "device": "cpu",
+        "max_length": int(os.getenv("RERANK_MAX_LENGTH", "512")),
+    }
+    backend = os.getenv("RERANK_BACKEND", "torch").strip().lower()
+    if backend == "onnx":
+        # Needs sentence-transformers>=4 with the onnx extra (optimum + onnxruntime).
+        kwargs["backend"] = "onnx"
+    return CrossEncoder(model_name, **kwargs)
+
+
+def get_rerank_model() -> Any:
+    """
+    Singleton model load to avoid per-request initialization.
+    """
+    global _model
+    if _model is None:
+        _model = _load_model()
+    return _model
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        workers = int(os.getenv("RERANK_WORKERS", "1"))
+        _executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    return _executor
+
+
+def score_pairs(query: str, texts: List[str]) -> List[float]:
+    """
+    Score (query, text) pairs in one batch.
+    """
+    if not texts:
+        return []
+    model = get_rerank_model()
+    scores = model.predict(
+        [(query, text) for text in texts],
+        batch_size=int(os.getenv("RERANK_BATCH_SIZE", "32")),
+        show_progress_bar=False,
+    )
+    return [float(s) for s in scores]
+
+
+def _query_key(query: str) -> str:
+    normalized = " ".join((query or "").lower().split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+def _pair_key(query_key: str, rec: Dict[str, Any]) -> Tuple[str, str, str]:
+    text_key = hashlib.sha1((rec.get("text") or "").encode("utf-8")).hexdigest()
+    return query_key, rec["chunk_id"], text_key
+
+
+def _cache_get(key: Tuple[str, str, str]) -> Optional[float]:
+    score = _score_cache.get(key)
+    if score is not None:
+        _score_cache.move_to_end(key)
+    return score
+
+
+def _cache_put(key: Tuple[str, str, str], score: float) -> None:
+    _score_cache[key] = score
+    _score_cache.move_to_end(key)
+    max_size = int(os.getenv("RERANK_CACHE_SIZE", "4096"))
+    while len(_score_cache) > max_size:
+        _score_cache.popitem(last=False)
+
+
+async def rerank_records(
+    query: str,
+    records: List[Dict[str, Any]],
+    top_k: int,
+) -> List[Dict[str, Any]]:
+    """
+    Re-order hydrated chunk records by cross-encoder score and keep the best
+    top_k. Pair scores are cached per (query, chunk_id, chunk text).
+    """
+    if not records:
+        return []
+    query_key = _query_key(query)
+    missing: List[Dict[str, Any]] = []
+    for rec in records:
+        cached = _cache_get(_pair_key(query_key, rec))
+        if cached is None:
+            missing.append(rec)
+        else:
+            rec["rerank_score"] = cached
+
+    if missing:
+        loop = asyncio.get_running_loop()
+        scores = await loop.run_in_executor(
+            _get_executor(),
+            score_pairs,
+            query,
+            [rec.get("text", "") for rec in missing],
+        )
+        for rec, score in zip(missing, scores):
+            rec["rerank_score"] = score
+            _cache_put(_pair_key(query_key, rec), score)
+
+    enhanced_logger.debug(
+        "RERANK_COMPLETED",
+        extra_data={
+            "candidates": len(records),
+            "scored": len(missing),
+            "cache_hits": len(records) - len(missing),
+            "top_k": top_k,
+        },
+    )
+    ranked = sorted(records, key=lambda r: r.get("rerank_score", float("-inf")), reverse=True)
+    return ranked[:top_k]
@@ -0,0 +1,370 @@
+from __future__ import annotations
+
+import os
+import socket
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from logger import enhanced_logger
+
+
+@dataclass
+class _SessionEntry:
+    doc: Dict[str, Any]
+    version: int
+    cached_at: float
+
+
+@dataclass
+class _TailEntry:
+    version: int
+    cached_at: float
+    # Most recent messages, oldest first, each carrying "index" and "tokens".
+    messages: List[Dict[str, Any]] = field(default_factory=list)
+    # True when messages run back to the first message of the conversation.
+    complete: bool = False
+    message_count: Optional[int] = None
+    summary: Optional[Dict[str, Any]] = None
+    summary_loaded: bool = False
+
+
+_sessions: "OrderedDict[str, _SessionEntry]" = OrderedDict()
+# (session_id, domain) -> recent history tail and summary
+_tails: "OrderedDict[Tuple[str, str], _TailEntry]" = OrderedDict()
+_hits = 0
+_misses = 0
+_sticky_refused_logged = False
+
+
+def session_cache_enabled() -> bool:
+    flag = os.getenv("SESSION_CACHE_ENABLED", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _sticky_confirmed() -> bool:
+    flag = os.getenv("SESSION_CACHE_STICKY_CONFIRMED", "false")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def cache_mode() -> str:
+    """
+    "version": every session read goes to Mongo and its cache_version decides
+    whether cached history is still current (safe with any load balancing).
+    "sticky": cached entries are trusted for their TTL and a hit costs no
+    round trip at all. Nothing in the app pins a session to a worker, so this
+    is only correct behind a balancer that routes every request of a session
+    to the same worker process, e.g. consistent hashing on the session_id
+    (nginx `hash $arg_session_id consistent;` or a header/cookie carrying it)
+    with a single worker per upstream address, never round robin. Each
+    response carries X-Session-Worker so the routing can be checked. Sticky
+    mode is refused, falling back to "version", unless
+    SESSION_CACHE_STICKY_CONFIRMED is set to acknowledge that setup.
+    """
+    global _sticky_refused_logged
+    mode = os.getenv("SESSION_CACHE_MODE", "version").lower()
+    if mode == "sticky" and not _sticky_confirmed():
+        if not _sticky_refused_logged:
+            _sticky_refused_logged = True
+            enhanced_logger.warning(
+                "SESSION_CACHE_STICKY_UNCONFIRMED",
+                extra_data={"fallback": "version", "confirm_with": "SESSION_CACHE_STICKY_CONFIRMED"},
+            )
+        return "version"
+    return mode if mode in {"version", "sticky"} else "version"
+
+
+def versioned() -> bool:
+    return session_cache_enabled() and cache_mode() == "version"
+
+
+def worker_id() -> str:
+    return os.getenv("WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _ttl_seconds() -> float:
+    return float(os.getenv("SESSION_CACHE_TTL_SECONDS", "300"))
+
+
+def _max_entries() -> int:
+    return int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "5000"))
+
+
+def _tail_max_tokens() -> int:
+    return int(os.getenv("SESSION_CACHE_TAIL_TOKENS", "4000"))
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    return int(message.get("tokens") or 0)
+
+
+def _evict() -> None:
+    max_entries = _max_entries()
+    while len(_sessions) > max_entries:
+        _sessions.popitem(last=False)
+    while len(_tails) > max_entries:
+        _tails.popitem(last=False)
+
+
+def _live_session(session_id: str) -> Optional[_SessionEntry]:
+    entry = _sessions.get(session_id)
+    if entry is None:
+        return None
+    if time.time() - entry.cached_at > _ttl_seconds():
+        invalidate_session(session_id)
+        return None
+    return entry
+
+
+def _live_tail(session_id: str, domain: str) -> Optional[_TailEntry]:
+    session = _live_session(session_id)
+    key = (session_id, domain)
+    tail = _tails.get(key)
+    if tail is None:
+        return None
+    if session is None or tail.version != session.version or time.time() - tail.cached_at > _ttl_seconds():
+        _tails.pop(key, None)
+        return None
+    _tails.move_to_end(key)
+    return tail
+
+
+def _tail_entry(session_id: str, domain: str) -> Optional[_TailEntry]:
+    # Live entry, or a fresh empty one bound to the current session version.
+    tail = _live_tail(session_id, domain)
+    if tail is not None:
+        return tail
+    session = _live_session(session_id)
+    if session is None:
+        return None
+    tail = _TailEntry(version=session.version, cached_at=time.time())
+    _tails[(session_id, domain)] = tail
+    _evict()
+    return tail
+
+
+def get_session(session_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Cached session document, sticky mode only; version mode always re-reads
+    the session so its cache_version can be checked.
+    """
+    global _hits, _misses
+    if not session_cache_enabled() or cache_mode() != "sticky":
+        return None
+    entry = _live_session(session_id)
+    if entry is None:
+        _misses += 1
+        return None
+    _hits += 1
+    _sessions.move_to_end(session_id)
+    return dict(entry.doc)
+
+
+def put_session(doc: Dict[str, Any]) -> None:
+    """
+    Record a session document read from Mongo. A changed cache_version means
+    another worker wrote to the session, so its cached history is dropped.
+    """
+    if not session_cache_enabled() or not doc or not doc.get("session_id"):
+        return
+    session_id = doc["session_id"]
+    version = int(doc.get("cache_version") or 0)
+    previous = _sessions.get(session_id)
+    if previous is not None and previous.version != version:
+        _drop_tails(session_id)
+    _sessions[session_id] = _SessionEntry(doc=dict(doc), version=version, cached_at=time.time())
+    _sessions.move_to_end(session_id)
+    _evict()
+
+
+def advance_version(session_id: str, new_version: Optional[int]) -> bool:
+    """
+    Follow a write made by this worker. Returns False (and drops cached
+    history) when the stored version moved by more than our own write.
+    """
+    entry = _sessions.get(session_id)
+    if entry is None:
+        return False
+    if new_version is None:
+        # Sticky mode: no stored version, this worker sees every write.
+        return True
+    if entry.version + 1 != new_version:
+        _drop_tails(session_id)
+        entry.version = new_version
+        return False
+    entry.version = new_version
+    for key, tail in _tails.items():
+        if key[0] == session_id:
+            tail.version = new_version
+    return True
+
+
+def get_tail(
+    session_id: str,
+    domain: str,
+    max_tokens: Optional[int],
+    since_index: Optional[int],
+) -> Optional[List[Dict[str, Any]]]:
+    """
+    Serve get_chat_history from the cached tail when it holds enough: the
+    token budget fills, since_index is reached, or the tail is the whole
+    conversation. Otherwise None.
+    """
+    global _hits, _misses
+    if not session_cache_enabled():
+        return None
+    tail = _live_tail(session_id, domain)
+    if tail is None or (not tail.messages and not tail.complete):
+        _misses += 1
+        return None
+    result: List[Dict[str, Any]] = []
+    used = 0
+    satisfied = tail.complete
+    for message in reversed(tail.messages):
+        if since_index and message.get("index", 0) < since_index:
+            satisfied = True
+            break
+        if max_tokens is not None and max_tokens > 0:
+            used += _message_tokens(message)
+            if used > max_tokens and result:
+                satisfied = True
+                break
+        result.append(dict(message))
+    if not satisfied:
+        first = tail.messages[0].get("index", 0) if tail.messages else 0
+        satisfied = bool(since_index) and first <= since_index
+    if not satisfied:
+        _misses += 1
+        return None
+    _hits += 1
+    result.reverse()
+    return result
+
+
+def put_tail(session_id: str, domain: str, messages: List[Dict[str, Any]], complete: bool) -> None:
+    """
+    Cache messages read from Mongo. Only bucketed messages (with an index)
+    are cached, and only while the session itself is cached.
+    """
+    if not session_cache_enabled() or any("index" not in m for m in messages):
+        return
+    tail = _tail_entry(session_id, domain)
+    if tail is None:
+        return
+    if tail.messages and len(tail.messages) >= len(messages) and not complete:
+        return
+    tail.messages = [dict(m) for m in messages]
+    tail.complete = complete
+    tail.cached_at = time.time()
+    _trim(tail)
+
+
+def append_tail(
+    session_id: str,
+    domain: str,
+    messages: List[Dict[str, Any]],
+    message_count: int,
+) -> None:
+    """
+    Write-through from append_chat_messages.
+    """
+    if not session_cache_enabled():
+        return
+    tail = _tail_entry(session_id, domain)
+    if tail is None:
+        return
+    expected_first = tail.messages[-1]["index"] + 1 if tail.messages else None
+    if messages and expected_first is not None and messages[0].get("index") != expected_first:
+        # Something landed in between that we did not see; start over.
+        tail.messages = []
+        tail.complete = False
+    if not tail.messages and not tail.complete and messages and messages[0].get("index") == 0:
+        tail.complete = True
+    tail.messages.extend(dict(m) for m in messages)
+    tail.message_count = message_count
+    tail.cached_at = time.time()
+    _trim(tail)
+
+
+def get_page(
+    session_id: str,
+    domain: str,
+    before: Optional[int],
+    limit: int,
+) -> Optional[Tuple[List[Dict[str, Any]], Optional[int]]]:
+    """
+    Serve a /history page from the cached tail when it covers the range.
+    """
+    global _hits, _misses
+    tail = _live_tail(session_id, domain) if session_cache_enabled() else None
+    if tail is None or not tail.messages:
+        if tail is not None and tail.complete:
+            _hits += 1
+            return [], None
+        _misses += 1
+        return None
+    total = int(tail.messages[-1].get("index", 0)) + 1
+    end = total if before is None else max(0, min(int(before), total))
+    start = max(0, end - max(1, int(limit)))
+    if start < int(tail.messages[0].get("index", 0)):
+        _misses += 1
+        return None
+    _hits += 1
+    page = [dict(m) for m in tail.messages if start <= m.get("index", -1) < end]
+    return page, (start if start > 0 else None)
+
+
+def _trim(tail: _TailEntry) -> None:
+    budget = _tail_max_tokens()
+    total = sum(_message_tokens(m) for m in tail.messages)
+    while len(tail.messages) > 1 and total > budget:
+        total -= _message_tokens(tail.messages.pop(0))
+        tail.complete = False
+
+
+def get_message_count(session_id: str, domain: str) -> Optional[int]:
+    tail = _live_tail(session_id, domain) if session_cache_enabled() else None
+    return tail.message_count if tail is not None else None
+
+
+def get_summary(session_id: str, domain: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    (hit, summary document) for the cached chat summary.
+    """
+    tail = _live_tail(session_id, domain) if session_cache_enabled() else None
+    if tail is None or not tail.summary_loaded:
+        return False, None
+    return True, dict(tail.summary) if tail.summary else None
+
+
+def put_summary(session_id: str, domain: str, summary: Optional[Dict[str, Any]]) -> None:
+    if not session_cache_enabled():
+        return
+    tail = _tail_entry(session_id, domain)
+    if tail is None:
+        return
+    tail.summary = dict(summary) if summary else None
+    tail.summary_loaded = True
+
+
+def _drop_tails(session_id: str) -> None:
+    for key in [key for key in _tails if key[0] == session_id]:
+        _tails.pop(key, None)
+
+
+def invalidate_session(session_id: str) -> None:
+    _sessions.pop(session_id, None)
+    _drop_tails(session_id)
+
+
+def get_stats() -> Dict[str, Any]:
+    lookups = _hits + _misses
+    return {
+        "mode": cache_mode(),
+        "sessions": len(_sessions),
+        "tails": len(_tails),
+        "hits": _hits,
+        "misses": _misses,
+        "hit_rate": round(_hits / lookups, 4) if lookups else 0.0,
+    }
@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from agents.domain_router import summarize_conversation
+from logger import enhanced_logger
+from rag.tokenizer import count_tokens
+from services.history_writer import read_chat_history
+from services.mongo_service import (
+    get_chat_message_count,
+    get_chat_messages_range,
+    get_chat_summary,
+    save_chat_summary,
+)
+
+
+_running: Set[Tuple[str, str]] = set()
+_pending: Set[Tuple[str, str]] = set()
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def summary_enabled() -> bool:
+    flag = os.getenv("CHAT_SUMMARY_ENABLED", "true")
+    return str(flag).lower() in {"1", "true", "yes", "on"}
+
+
+def _keep_messages() -> int:
+    # Turns kept verbatim after the summary; one turn is a user + assistant pair.
+    return 2 * max(1, int(os.getenv("CHAT_SUMMARY_KEEP_TURNS", "3")))
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+    return _executor
+
+
+async def load_history_context(
+    session_id: str,
+    domain: str,
+    max_history_tokens: int,
+) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+    """
+    The running summary (if any) and the stored messages it does not yet
+    cover, newest last, bounded by what is left of the history budget.
+    """
+    summary_doc = await get_chat_summary(session_id, domain) if summary_enabled() else None
+    if not summary_doc or not summary_doc.get("summary"):
+        messages = await read_chat_history(session_id, domain, max_tokens=max_history_tokens)
+        return None, messages
+    budget = max_history_tokens
+    if budget > 0:
+        budget = max(budget - int(summary_doc.get("tokens") or 0), 1)
+    messages = await read_chat_history(
+        session_id,
+        domain,
+        max_tokens=budget,
+        since_index=int(summary_doc.get("covered_until") or 0),
+    )
+    return summary_doc["summary"], messages
+
+
+def schedule_summary_update(session_id: str, domain: str) -> None:
+    """
+    Fold turns that have aged out of the verbatim window into the summary,
+    off the request path. One task per (session, domain); appends that land
+    while it runs are picked up before it exits.
+    """
+    if not summary_enabled():
+        return
+    key = (session_id, domain)
+    _pending.add(key)
+    if key in _running:
+        return
+    _running.add(key)
+    asyncio.get_running_loop().create_task(_run(session_id, domain))
+
+
+async def _run(session_id: str, domain: str) -> None:
+    key = (session_id, domain)
+    try:
+        while key in _pending:
+            _pending.discard(key)
+            while await _update_summary(session_id, domain):
+                pass
+    except Exception as exc:
+        _pending.discard(key)
+        enhanced_logger.warning(
+            "CHAT_SUMMARY_FAILED",
+            extra_data={"session_id": session_id, "domain": domain, "error": str(exc)},
+        )
+    finally:
+        _running.discard(key)
+
+
+async def _update_summary(session_id: str, domain: str) -> bool:
+    message_count = await get_chat_message_count(session_id, domain)
+    summary_doc = await get_chat_summary(session_id, domain) or {}
+    covered = int(summary_doc.get("covered_until") or 0)
+    target = message_count - _keep_messages()
+    if target - covered < int(os.getenv("CHAT_SUMMARY_MIN_NEW_MESSAGES", "4")):
+        return False
+    # Bound a single call so a long backlog is folded in over several passes.
+    target = min(target, covered + int(os.getenv("CHAT_SUMMARY_MAX_BATCH_MESSAGES", "40")))
+    messages = await get_chat_messages_range(session_id, domain, covered, target)
+    if not messages:
+        return False
+
+    start = time.time()
+    loop = asyncio.get_running_loop()
+    summary = await loop.run_in_executor(
+        _get_executor(),
+        partial(
+            summarize_conversation,
+            summary_doc.get("summary"),
+            messages,
+            max_output_tokens=int(os.getenv("CHAT_SUMMARY_MAX_TOKENS", "300")),
+        ),
+    )
+    if not summary:
+        return False
+    tokens = count_tokens(summary)
+    saved = await save_chat_summary(session_id, domain, summary, target, tokens)
+    enhanced_logger.info(
+        "CHAT_SUMMARY_UPDATED",
+        extra_data={
+            "session_id": session_id,
+            "domain": domain,
+            "covered_until": target,
+            "messages_folded": len(messages),
+            "summary_tokens": tokens,
+            "saved": saved,
+            "latency_ms": round((time.time() - start) * 1000.0, 2),
+        },
+    )
+    return saved
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
+import math
 import os
 from dataclasses import dataclass
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 from rag.tokenizer import count_tokens
 
@@ -18,7 +19,7 @@ class TokenBudget:
 def load_token_budget() -> TokenBudget:
     return TokenBudget(
         max_history_tokens=int(os.getenv("MAX_HISTORY_TOKENS", "2000")),
-        max_rag_tokens=int(os.getenv("MAX_RAG_TOKENS", "1500")),
+        max_rag_tokens=int(os.getenv("MAX_RAG_TOKENS", "1200")),
         max_input_tokens=int(os.getenv("MAX_INPUT_TOKENS", "4000")),
         max_output_tokens=int(os.getenv("GEMINI_MAX_TOKENS", "2048")),
     )
@@ -48,10 +49,13 @@ def _count_rag_tokens(records: List[Dict[str, Any]]) -> int:
 
 def trim_rag_records(
     records: List[Dict[str, Any]],
-    max_tokens: int,
+    max_tokens: Optional[int],
 ) -> Tuple[List[Dict[str, Any]], int]:
-    if max_tokens <= 0:
+    # None means no limit; an exhausted budget keeps nothing.
+    if max_tokens is None:
         return list(records or []), _count_rag_tokens(records or [])
+    if max_tokens <= 0:
+        return [], 0
     trimmed: List[Dict[str, Any]] = []
     total = 0
     for rec in records or []:
@@ -64,18 +68,187 @@ def trim_rag_records(
     return trimmed, total
 
 
+def _rag_packing_mode() -> str:
+    return os.getenv("RAG_PACKING", "mmr").strip().lower()
+
+
+def rag_packing_uses_vectors() -> bool:
+    return _rag_packing_mode() == "mmr"
+
+
+def _overlap_length(left: str, right: str, min_chars: int = 10) -> int:
+    """
+    Length of the longest suffix of `left` that is also a prefix of `right`.
+    """
+    if not left or not right:
+        return 0
+    start = left.find(right[0], max(0, len(left) - len(right)))
+    while start != -1 and len(left) - start >= min_chars:
+        if right.startswith(left[start:]):
+            return len(left) - start
+        start = left.find(right[0], start + 1)
+    return 0
+
+
+def _merge_pair(left: Dict[str, Any], right: Dict[str, Any]) -> Dict[str, Any]:
+    left_text = left.get("text", "")
+    right_text = right.get("text", "")
+    overlap = _overlap_length(left_text, right_text)
+    tail = right_text[overlap:].lstrip()
+    merged = dict(left)
+    merged["text"] = f"{left_text} {tail}".strip() if tail else left_text
+    merged["chunk_ids"] = list(left.get("chunk_ids") or [left["chunk_id"]]) + list(
+        right.get("chunk_ids") or [right["chunk_id"]]
+    )
+    merged["chunk_index_end"] = right.get("chunk_index_end", right.get("chunk_index"))
+    for key in ("score", "rerank_score", "rrf_score", "keyword_score"):
+        values = [r.get(key) for r in (left, right) if r.get(key) is not None]
+        if values:
+            merged[key] = max(values)
+    vectors = [r.get("embedding") for r in (left, right) if r.get("embedding")]
+    if len(vectors) == 2:
+        merged["embedding"] = [(a + b) / 2.0 for a, b in zip(*vectors)]
+    elif vectors:
+        merged["embedding"] = vectors[0]
+    return merged
+
+
+def merge_adjacent_records(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Merge hits that are neighbours in the same file (chunk_index n, n+1) and
+    drop the overlap text the chunker repeats between them. The merged record
+    takes the position of its best-ranked member.
+    """
+    by_file: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {}
+    passthrough: List[Tuple[int, Dict[str, Any]]] = []
+    for position, rec in enumerate(records or []):
+        if rec.get("file_id") is None or rec.get("chunk_index") is None:
+            passthrough.append((position, rec))
+            continue
+        by_file.setdefault(rec["file_id"], []).append((position, rec))
+
+    merged: List[Tuple[int, Dict[str, Any]]] = list(passthrough)
+    for items in by_file.values():
+        items.sort(key=lambda item: item[1]["chunk_index"])
+        run_position, run = items[0]
+        for position, rec in items[1:]:
+            run_end = run.get("chunk_index_end", run["chunk_index"])
+            if rec["chunk_index"] == run_end + 1:
+                run = _merge_pair(run, rec)
+                run_position = min(run_position, position)
+            elif rec["chunk_index"] <= run_end:
+                run_position = min(run_position, position)
+            else:
+                merged.append((run_position, run))
+                run_position, run = position, rec
+        merged.append((run_position, run))
+
+    merged.sort(key=lambda item: item[0])
+    return [rec for _, rec in merged]
+
+
+def _relevance(rec: Dict[str, Any]) -> float:
+    for key in ("rerank_score", "rrf_score", "score", "keyword_score"):
+        value = rec.get(key)
+        if value is not None:
+            return float(value)
+    return 0.0
+
+
+def _cosine(a: Optional[List[float]], b: Optional[List[float]]) -> float:
+    if not a or not b:
+        return 0.0
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+def pack_rag_records(
+    records: List[Dict[str, Any]],
+    max_tokens: Optional[int],
+    mmr_lambda: Optional[float] = None,
+) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Greedy knapsack over merged chunks: each step takes the candidate with the
+    best MMR value per token that still fits, so one oversized chunk does not
+    end packing and near-duplicates (by search vector) are penalised.
+    max_tokens=None packs everything; a budget of 0 or less packs nothing.
+    """
+    if max_tokens is None:
+        return list(records or []), _count_rag_tokens(records or [])
+    if max_tokens <= 0:
+        return [], 0
+    lam = mmr_lambda if mmr_lambda is not None else float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+    token_weight = float(os.getenv("RAG_PACKING_TOKEN_WEIGHT", "0.5"))
+
+    candidates = merge_adjacent_records(records)
+    if not candidates:
+        return [], 0
+    tokens = [count_tokens(rec.get("text", "")) for rec in candidates]
+    raw = [_relevance(rec) for rec in candidates]
+    low, high = min(raw), max(raw)
+    relevance = [(r - low) / (high - low) if high > low else 1.0 for r in raw]
+
+    selected: List[int] = []
+    total = 0
+    remaining = set(range(len(candidates)))
+    while remaining:
+        best_idx = None
+        best_value = -1.0
+        for idx in remaining:
+            if total + tokens[idx] > max_tokens:
+                continue
+            redundancy = max(
+                (_cosine(candidates[idx].get("embedding"), candidates[s].get("embedding")) for s in selected),
+                default=0.0,
+            )
+            mmr = lam * relevance[idx] + (1.0 - lam) * (1.0 - max(redundancy, 0.0))
+            value = mmr / (max(tokens[idx], 1) ** token_weight)
+            if value > best_value:
+                best_idx, best_value = idx, value
+        if best_idx is None:
+            break
+        selected.append(best_idx)
+        total += tokens[best_idx]
+        remaining.discard(best_idx)
+
+    # Present in relevance order, not pick order.
+    selected.sort(key=lambda idx: raw[idx], reverse=True)
+    return [candidates[idx] for idx in selected], total
+
+
+def _fit_rag_records(records: List[Dict[str, Any]], max_tokens: Optional[int]) -> Tuple[List[Dict[str, Any]], int]:
+    if _rag_packing_mode() == "mmr":
+        return pack_rag_records(records, max_tokens)
+    return trim_rag_records(records, max_tokens)
+
+
 def enforce_input_budget(
     system_prompt: str,
     history: List[Dict[str, Any]],
     user_message: str,
     rag_records: List[Dict[str, Any]],
     budget: TokenBudget,
+    summary: Optional[str] = None,
 ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], Dict[str, int]]:
+    """
+    Fit history and RAG context around the system prompt and user message.
+    A conversation summary, when given, is sent ahead of the recent turns
+    and counts against the history budget; it is never trimmed here.
+    """
     system_tokens = count_tokens(system_prompt)
     user_tokens = count_tokens(user_message)
+    summary_tokens = count_tokens(summary) if summary else 0
 
-    trimmed_history, history_tokens = trim_history(history, budget.max_history_tokens)
-    trimmed_rag, rag_tokens = trim_rag_records(rag_records, budget.max_rag_tokens)
+    history_budget = budget.max_history_tokens
+    if summary_tokens and history_budget > 0:
+        # trim_history treats <= 0 as "no limit", so floor at 1.
+        history_budget = max(history_budget - summary_tokens, 1)
+    trimmed_history, turn_tokens = trim_history(history, history_budget)
+    history_tokens = summary_tokens + turn_tokens
+    # MAX_RAG_TOKENS <= 0 means no RAG-specific limit.
+    rag_budget = budget.max_rag_tokens if budget.max_rag_tokens > 0 else None
+    trimmed_rag, rag_tokens = _fit_rag_records(rag_records, rag_budget)
 
     total = system_tokens + history_tokens + user_tokens + rag_tokens
 
@@ -83,18 +256,19 @@ def enforce_input_budget(
         # Prefer trimming history first (oldest).
         while trimmed_history and total > budget.max_input_tokens:
             trimmed_history = trimmed_history[1:]
-            history_tokens = count_history_tokens(trimmed_history)
+            history_tokens = summary_tokens + count_history_tokens(trimmed_history)
             total = system_tokens + history_tokens + user_tokens + rag_tokens
 
         # If still too large, trim RAG context.
         if total > budget.max_input_tokens:
             remaining_for_rag = max(budget.max_input_tokens - (system_tokens + history_tokens + user_tokens), 0)
-            trimmed_rag, rag_tokens = trim_rag_records(trimmed_rag, remaining_for_rag)
+            trimmed_rag, rag_tokens = _fit_rag_records(trimmed_rag, remaining_for_rag)
             total = system_tokens + history_tokens + user_tokens + rag_tokens
 
     usage = {
         "system_tokens": system_tokens,
         "history_tokens": history_tokens,
+        "summary_tokens": summary_tokens,
         "user_tokens": user_tokens,
         "rag_tokens": rag_tokens,
         "total_tokens": total,
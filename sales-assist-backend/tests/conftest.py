@@ -0,0 +1,351 @@
+import copy
+import itertools
+from types import SimpleNamespace
+
+import pytest
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, list) and part.isdigit():
+            index = int(part)
+            if index >= len(value):
+                return _MISSING
+            value = value[index]
+            continue
+        if isinstance(value, list):
+            values = [item.get(part, _MISSING) for item in value if isinstance(item, dict)]
+            return [v for v in values if v is not _MISSING] or _MISSING
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _candidates(value):
+    if value is _MISSING:
+        return [None]
+    if isinstance(value, list):
+        return value + [value]
+    return [value]
+
+
+def _match_op(value, op, arg):
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$ne":
+        return not any(v == arg for v in _candidates(value))
+    if op == "$nin":
+        return not any(v in arg for v in _candidates(value))
+    if op == "$in":
+        return any(v in arg for v in _candidates(value))
+    compare = {
+        "$lt": lambda a, b: a < b,
+        "$lte": lambda a, b: a <= b,
+        "$gt": lambda a, b: a > b,
+        "$gte": lambda a, b: a >= b,
+    }[op]
+    return any(v is not None and compare(v, arg) for v in _candidates(value))
+
+
+def matches(doc, query):
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = _get(doc, key)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            if not all(_match_op(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif cond not in _candidates(value):
+            return False
+    return True
+
+
+def _set_path(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc[int(part)] if isinstance(doc, list) else doc.setdefault(part, {})
+    if isinstance(doc, list):
+        doc[int(parts[-1])] = value
+    else:
+        doc[parts[-1]] = value
+
+
+def _apply(doc, update, inserting):
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            current = _get(doc, path)
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                _set_path(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                parent = doc
+                parts = path.split(".")
+                for part in parts[:-1]:
+                    parent = parent.get(part, {})
+                parent.pop(parts[-1], None)
+            elif op == "$inc":
+                _set_path(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op in {"$push", "$addToSet"}:
+                items = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                target = [] if current is _MISSING else list(current)
+                for item in items:
+                    if op == "$push" or item not in target:
+                        target.append(copy.deepcopy(item))
+                _set_path(doc, path, target)
+
+
+class FakeCollection:
+    """
+    The slice of a pymongo collection the services touch, with unique
+    indexes, so duplicate-key races can be replayed deterministically.
+    """
+
+    def __init__(self, unique=()):
+        self.docs = []
+        self.unique = [tuple(keys) for keys in unique]
+        self._ids = itertools.count(1)
+
+    def _check_unique(self, doc, skip=None):
+        for other in self.docs:
+            if other is skip:
+                continue
+            if other["_id"] == doc["_id"]:
+                raise DuplicateKeyError("E11000 duplicate key error _id")
+            for keys in self.unique:
+                if all(_get(other, k) == _get(doc, k) is not _MISSING for k in keys):
+                    raise DuplicateKeyError(f"E11000 duplicate key error {keys}")
+
+    def find_one(self, query=None, projection=None, sort=None):
+        found = [doc for doc in self.docs if matches(doc, query or {})]
+        for key, direction in reversed(sort or []):
+            found.sort(key=lambda doc: _get(doc, key), reverse=direction < 0)
+        return copy.deepcopy(found[0]) if found else None
+
+    def find(self, query=None, projection=None):
+        return [copy.deepcopy(doc) for doc in self.docs if matches(doc, query or {})]
+
+    def insert_one(self, doc):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", next(self._ids))
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    def _upsert_doc(self, query, update):
+        doc = {
+            key: value
+            for key, value in query.items()
+            if not key.startswith("$") and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        doc.setdefault("_id", next(self._ids))
+        _apply(doc, update, inserting=True)
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return doc
+
+    def update_one(self, query, update, upsert=False):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                _apply(doc, update, inserting=False)
+                try:
+                    self._check_unique(doc, skip=doc)
+                except DuplicateKeyError:
+                    doc.clear()
+                    doc.update(before)
+                    raise
+                return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = self._upsert_doc(query, update)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=doc["_id"])
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    def find_one_and_update(self, query, update, upsert=False, return_document=ReturnDocument.BEFORE, **kwargs):
+        for doc in self.docs:
+            if matches(doc, query):
+                before = copy.deepcopy(doc)
+                _apply(doc, update, inserting=False)
+                return before if return_document == ReturnDocument.BEFORE else copy.deepcopy(doc)
+        if upsert:
+            doc = self._upsert_doc(query, update)
+            return None if return_document == ReturnDocument.BEFORE else copy.deepcopy(doc)
+        return None
+
+
+def _project(doc, projection):
+    if not projection:
+        return doc
+    included = {key for key, keep in projection.items() if keep and key != "_id"}
+    if included:
+        projected = {key: doc[key] for key in included if key in doc}
+        if projection.get("_id", 1) and "_id" in doc:
+            projected["_id"] = doc["_id"]
+        return projected
+    return {key: value for key, value in doc.items() if projection.get(key, 1)}
+
+
+class FakeCursor:
+    """
+    Motor cursor over a snapshot: sort/skip/limit chain, async iteration.
+    """
+
+    def __init__(self, docs, projection=None):
+        self._docs = docs
+        self._projection = projection
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction or 1)] if isinstance(key, str) else list(key)
+        for path, order in reversed(keys):
+            self._docs.sort(key=lambda doc: _get(doc, path), reverse=order < 0)
+        return self
+
+    def batch_size(self, count):
+        return self
+
+    def skip(self, count):
+        self._skip = count
+        return self
+
+    def limit(self, count):
+        self._limit = count
+        return self
+
+    def _window(self):
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(doc, self._projection) for doc in docs]
+
+    async def to_list(self, length=None):
+        docs = self._window()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        self._iter = iter(self._window())
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+def _group_value(doc, expr):
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, dict):
+        return {key: _group_value(doc, sub) for key, sub in expr.items()}
+    return expr
+
+
+def _aggregate(docs, pipeline):
+    for stage in pipeline:
+        if "$match" in stage:
+            docs = [doc for doc in docs if matches(doc, stage["$match"])]
+        elif "$group" in stage:
+            spec = dict(stage["$group"])
+            key_expr = spec.pop("_id")
+            groups = {}
+            for doc in docs:
+                key = _group_value(doc, key_expr)
+                row = groups.setdefault(repr(key), {"_id": key})
+                for field, (op, expr) in ((f, next(iter(a.items()))) for f, a in spec.items()):
+                    value = _group_value(doc, expr)
+                    if op == "$sum":
+                        row[field] = row.get(field, 0) + (value or 0)
+                    elif op == "$first":
+                        row.setdefault(field, value)
+            docs = list(groups.values())
+        else:
+            raise NotImplementedError(next(iter(stage)))
+    return docs
+
+
+class AsyncFakeCollection(FakeCollection):
+    """
+    Motor-flavoured FakeCollection: the same operations, awaited.
+    before_upsert(query) runs after an upsert's filter missed and before it
+    inserts, which is where a concurrent writer can slip in.
+    """
+
+    before_upsert = None
+
+    def _upsert_doc(self, query, update):
+        if self.before_upsert is not None:
+            self.before_upsert(query)
+        return FakeCollection._upsert_doc(self, query, update)
+
+    async def bulk_write(self, ops, ordered=True):
+        errors = []
+        for position, op in enumerate(ops):
+            try:
+                FakeCollection.update_one(self, op._filter, op._doc, upsert=op._upsert)
+            except DuplicateKeyError as exc:
+                errors.append({"index": position, "code": 11000, "errmsg": str(exc)})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(FakeCollection.find(self, query), projection)
+
+    async def find_one(self, *args, **kwargs):
+        return FakeCollection.find_one(self, *args, **kwargs)
+
+    async def insert_many(self, docs, ordered=True):
+        return SimpleNamespace(inserted_ids=[FakeCollection.insert_one(self, doc).inserted_id for doc in docs])
+
+    def aggregate(self, pipeline):
+        return FakeCursor(_aggregate(copy.deepcopy(self.docs), pipeline))
+
+    async def find_one_and_delete(self, query, projection=None):
+        for doc in self.docs:
+            if matches(doc, query):
+                self.docs.remove(doc)
+                return _project(doc, projection)
+        return None
+
+    async def delete_many(self, query):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted = len(self.docs) - len(kept)
+        self.docs = kept
+        return SimpleNamespace(deleted_count=deleted)
+
+    async def count_documents(self, query):
+        return len(FakeCollection.find(self, query))
+
+    async def insert_one(self, *args, **kwargs):
+        return FakeCollection.insert_one(self, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return FakeCollection.update_one(self, *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return FakeCollection.find_one_and_update(self, *args, **kwargs)
+
+
+@pytest.fixture
+def fake_collection():
+    return FakeCollection
+
+
+@pytest.fixture
+def async_fake_collection():
+    return AsyncFakeCollection
@@ -0,0 +1,81 @@
+import asyncio
+from collections import defaultdict
+
+import numpy as np
+import pytest
+
+from services import centroid_service as centroids
+
+
+@pytest.fixture
+def db(monkeypatch, async_fake_collection):
+    collections = defaultdict(async_fake_collection)
+    collections["domain_centroids"] = async_fake_collection(unique=[("domain",)])
+    monkeypatch.setattr(centroids, "get_db", lambda: collections)
+    monkeypatch.setattr(centroids, "_domain_centroids", {})
+    centroids.invalidate_routing_cache()
+    yield collections
+    centroids.invalidate_routing_cache()
+
+
+def _unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def test_multi_topic_file_is_routed_by_either_medoid(db, monkeypatch):
+    monkeypatch.setenv("FILE_ROUTING_ENABLED", "true")
+    monkeypatch.setenv("FILE_ROUTING_TOP_M", "1")
+    monkeypatch.setenv("FILE_ROUTING_MIN_FILES", "2")
+
+    async def ingest():
+        await centroids.upsert_file_centroids("mixed", "it", [_unit(1, 0, 0)] * 3 + [_unit(0, 1, 0)] * 3)
+        await centroids.upsert_file_centroids("other", "it", [_unit(0.6, 0.6, 0.5)] * 4)
+        await centroids.upsert_file_centroids("third", "it", [_unit(0, 0, 1)] * 4)
+
+    asyncio.run(ingest())
+
+    assert asyncio.run(centroids.route_files(_unit(0, 1, 0), "it")) == ["mixed"]
+    assert asyncio.run(centroids.route_files(_unit(1, 0, 0), "it")) == ["mixed"]
+    # A caller filter no larger than top-M is searched directly.
+    assert asyncio.run(centroids.route_files(_unit(1, 0, 0), "it", ["other"])) is None
+
+
+def test_routing_is_skipped_for_small_domains(db, monkeypatch):
+    monkeypatch.setenv("FILE_ROUTING_ENABLED", "true")
+    monkeypatch.setenv("FILE_ROUTING_MIN_FILES", "50")
+    asyncio.run(centroids.upsert_file_centroids("a", "it", [_unit(1, 0)]))
+
+    assert asyncio.run(centroids.route_files(_unit(1, 0), "it")) is None
+
+
+def test_domain_centroid_survives_a_racing_first_ingest(db):
+    collection = db["domain_centroids"]
+    raced = []
+
+    def other_worker_seeds(query):
+        if not raced:
+            raced.append(True)
+            collection.docs.append({"_id": "other", "domain": "it", "sum_vector": [0.0, 0.0], "count": 0})
+
+    collection.before_upsert = other_worker_seeds
+    asyncio.run(centroids.upsert_file_centroids("a", "it", [_unit(1, 0), _unit(1, 0)]))
+    asyncio.run(centroids.upsert_file_centroids("b", "it", [_unit(0, 1)]))
+    asyncio.run(centroids.delete_file_centroids("a"))
+
+    (doc,) = collection.docs
+    assert raced and doc["count"] == 1
+    assert doc["sum_vector"] == pytest.approx([0.0, 1.0])
+
+
+def test_general_queries_skip_distant_domains(db, monkeypatch):
+    monkeypatch.setenv("DOMAIN_ROUTING_ENABLED", "true")
+    monkeypatch.setenv("DOMAIN_ROUTING_MARGIN", "0.05")
+    asyncio.run(centroids.upsert_file_centroids("a", "it", [_unit(1, 0)]))
+    asyncio.run(centroids.upsert_file_centroids("b", "sales", [_unit(0, 1)]))
+    asyncio.run(centroids.refresh_domain_centroids(force=True))
+
+    assert centroids.select_domains(_unit(1, 0.1), ["it", "sales"]) == ["it"]
+    assert centroids.select_domains(_unit(1, 1), ["it", "sales"]) == ["it", "sales"]
+    # A domain without a centroid yet is never pruned.
+    assert centroids.select_domains(_unit(1, 0), ["it", "hr"]) == ["it", "hr"]
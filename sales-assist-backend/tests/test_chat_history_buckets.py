@@ -0,0 +1,89 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from services import mongo_service
+from services.mongo_service import ChatWrite
+
+
+@pytest.fixture
+def buckets(monkeypatch, async_fake_collection):
+    collection = async_fake_collection(unique=[("session_id", "domain", "seq")])
+    monkeypatch.setattr(mongo_service, "get_db", lambda: {"chat_history_buckets": collection})
+    monkeypatch.setenv("CHAT_HISTORY_BUCKET_SIZE", "50")
+    return collection
+
+
+def _write(first_index, content):
+    return ChatWrite("s1", "it", [{"role": "user", "content": content, "tokens": 1}], first_index=first_index)
+
+
+def _stored(collection):
+    return sorted(
+        (msg["index"], msg["content"]) for doc in collection.docs for msg in doc["messages"]
+    )
+
+
+def test_writer_losing_the_bucket_creation_race_still_pushes(buckets, fake_collection):
+    now = datetime.utcnow()
+
+    def competitor_creates_bucket(query):
+        # Another writer upserts the same new bucket between our filter
+        # missing and our insert.
+        buckets.before_upsert = None
+        for competitor_query, competitor_update in mongo_service._bucket_ops(_write(0, "first"), now):
+            fake_collection.update_one(buckets, competitor_query, competitor_update, upsert=True)
+
+    buckets.before_upsert = competitor_creates_bucket
+    asyncio.run(mongo_service._apply_bucket_ops(mongo_service._bucket_ops(_write(1, "second"), now)))
+
+    assert len(buckets.docs) == 1
+    assert _stored(buckets) == [(0, "first"), (1, "second")]
+    assert buckets.docs[0]["count"] == 2
+
+
+def test_retried_write_does_not_push_twice(buckets):
+    now = datetime.utcnow()
+    write = _write(0, "hello")
+    asyncio.run(mongo_service._apply_bucket_ops(mongo_service._bucket_ops(write, now)))
+    asyncio.run(mongo_service._apply_bucket_ops(mongo_service._bucket_ops(write, now)))
+
+    assert _stored(buckets) == [(0, "hello")]
+    assert buckets.docs[0]["count"] == 1
+
+
+@pytest.fixture
+def history(monkeypatch, async_fake_collection):
+    monkeypatch.setenv("SESSION_CACHE_ENABLED", "false")
+    monkeypatch.setenv("CHAT_HISTORY_BUCKET_SIZE", "3")
+    buckets = async_fake_collection()
+    headers = async_fake_collection()
+    headers.docs.append({"_id": 1, "session_id": "s1", "domain": "it", "message_count": 8})
+    for seq in range(3):
+        messages = [{"index": i, "content": f"m{i}", "tokens": 1} for i in range(seq * 3, min(seq * 3 + 3, 8))]
+        buckets.docs.append({"_id": f"b{seq}", "session_id": "s1", "domain": "it", "seq": seq, "messages": messages})
+    monkeypatch.setattr(mongo_service, "get_db", lambda: {"chat_history_buckets": buckets, "chat_history": headers})
+    return buckets
+
+
+def _indexes(messages):
+    return [m["index"] for m in messages]
+
+
+def test_history_reads_stop_at_the_token_budget_or_since_index(history):
+    assert _indexes(asyncio.run(mongo_service.get_chat_history("s1", "it", max_tokens=3))) == [5, 6, 7]
+    assert _indexes(asyncio.run(mongo_service.get_chat_history("s1", "it", since_index=4))) == [4, 5, 6, 7]
+    assert _indexes(asyncio.run(mongo_service.get_chat_history("s1", "it"))) == list(range(8))
+
+
+def test_history_pages_walk_back_by_message_index(history):
+    pages = []
+    before = None
+    while True:
+        page, before = asyncio.run(mongo_service.get_chat_history_page("s1", "it", before=before, limit=3))
+        pages.append(_indexes(page))
+        if before is None:
+            break
+
+    assert pages == [[5, 6, 7], [2, 3, 4], [0, 1]]
@@ -0,0 +1,61 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+from services import chunk_compression as compression
+
+pytest.importorskip("zstandard")
+
+
+@pytest.fixture
+def db(monkeypatch, async_fake_collection):
+    collections = defaultdict(async_fake_collection)
+    monkeypatch.setattr(compression, "get_database", lambda: collections)
+    monkeypatch.setenv("CHUNK_TEXT_COMPRESSION_ENABLED", "true")
+    monkeypatch.setenv("CHUNK_TEXT_COMPRESS_MIN_BYTES", "64")
+    for name in ("_dicts", "_active", "_compressors", "_decompressors"):
+        monkeypatch.setattr(compression, name, {})
+    monkeypatch.setattr(compression, "_loaded_at", float("inf"))
+    return collections
+
+
+def _samples(n):
+    return [
+        f"Contract {i} renews on the first business day of month {i % 12 + 1}; "
+        f"support tier {i % 3} covers routers, switches and firewall appliance model FW-{1000 + i}."
+        for i in range(n)
+    ]
+
+
+def test_chunks_round_trip_through_a_domain_dictionary(db):
+    zdict = compression.train_dictionary(_samples(400), 4096)
+    dict_id = asyncio.run(compression.save_dictionary("sales", zdict, 400))
+    text = _samples(401)[-1]
+    short = {"chunk_id": "b:0", "domain": "sales", "text": "tiny"}
+
+    stored = asyncio.run(compression.encode_chunk_docs([{"chunk_id": "a:0", "domain": "sales", "text": text}, short]))
+
+    assert "text" not in stored[0] and stored[0]["text_codec"] == "zstd"
+    assert len(stored[0]["text_z"]) < len(text.encode("utf-8"))
+    assert stored[1] == short
+
+    # A worker that has never seen the dictionary fetches it by id.
+    compression._dicts.clear()
+    compression._decompressors.clear()
+    asyncio.run(compression.decode_chunk_docs(stored))
+
+    assert [doc["text"] for doc in stored] == [text, "tiny"]
+    assert dict_id in compression._dicts
+    assert "text_z" not in stored[0]
+
+
+def test_missing_dictionary_is_an_error_not_garbage(db):
+    zdict = compression.train_dictionary(_samples(400), 4096)
+    compression.register_dictionary("sales", zdict)
+    stored = asyncio.run(compression.encode_chunk_docs([{"chunk_id": "a:0", "domain": "sales", "text": _samples(1)[0]}]))
+    compression._dicts.clear()
+    compression._decompressors.clear()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(compression.decode_chunk_docs(stored))
@@ -0,0 +1,60 @@
+import asyncio
+from collections import OrderedDict, defaultdict
+
+import pytest
+
+from services import chunk_text_store as store
+from services import mongo_service
+
+
+@pytest.fixture(autouse=True)
+def empty_store(monkeypatch):
+    monkeypatch.setenv("CHUNK_TEXT_CACHE_ENABLED", "true")
+    monkeypatch.setattr(store, "_entries", OrderedDict())
+    monkeypatch.setattr(store, "_chunks_by_file", {})
+    monkeypatch.setattr(store, "_size_bytes", 0)
+    monkeypatch.setattr(store, "_file_invalidated", OrderedDict())
+    monkeypatch.setattr(store, "_domain_invalidated", {})
+    monkeypatch.setattr(store, "_domain_versions", {})
+
+
+def _doc(chunk_id, text, domain="it"):
+    return {"chunk_id": chunk_id, "file_id": chunk_id.split(":")[0], "domain": domain, "text": text}
+
+
+def test_fill_started_before_an_invalidation_is_dropped():
+    store.put_chunks([_doc("a:0", "old")])
+    token = store.fill_token()
+    # The file is re-ingested while a reader is still fetching the old text.
+    store.invalidate_file("a")
+    store.put_chunks([_doc("a:0", "old")], since=token)
+
+    assert store.get_texts(["a:0"]) == ({}, ["a:0"])
+
+    store.put_chunks([_doc("a:0", "new")], since=store.fill_token())
+    assert store.get_texts(["a:0"]) == ({"a:0": "new"}, [])
+
+
+def test_domain_version_change_drops_that_domain_only():
+    store.sync_domain_versions({"it": 1, "sales": 1})
+    store.put_chunks([_doc("a:0", "it text"), _doc("b:0", "sales text", domain="sales")])
+
+    assert store.sync_domain_versions({"it": 2, "sales": 1}) == ["it"]
+    assert store.get_texts(["a:0", "b:0"]) == ({"b:0": "sales text"}, ["a:0"])
+
+
+def test_get_chunk_texts_reads_only_misses_from_mongo(monkeypatch, async_fake_collection):
+    db = defaultdict(async_fake_collection)
+    db["chunks"].docs.extend([dict(_doc("a:0", "alpha"), _id=1), dict(_doc("b:0", "beta"), _id=2)])
+    monkeypatch.setattr(mongo_service, "get_db", lambda: db)
+    monkeypatch.setattr(mongo_service, "_chunk_versions_checked_at", float("inf"))
+    store.put_chunks([_doc("a:0", "alpha")])
+    reads = []
+    find = db["chunks"].find
+    monkeypatch.setattr(db["chunks"], "find", lambda query, projection=None: reads.append(query) or find(query, projection))
+
+    texts = asyncio.run(mongo_service.get_chunk_texts(["a:0", "b:0"]))
+
+    assert texts == {"a:0": "alpha", "b:0": "beta"}
+    assert reads == [{"chunk_id": {"$in": ["b:0"]}}]
+    assert store.get_texts(["b:0"]) == ({"b:0": "beta"}, [])
@@ -0,0 +1,87 @@
+import asyncio
+import json
+
+import pytest
+
+from api import files as files_api
+from services import file_events
+
+
+class FakeRequest:
+    async def is_disconnected(self):
+        return False
+
+
+@pytest.fixture(autouse=True)
+def clean_events(monkeypatch):
+    monkeypatch.setattr(file_events, "_subscriptions", set())
+    monkeypatch.setattr(file_events, "_latest", file_events.OrderedDict())
+
+
+def _events(chunks):
+    return [json.loads(chunk.split("data: ", 1)[1]) for chunk in chunks if chunk.startswith("event: file_status")]
+
+
+async def _collect(response, on_chunk=None):
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk)
+        if on_chunk:
+            on_chunk(chunk)
+    return chunks
+
+
+def test_stream_opens_with_current_state_and_closes_when_done(monkeypatch):
+    async def get_file(file_id):
+        return {"domain": "it", "processing_status": "processing"}
+
+    monkeypatch.setattr(files_api, "get_file", get_file)
+
+    def ingest_progress(chunk):
+        if '"processing_status": "processing"' in chunk and '"chunks_embedded"' not in chunk:
+            file_events.publish("f1", "it", "processing", "processing", chunks_embedded=5, chunks_total=10)
+            file_events.publish("f1", "it", "completed", "completed", chunks_embedded=10, chunks_total=10)
+
+    async def run():
+        response = await files_api.stream_file_events(FakeRequest(), domain=None, file_id=["f1"])
+        return await _collect(response, ingest_progress)
+
+    chunks = asyncio.run(run())
+
+    assert chunks[0] == "retry: 3000\n\n"
+    statuses = [(e["processing_status"], e.get("chunks_embedded")) for e in _events(chunks)]
+    assert statuses == [("processing", None), ("processing", 5), ("completed", 10)]
+    assert file_events.subscriber_count() == 0
+
+
+def test_files_ingested_by_another_worker_are_polled_on_heartbeat(monkeypatch):
+    monkeypatch.setenv("FILE_EVENTS_HEARTBEAT_SECONDS", "0.01")
+    reads = []
+
+    async def get_file(file_id):
+        reads.append(file_id)
+        return {"domain": "it", "processing_status": "processing" if len(reads) < 3 else "completed", "num_chunks": 4}
+
+    monkeypatch.setattr(files_api, "get_file", get_file)
+
+    async def run():
+        response = await files_api.stream_file_events(FakeRequest(), domain=None, file_id=["f1"])
+        return await asyncio.wait_for(_collect(response), timeout=2)
+
+    events = _events(asyncio.run(run()))
+
+    assert [e["processing_status"] for e in events] == ["processing", "completed"]
+    assert events[-1]["chunks_embedded"] == 4
+
+
+def test_slow_subscribers_drop_their_oldest_events(monkeypatch):
+    monkeypatch.setenv("FILE_EVENTS_QUEUE_SIZE", "2")
+
+    async def run():
+        sub = file_events.subscribe(domain="it")
+        other = file_events.subscribe(file_ids=["zz"])
+        for i in range(3):
+            file_events.publish(f"f{i}", "it", "processing", "processing")
+        return [sub.queue.get_nowait()["file_id"] for _ in range(sub.queue.qsize())], other.queue.qsize()
+
+    assert asyncio.run(run()) == (["f1", "f2"], 0)
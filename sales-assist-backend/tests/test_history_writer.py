@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from services import history_writer
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    monkeypatch.setenv("HISTORY_WRITE_BEHIND_ENABLED", "true")
+    monkeypatch.setenv("HISTORY_WRITE_BEHIND_INTERVAL_MS", "1")
+    monkeypatch.setattr(history_writer, "_queue", [])
+    monkeypatch.setattr(history_writer, "_inflight", [])
+    monkeypatch.setattr(history_writer, "_recent", history_writer.deque(maxlen=256))
+    monkeypatch.setattr(history_writer, "_wake", None)
+    monkeypatch.setattr(history_writer, "_task", None)
+    monkeypatch.setattr(history_writer, "stamp_chat_messages", lambda messages: [dict(m, tokens=1) for m in messages])
+    stored = []
+    batches = []
+
+    async def write_chat_batch(writes):
+        batches.append([(w.session_id, [m["content"] for m in w.messages], w.first_index) for w in writes])
+        for write in writes:
+            if write.first_index is None:
+                write.first_index = writer_state["reserved"]
+                writer_state["reserved"] += len(write.messages)
+            for offset, message in enumerate(write.messages):
+                message["index"] = write.first_index + offset
+        if writer_state["fail"]:
+            writer_state["fail"] -= 1
+            raise RuntimeError("primary stepped down")
+        stored.extend(dict(m, session_id=w.session_id) for w in writes for m in w.messages)
+
+    async def get_chat_history(session_id, domain, max_tokens=None, since_index=None):
+        return [dict(m) for m in stored if m["session_id"] == session_id]
+
+    writer_state = {"fail": 0, "reserved": 0, "stored": stored, "batches": batches}
+    monkeypatch.setattr(history_writer, "write_chat_batch", write_chat_batch)
+    monkeypatch.setattr(history_writer, "get_chat_history", get_chat_history)
+    return writer_state
+
+
+def _msg(content):
+    return {"role": "user", "content": content}
+
+
+def test_queued_writes_coalesce_per_session_and_are_readable(writer):
+    async def run():
+        await history_writer.append_chat_messages("s1", "it", [_msg("a")])
+        await history_writer.append_chat_messages("s2", "it", [_msg("x")])
+        await history_writer.append_chat_messages("s1", "it", [_msg("b")])
+        before = await history_writer.read_chat_history("s1", "it")
+        await history_writer.flush()
+        after = await history_writer.read_chat_history("s1", "it")
+        await history_writer.shutdown()
+        return before, after
+
+    before, after = asyncio.run(run())
+
+    assert [m["content"] for m in before] == ["a", "b"]
+    assert writer["batches"] == [[("s1", ["a", "b"], None), ("s2", ["x"], None)]]
+    # Persisted and recently flushed copies are not doubled up.
+    assert [m["content"] for m in after] == ["a", "b"]
+
+
+def test_failed_flush_is_retried_in_order_with_its_reserved_indexes(writer):
+    writer["fail"] = 1
+
+    async def run():
+        await history_writer.append_chat_messages("s1", "it", [_msg("a")])
+        with pytest.raises(RuntimeError):
+            await history_writer.flush()
+        await history_writer.append_chat_messages("s1", "it", [_msg("b")])
+        await history_writer.flush()
+        await history_writer.shutdown()
+
+    asyncio.run(run())
+
+    # The retried write keeps index 0 and is not merged with the newer one.
+    assert writer["batches"][1] == [("s1", ["a"], 0), ("s1", ["b"], None)]
+    assert [(m["content"], m["index"]) for m in writer["stored"]] == [("a", 0), ("b", 1)]
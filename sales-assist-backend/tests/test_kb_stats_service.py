@@ -0,0 +1,69 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+from bson import ObjectId
+
+from services import kb_stats_service as kb_stats
+
+
+FILE_ID = ObjectId("0000000000000000000000aa")
+
+
+@pytest.fixture
+def db(monkeypatch, async_fake_collection):
+    collections = defaultdict(async_fake_collection)
+    collections["kb_stats"] = async_fake_collection(unique=[("domain",)])
+    monkeypatch.setattr(kb_stats, "get_database", lambda: collections)
+    monkeypatch.setattr(kb_stats, "BASE_DOMAINS", {"it"})
+    collections["files"].docs.append({"_id": FILE_ID, "domain": "it", "processing_status": "processing"})
+    return collections
+
+
+def _it(db):
+    return asyncio.run(kb_stats.get_kb_stats("it"))["domains"]["it"]
+
+
+def test_file_contribution_is_counted_and_released_once(db):
+    async def ingest_twice_then_delete_twice():
+        await kb_stats.record_file_added("it", "processing")
+        await kb_stats.record_file_contribution(str(FILE_ID), "it", chunks=3, tokens=120, vectors=3)
+        await kb_stats.record_file_contribution(str(FILE_ID), "it", chunks=3, tokens=120, vectors=3)
+        await kb_stats.record_status_change("it", "processing", "completed")
+        counted = await kb_stats.get_kb_stats("it")
+        await kb_stats.release_file_contribution(str(FILE_ID))
+        await kb_stats.release_file_contribution(str(FILE_ID))
+        return counted["domains"]["it"]
+
+    counted = asyncio.run(ingest_twice_then_delete_twice())
+
+    assert counted == {"files": {"completed": 1}, "total_files": 1, "chunks": 3, "tokens": 120, "vectors": 3}
+    assert _it(db)["chunks"] == 0 and _it(db)["vectors"] == 0
+
+
+def test_reconcile_repairs_drifted_counters(db):
+    db["files"].docs[0].update(processing_status="completed", kb_counted={"chunks": 2, "tokens": 50, "vectors": 2})
+    # A crash lost the status change and the contribution $inc.
+    asyncio.run(kb_stats.record_file_added("it", "processing"))
+
+    repaired = asyncio.run(kb_stats.reconcile_kb_stats())
+
+    assert repaired["it"]["after"]["files"] == {"completed": 1}
+    assert _it(db) == {"files": {"completed": 1}, "total_files": 1, "chunks": 2, "tokens": 50, "vectors": 2}
+    assert asyncio.run(kb_stats.reconcile_kb_stats()) == {}
+
+
+def test_reconcile_leaves_a_domain_that_changed_while_counting(db, monkeypatch):
+    asyncio.run(kb_stats.record_file_added("it", "processing"))
+    counts = kb_stats._actual_counts
+
+    async def counts_then_concurrent_ingest(database, domain):
+        actual = await counts(database, domain)
+        await asyncio.sleep(0.001)
+        await kb_stats.record_file_added(domain, "processing")
+        return actual
+
+    monkeypatch.setattr(kb_stats, "_actual_counts", counts_then_concurrent_ingest)
+
+    assert asyncio.run(kb_stats.reconcile_kb_stats()) == {}
+    assert _it(db)["files"] == {"processing": 2}
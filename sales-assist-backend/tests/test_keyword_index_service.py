@@ -0,0 +1,51 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+from services import keyword_index_service as keywords
+
+
+@pytest.fixture
+def db(monkeypatch, async_fake_collection):
+    collections = defaultdict(async_fake_collection)
+    monkeypatch.setattr(keywords, "get_db", lambda: collections)
+    return collections
+
+
+def _chunk(chunk_id, text, domain="it"):
+    file_id, index = chunk_id.split(":")
+    return {"chunk_id": chunk_id, "file_id": file_id, "domain": domain, "chunk_index": int(index), "text": text}
+
+
+def test_tokenize_keeps_skus_whole_and_split():
+    assert keywords.tokenize("Order AB-1234 for the router") == ["order", "ab-1234", "ab", "1234", "router"]
+
+
+def test_bm25_ranks_exact_sku_matches_first(db):
+    chunks = [
+        _chunk("a:0", "router firmware update guide"),
+        _chunk("b:0", "replacement part ab-1234 for the router"),
+        _chunk("c:0", "vpn setup on laptops"),
+        _chunk("d:0", "printer driver install"),
+    ]
+    asyncio.run(keywords.index_chunks(chunks))
+
+    records = asyncio.run(keywords.keyword_search("ab-1234 router", top_k=5, domains=["it"]))
+
+    assert records[0]["chunk_id"] == "b:0"
+    assert [rec["chunk_id"] for rec in records] == ["b:0", "a:0"]
+    assert records[0]["keyword_score"] > records[1]["keyword_score"] > 0
+    assert db["keyword_stats"].docs[0]["doc_count"] == 4
+
+
+def test_search_is_scoped_to_domains_and_files(db):
+    asyncio.run(keywords.index_chunks([
+        _chunk("a:0", "quarterly pricing sheet", domain="sales"),
+        _chunk("b:0", "pricing for support contracts", domain="it"),
+        _chunk("c:0", "pricing tiers explained", domain="it"),
+    ]))
+
+    assert [r["chunk_id"] for r in asyncio.run(keywords.keyword_search("pricing", 5, ["sales"]))] == ["a:0"]
+    scoped = asyncio.run(keywords.keyword_search("pricing", 5, ["it"], file_ids=["c"]))
+    assert [r["chunk_id"] for r in scoped] == ["c:0"]
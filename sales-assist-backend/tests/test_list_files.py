@@ -0,0 +1,52 @@
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from services import mongo_service
+
+
+@pytest.fixture
+def files(monkeypatch, async_fake_collection):
+    db = defaultdict(async_fake_collection)
+    monkeypatch.setattr(mongo_service, "get_db", lambda: db)
+    base = datetime(2024, 5, 1)
+    # Two uploads share a timestamp, so the _id tie-break matters.
+    stamps = [base, base + timedelta(seconds=1), base + timedelta(seconds=1), base + timedelta(seconds=2), base + timedelta(seconds=3)]
+    for i, created_at in enumerate(stamps):
+        db["files"].docs.append(
+            {"_id": ObjectId(f"{i + 1:024x}"), "filename": f"f{i}", "created_at": created_at, "domain": "it", "text": "x" * 100}
+        )
+    return db["files"]
+
+
+def _all_pages(limit, between_pages=None):
+    names, cursor = [], None
+    while True:
+        page, cursor = asyncio.run(mongo_service.list_files(domain="it", cursor=cursor, limit=limit))
+        names += [row["filename"] for row in page]
+        if cursor is None:
+            return names
+        if between_pages:
+            between_pages()
+
+
+def test_pages_walk_every_file_once_newest_first(files):
+    assert _all_pages(2) == ["f4", "f3", "f2", "f1", "f0"]
+
+
+def test_uploads_between_pages_do_not_shift_later_pages(files):
+    def upload():
+        files.docs.append({"_id": ObjectId(), "filename": "new.pdf", "created_at": datetime(2030, 1, 1), "domain": "it"})
+
+    assert _all_pages(2, between_pages=upload) == ["f4", "f3", "f2", "f1", "f0"]
+
+
+def test_listing_is_projected_and_rejects_bad_cursors(files):
+    page, _ = asyncio.run(mongo_service.list_files(limit=1))
+    assert set(page[0]) == {"file_id", "filename", "created_at", "processing_status", "domain"}
+
+    with pytest.raises(ValueError):
+        asyncio.run(mongo_service.list_files(cursor="not-a-cursor"))
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from services.local_vector_store import LocalVectorCollection
+
+
+@pytest.fixture(autouse=True)
+def exact_search(monkeypatch):
+    monkeypatch.setenv("LOCAL_VECTOR_STORE_INDEX", "flat")
+    monkeypatch.setenv("VECTOR_QUANTIZATION", "none")
+    monkeypatch.setenv("LOCAL_VECTOR_STORE_COMPACT_RATIO", "1.1")
+
+
+def _insert(store, file_id, count, offset=0):
+    vectors = np.eye(4, dtype=np.float32)[[(offset + i) % 4 for i in range(count)]]
+    store.insert(
+        [f"{file_id}:{i}" for i in range(count)],
+        vectors.tolist(),
+        [{"file_id": file_id, "domain": "it", "chunk_index": i} for i in range(count)],
+    )
+
+
+def test_workers_see_each_others_writes(tmp_path):
+    first = LocalVectorCollection(str(tmp_path), 4)
+    second = LocalVectorCollection(str(tmp_path), 4)
+
+    _insert(first, "a", 2)
+    _insert(second, "b", 2)
+    assert first.count() == second.count() == 4
+
+    second.delete_by_file_id("a")
+    hits = first.search([1.0, 0.0, 0.0, 0.0], 4, domain="it")
+    assert {hit.entity["file_id"] for hit in hits} == {"b"}
+
+
+def _worker(root, worker):
+    store = LocalVectorCollection(root, 4)
+    for n in range(5):
+        _insert(store, f"w{worker}-{n}", 3)
+
+
+def test_concurrent_processes_do_not_lose_segments(tmp_path):
+    context = multiprocessing.get_context("fork")
+    procs = [context.Process(target=_worker, args=(str(tmp_path), worker)) for worker in range(2)]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(30)
+        assert proc.exitcode == 0
+
+    assert LocalVectorCollection(str(tmp_path), 4).count() == 2 * 5 * 3
+
+
+def test_crash_during_compaction_leaves_no_duplicates(tmp_path, monkeypatch):
+    store = LocalVectorCollection(str(tmp_path), 4)
+    _insert(store, "a", 3)
+    _insert(store, "b", 3)
+    store.delete_by_file_id("a")
+
+    def crash():
+        raise OSError("disk full")
+
+    monkeypatch.setattr(store, "_persist_manifest", crash)
+    with pytest.raises(OSError):
+        store.compact()
+    monkeypatch.undo()
+
+    reopened = LocalVectorCollection(str(tmp_path), 4)
+    assert reopened.count() == 3
+    hits = reopened.search([1.0, 0.0, 0.0, 0.0], 10)
+    assert sorted(hit.id for hit in hits) == ["b:0", "b:1", "b:2"]
+
+
+def test_compaction_keeps_live_rows_across_processes(tmp_path):
+    store = LocalVectorCollection(str(tmp_path), 4)
+    other = LocalVectorCollection(str(tmp_path), 4)
+    _insert(store, "a", 3)
+    _insert(store, "b", 3)
+    store.delete_by_file_id("a")
+    store.compact()
+
+    assert len([n for n in os.listdir(tmp_path) if n.startswith("seg_")]) == 1
+    assert sorted(hit.id for hit in other.search([1.0, 0.0, 0.0, 0.0], 10)) == ["b:0", "b:1", "b:2"]
+
+
+def test_radius_keeps_hits_scoring_exactly_at_it(tmp_path):
+    store = LocalVectorCollection(str(tmp_path), 4)
+    _insert(store, "a", 2)
+
+    hits = store.search([1.0, 0.0, 0.0, 0.0], 2, radius=1.0)
+
+    assert [hit.id for hit in hits] == ["a:0"]
@@ -0,0 +1,253 @@
+import re
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+from services import milvus_index_manager as manager
+
+
+class FakeMilvus:
+    """
+    Physical collections plus aliases, resolved the way Milvus does by name.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.aliases = {}
+        self.indexes = {}
+        self.dropped = []
+
+    def resolve(self, name):
+        return self.aliases.get(name, name)
+
+    def module(self):
+        milvus = self
+
+        class Collection:
+            def __init__(self, name, schema=None):
+                self.name = name
+                self.schema = schema or "schema"
+                if schema is not None:
+                    milvus.rows.setdefault(name, {})
+
+            @property
+            def _rows(self):
+                return milvus.rows[milvus.resolve(self.name)]
+
+            def insert(self, columns):
+                for row_id, embedding, file_id, domain, chunk_index in zip(*columns):
+                    self._rows[row_id] = {
+                        "id": row_id,
+                        "embedding": embedding,
+                        "file_id": file_id,
+                        "domain": domain,
+                        "chunk_index": chunk_index,
+                    }
+
+            def delete(self, expr):
+                file_id = re.fullmatch(r'file_id == "(.*)"', expr).group(1)
+                for row_id in [r for r, row in self._rows.items() if row["file_id"] == file_id]:
+                    del self._rows[row_id]
+
+            def query_iterator(self, batch_size, expr, output_fields, consistency_level):
+                match = re.fullmatch(r'file_id == "(.*)"', expr)
+                rows = [
+                    dict(row)
+                    for row in self._rows.values()
+                    if match is None or row["file_id"] == match.group(1)
+                ]
+                batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+                return types.SimpleNamespace(next=lambda: batches.pop(0) if batches else [], close=lambda: None)
+
+            def create_index(self, field_name, index_params):
+                milvus.indexes[milvus.resolve(self.name)] = index_params
+
+            def flush(self):
+                pass
+
+            def load(self):
+                pass
+
+            def release(self):
+                pass
+
+            def drop(self):
+                milvus.rows.pop(milvus.resolve(self.name), None)
+                milvus.dropped.append(self.name)
+
+            @property
+            def num_entities(self):
+                return len(self._rows)
+
+        def alter_alias(collection_name, alias):
+            milvus.aliases[alias] = collection_name
+
+        def create_alias(collection_name, alias):
+            assert alias not in milvus.rows, "alias name is taken by a collection"
+            milvus.aliases[alias] = collection_name
+
+        def drop_collection(name):
+            milvus.rows.pop(name)
+            milvus.dropped.append(name)
+
+        utility = types.SimpleNamespace(
+            alter_alias=alter_alias,
+            create_alias=create_alias,
+            drop_collection=drop_collection,
+            list_collections=lambda: list(milvus.rows),
+            list_aliases=lambda name: [a for a, target in milvus.aliases.items() if target == name],
+        )
+        return types.SimpleNamespace(Collection=Collection, utility=utility)
+
+
+@pytest.fixture
+def cluster(monkeypatch, fake_collection):
+    milvus = FakeMilvus()
+    state = fake_collection()
+    monkeypatch.setitem(sys.modules, "pymilvus", milvus.module())
+    monkeypatch.setattr(manager, "_state_collection", lambda: state)
+    monkeypatch.setattr(manager, "_phase_grace_seconds", lambda: 0.0)
+    monkeypatch.setattr(manager, "_drop_delay_seconds", lambda: 0.0)
+    monkeypatch.setattr(manager, "list_domains", lambda: [])
+    monkeypatch.setenv("MILVUS_REBUILD_STATE_CHECK_SECONDS", "0")
+    monkeypatch.setenv("MILVUS_FLAT_MAX_ENTITIES", "2")
+    monkeypatch.delenv("MILVUS_REINDEX_WINDOW", raising=False)
+    manager._active_plans.clear()
+    manager._shared_states.clear()
+    manager._last_checked.clear()
+    yield milvus, state
+    manager._active_plans.clear()
+    manager._shared_states.clear()
+
+
+def _seed(milvus, name, file_ids):
+    milvus.rows[name] = {
+        f"{fid}:{i}": {"id": f"{fid}:{i}", "embedding": [1.0], "file_id": fid, "domain": "it", "chunk_index": i}
+        for fid in file_ids
+        for i in range(2)
+    }
+
+
+def test_only_one_worker_holds_the_rebuild_lease(cluster, monkeypatch):
+    monkeypatch.setattr(manager, "_worker_id", "worker-a")
+    assert manager._acquire_lease("kb")
+
+    monkeypatch.setattr(manager, "_worker_id", "worker-b")
+    assert not manager._acquire_lease("kb")
+
+    _, state = cluster
+    state.docs[0]["lease_expires"] = time.time() - 1
+    assert manager._acquire_lease("kb")
+
+
+def test_maybe_reindex_skips_while_another_worker_rebuilds(cluster, monkeypatch):
+    milvus, state = cluster
+    _seed(milvus, "kb__v1", ["a", "b"])
+    milvus.aliases["kb"] = "kb__v1"
+    state.insert_one({"_id": "kb", "lease_owner": "other", "lease_expires": time.time() + 60, "phase": "copying"})
+    collection = milvus.module().Collection("kb")
+
+    assert not manager.maybe_reindex("kb", collection, force=True)
+    assert milvus.aliases["kb"] == "kb__v1"
+
+
+def test_write_from_another_worker_during_copy_is_resynced(cluster):
+    milvus, state = cluster
+    module = milvus.module()
+    _seed(milvus, "kb__v1", ["a", "b"])
+    milvus.aliases["kb"] = "kb__v1"
+    collection = module.Collection("kb")
+    original = collection.query_iterator
+    injected = []
+
+    def query_iterator(**kwargs):
+        iterator = original(**kwargs)
+        if injected:
+            return iterator
+        injected.append(True)
+        first_batch = iterator.next
+
+        def next_batch():
+            rows = first_batch()
+            if not rows:
+                # Another worker re-ingests file "b" after its rows were copied.
+                with manager.tracked_write("kb", ["b"]):
+                    collection.delete('file_id == "b"')
+                    collection.insert([["b:9"], [[0.5]], ["b"], ["it"], [9]])
+            return rows
+
+        iterator.next = next_batch
+        return iterator
+
+    collection.query_iterator = query_iterator
+    manager._acquire_lease("kb")
+    manager._rebuild_shadow("kb", collection, "kb__v1", manager.plan_for_size(10), 4)
+
+    live = milvus.resolve("kb")
+    assert live != "kb__v1"
+    assert sorted(milvus.rows[live]) == ["a:0", "a:1", "b:9"]
+    doc = state.find_one({"_id": "kb"})
+    assert doc["phase"] == "idle" and doc["lease_owner"] is None
+    assert doc["physical"] == live
+
+
+def test_writers_pause_while_the_alias_is_swapped(cluster):
+    _, state = cluster
+    state.insert_one({"_id": "kb", "lease_owner": "other", "lease_expires": time.time() + 60, "phase": "swapping"})
+    finished = threading.Event()
+
+    def finish_swap():
+        time.sleep(0.3)
+        state.update_one({"_id": "kb"}, {"$set": {"phase": "idle", "lease_owner": None, "lease_expires": 0.0}})
+        finished.set()
+
+    threading.Thread(target=finish_swap).start()
+    with manager.tracked_write("kb", ["a"]):
+        assert finished.is_set()
+
+
+def test_other_workers_adopt_the_swapped_plan(cluster):
+    milvus, state = cluster
+    _seed(milvus, "kb__v1", ["a", "b"])
+    milvus.aliases["kb"] = "kb__v1"
+    desired = manager.plan_for_size(10)
+    manager._acquire_lease("kb")
+    manager._rebuild_shadow("kb", milvus.module().Collection("kb"), "kb__v1", desired, 4)
+
+    # A worker that never rebuilt still holds the old plan in memory.
+    manager._active_plans["kb"] = manager.plan_for_size(0)
+    manager._shared_states.clear()
+    manager.refresh_shared_state("kb")
+
+    assert manager.get_active_plan("kb") == desired
+
+
+def test_pre_alias_collection_is_migrated_online(cluster, monkeypatch):
+    milvus, _ = cluster
+    monkeypatch.setenv("MILVUS_SHADOW_REBUILD", "true")
+    _seed(milvus, "kb", ["a", "b"])
+    collection = milvus.module().Collection("kb")
+
+    assert manager.maybe_reindex("kb", collection, force=True)
+
+    assert "kb" in milvus.aliases
+    assert "kb" in milvus.dropped
+    assert sorted(milvus.rows[milvus.resolve("kb")]) == ["a:0", "a:1", "b:0", "b:1"]
+
+
+def test_sq8_only_replaces_the_ivf_tier(monkeypatch):
+    monkeypatch.setenv("VECTOR_QUANTIZATION", "sq8")
+    monkeypatch.setenv("MILVUS_FLAT_MAX_ENTITIES", "10")
+    monkeypatch.setenv("MILVUS_HNSW_MIN_ENTITIES", "1000")
+    monkeypatch.delenv("MILVUS_INDEX_TYPE", raising=False)
+
+    assert manager.plan_for_size(5).index_type == "FLAT"
+    assert manager.plan_for_size(100).index_type == "IVF_SQ8"
+    assert manager.plan_for_size(5000).index_type == "HNSW"
+    assert manager.plan_for_size(100, index_type="IVF_FLAT").index_type == "IVF_FLAT"
+
+    monkeypatch.setenv("MILVUS_INDEX_TYPE", "IVF_FLAT")
+    assert manager.plan_for_size(100).index_type == "IVF_FLAT"
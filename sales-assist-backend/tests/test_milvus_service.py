@@ -0,0 +1,99 @@
+import types
+
+import pytest
+
+from services import milvus_service
+from services.milvus_index_manager import IndexPlan
+
+
+class DictHit(dict):
+    """
+    Shape of a pymilvus >=2.4 search hit: a dict with attribute accessors.
+    """
+
+    @property
+    def id(self):
+        return self["id"]
+
+    @property
+    def distance(self):
+        return self["distance"]
+
+    score = distance
+
+
+def test_rescore_reorders_hits_by_exact_score():
+    hits = [
+        DictHit(id="a", distance=0.9, entity={"file_id": "f"}),
+        DictHit(id="b", distance=0.8, entity={"file_id": "f"}),
+    ]
+    exact = {"a": [0.0, 1.0], "b": [1.0, 0.0]}
+    collection = types.SimpleNamespace(
+        name="kb",
+        query=lambda expr, output_fields: [{"id": k, "embedding": v} for k, v in exact.items()],
+    )
+
+    rescored = milvus_service._rescore_hits(collection, [1.0, 0.0], hits, 2, include_vectors=True)
+
+    assert [hit.id for hit in rescored] == ["b", "a"]
+    assert rescored[0].score > rescored[1].score
+    assert rescored[0]["entity"]["embedding"] == [1.0, 0.0]
+
+
+class SearchCollection:
+    name = "kb"
+
+    def __init__(self, hits, exact):
+        self.hits = hits
+        self.exact = exact
+        self.searches = []
+
+    def search(self, **kwargs):
+        self.searches.append(kwargs)
+        return [list(self.hits)]
+
+    def query(self, expr, output_fields):
+        return [{"id": k, "embedding": v} for k, v in self.exact.items()]
+
+
+@pytest.fixture
+def milvus(monkeypatch):
+    def install(index_type, hits, exact=None):
+        collection = SearchCollection(hits, exact or {})
+        monkeypatch.setenv("VECTOR_STORE", "milvus")
+        monkeypatch.setenv("VECTOR_RESCORE_MULTIPLIER", "3")
+        monkeypatch.setattr(milvus_service, "_ensure_collection", lambda name: collection)
+        monkeypatch.setattr(milvus_service, "refresh_shared_state", lambda name: None)
+        monkeypatch.setattr(milvus_service, "get_active_plan", lambda name: IndexPlan(index_type=index_type))
+        monkeypatch.setattr(
+            milvus_service,
+            "get_search_params",
+            lambda name, limit, domain=None: {"metric_type": "IP", "params": {"nprobe": 8}},
+        )
+        return collection
+
+    return install
+
+
+def test_relevance_floor_is_sent_as_a_range_search(milvus):
+    collection = milvus("IVF_FLAT", [DictHit(id="a", distance=0.9, entity={})])
+
+    milvus_service.search_embeddings([1.0, 0.0], 4, domain="it", radius=0.3)
+
+    search = collection.searches[0]
+    assert search["param"]["params"] == {"nprobe": 8, "radius": 0.3}
+    assert search["limit"] == 4
+    assert search["expr"] == 'domain == "it"'
+
+
+def test_sq8_widens_the_radius_and_applies_the_exact_floor(milvus, monkeypatch):
+    monkeypatch.setenv("VECTOR_RESCORE_RADIUS_MARGIN", "0.1")
+    hits = [DictHit(id="a", distance=0.31, entity={}), DictHit(id="b", distance=0.25, entity={})]
+    collection = milvus("IVF_SQ8", hits, {"a": [0.2, 0.98], "b": [0.6, 0.8]})
+
+    found = milvus_service.search_embeddings([1.0, 0.0], 2, radius=0.3)
+
+    search = collection.searches[0]
+    assert search["param"]["params"]["radius"] == pytest.approx(0.2)
+    assert search["limit"] == 6
+    assert [hit.id for hit in found] == ["b"]
@@ -0,0 +1,44 @@
+from services.mongo_indexes import INDEXES, QUERY_SHAPES
+from scripts.check_query_plans import classify
+
+
+def _filter_fields(query):
+    fields = set()
+    for key, value in query.items():
+        if key == "$or":
+            # Each branch needs its own index; the shared leading field is enough here.
+            branches = [_filter_fields(branch) for branch in value]
+            fields |= set.intersection(*branches)
+        else:
+            fields.add(key)
+    return fields
+
+
+def test_every_registered_query_shape_has_a_leading_index_field():
+    uncovered = []
+    for shape in QUERY_SHAPES:
+        if shape.allow_collscan:
+            continue
+        fields = _filter_fields(shape.filter) or {key for key, _ in shape.sort or ()}
+        if "_id" in fields:
+            continue
+        leading = {spec.keys[0][0] for spec in INDEXES if spec.collection == shape.collection}
+        if not fields & leading:
+            uncovered.append(shape.name)
+    assert uncovered == []
+
+
+def test_classify_flags_collscans_and_blocking_sorts():
+    collscan = {"queryPlanner": {"winningPlan": {"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}}}}
+    indexed = {
+        "queryPlanner": {
+            "winningPlan": {
+                "queryPlan": {"stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "domain_1"}}
+            }
+        }
+    }
+
+    assert classify(collscan) == {"collscan": True, "blocking_sort": True, "empty": False, "indexes": []}
+    assert classify(indexed)["indexes"] == ["domain_1"]
+    assert not classify(indexed)["collscan"]
+    assert classify({"queryPlanner": {"winningPlan": {"stage": "EOF"}}})["empty"]
@@ -0,0 +1,105 @@
+import asyncio
+import time
+
+from api import ask
+from services import prefetch_service
+
+
+def test_speculative_hit_skips_retrieval_and_returns_its_own_sources(monkeypatch):
+    monkeypatch.setenv("PREFETCH_ENABLED", "false")
+    used = [{"chunk_id": "f:7", "file_id": "f", "chunk_index": 7, "domain": "it", "score": 0.8, "text": "reset steps"}]
+    payload = {"answer": "Reset it.", "follow_up_questions": [], "confidence_score": 0.9}
+    prefetch_service._speculative.clear()
+    prefetch_service._speculative[("s1", "it", prefetch_service._normalize_question("How do I reset?"))] = (
+        payload, used, 120, 5.0, time.time()
+    )
+
+    async def fake_session(session_id):
+        return {"session_id": session_id}
+
+    async def fake_history(session_id, domain, max_tokens):
+        return None, [{"role": "assistant", "content": "hi", "timestamp": 5.0}]
+
+    async def no_retrieval(**kwargs):
+        raise AssertionError("retrieval must not run for a speculative hit")
+
+    async def fake_append(**kwargs):
+        return None
+
+    async def no_generation(*args, **kwargs):
+        raise AssertionError("generation must not run for a speculative hit")
+
+    monkeypatch.setattr(ask, "get_session", fake_session)
+    monkeypatch.setattr(ask, "load_history_context", fake_history)
+    monkeypatch.setattr(ask, "retrieve_chunk_records", no_retrieval)
+    monkeypatch.setattr(ask, "generate_domain_response", no_generation)
+    monkeypatch.setattr(ask, "append_chat_messages", fake_append)
+    monkeypatch.setattr(ask, "schedule_summary_update", lambda *args: None)
+
+    request = ask.ChatRequest(domain="it", message="how do i reset", session_id="s1")
+    response = asyncio.run(ask.chat(request))
+
+    assert response.answer == "Reset it."
+    assert [source["chunk_id"] for source in response.sources] == ["f:7"]
+
+
+def test_speculative_answer_for_older_conversation_state_is_dropped():
+    prefetch_service._speculative.clear()
+    key = ("s1", "it", prefetch_service._normalize_question("next?"))
+    prefetch_service._speculative[key] = ({"answer": "x"}, [], 0, 1.0, time.time())
+
+    assert prefetch_service.pop_speculative_answer("s1", "it", "next?", 2.0) is None
+    assert key not in prefetch_service._speculative
+
+
+def test_newer_typeahead_cancels_the_one_in_flight(monkeypatch):
+    monkeypatch.setenv("PREFETCH_ENABLED", "true")
+    monkeypatch.setenv("TYPEAHEAD_MIN_CHARS", "5")
+    monkeypatch.setenv("TYPEAHEAD_MIN_INTERVAL_SECONDS", "0")
+    prefetch_service._typeahead_last.clear()
+    prefetch_service._typeahead_tasks.clear()
+    remembered = []
+    started = []
+
+    async def fake_versions(domain):
+        return {"it": 1}
+
+    async def slow_retrieve(query, **kwargs):
+        started.append(query)
+        await asyncio.sleep(0.05)
+        return [{"chunk_id": query}]
+
+    async def fake_embed(text):
+        return [1.0]
+
+    monkeypatch.setattr(prefetch_service, "get_versions_for_domain", fake_versions)
+    monkeypatch.setattr(prefetch_service, "retrieve_chunk_records", slow_retrieve)
+    monkeypatch.setattr(prefetch_service, "embed_query_async", fake_embed)
+    monkeypatch.setattr(
+        prefetch_service,
+        "remember_typeahead",
+        lambda session_id, domain, file_ids, embedding, records, versions, query: remembered.append(query),
+    )
+
+    async def type_message():
+        assert prefetch_service.schedule_typeahead_prefetch("s1", "it", [], "how") == "skipped"
+        assert prefetch_service.schedule_typeahead_prefetch("s1", "it", [], "how do I") == "scheduled"
+        await asyncio.sleep(0.01)
+        assert prefetch_service.schedule_typeahead_prefetch("s1", "it", [], "how do I reset") == "scheduled"
+        await asyncio.sleep(0.1)
+
+    asyncio.run(type_message())
+
+    assert started == ["how do I", "how do I reset"]
+    assert remembered == ["how do I reset"]
+    assert "s1" not in prefetch_service._typeahead_tasks
+
+
+def test_typeahead_is_rate_limited_per_session(monkeypatch):
+    monkeypatch.setenv("PREFETCH_ENABLED", "true")
+    monkeypatch.setenv("TYPEAHEAD_MIN_CHARS", "1")
+    monkeypatch.setenv("TYPEAHEAD_MIN_INTERVAL_SECONDS", "60")
+    prefetch_service._typeahead_last.clear()
+    prefetch_service._typeahead_last["s1"] = time.time()
+
+    assert prefetch_service.schedule_typeahead_prefetch("s1", "it", [], "reset router") == "rate_limited"
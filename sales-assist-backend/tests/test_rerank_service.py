@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+
+from services import rerank_service
+
+
+class FakeCrossEncoder:
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, pairs, batch_size, show_progress_bar):
+        self.batches.append([text for _query, text in pairs])
+        return [float(text.count("vpn")) for _query, text in pairs]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeCrossEncoder()
+    monkeypatch.setattr(rerank_service, "_model", model)
+    rerank_service._score_cache.clear()
+    yield model
+    rerank_service._score_cache.clear()
+
+
+def _records(*texts):
+    return [{"chunk_id": f"c{i}", "text": text} for i, text in enumerate(texts)]
+
+
+def test_rerank_orders_by_cross_encoder_in_one_batch(model):
+    ranked = asyncio.run(rerank_service.rerank_records("vpn", _records("printer", "vpn vpn", "vpn"), 2))
+
+    assert [rec["chunk_id"] for rec in ranked] == ["c1", "c2"]
+    assert model.batches == [["printer", "vpn vpn", "vpn"]]
+
+
+def test_cached_pairs_are_not_rescored_unless_text_changed(model):
+    asyncio.run(rerank_service.rerank_records("VPN ", _records("printer", "vpn"), 2))
+    asyncio.run(rerank_service.rerank_records("vpn", _records("printer", "vpn again"), 2))
+
+    assert model.batches == [["printer", "vpn"], ["vpn again"]]
@@ -0,0 +1,120 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from rag import retrieve
+
+
+def _hit(chunk_id, score):
+    file_id = chunk_id.split(":")[0]
+    return SimpleNamespace(
+        id=chunk_id,
+        score=score,
+        entity={"id": chunk_id, "file_id": file_id, "domain": "it", "chunk_index": 0},
+    )
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setenv("RERANK_ENABLED", "false")
+    monkeypatch.setenv("HYBRID_SEARCH", "false")
+    monkeypatch.setenv("RAG_NEIGHBOR_WINDOW", "0")
+    searches = []
+
+    async def fake_texts(chunk_ids):
+        return {chunk_id: f"text {chunk_id}" for chunk_id in chunk_ids}
+
+    monkeypatch.setattr(retrieve, "get_chunk_texts", fake_texts)
+    return searches
+
+
+def _run(min_score=0.2, top_k=2):
+    return asyncio.run(
+        retrieve._retrieve_chunk_records_uncached("q", [1.0, 0.0], [], "it", top_k, min_score)
+    )
+
+
+def _route_to(monkeypatch, searches, routed_hits, domain_hits):
+    async def fake_route(query_embedding, domain, file_ids):
+        return ["routed"]
+
+    def fake_search(query_embedding, top_k, file_ids, domain, include_vectors=False, radius=None):
+        searches.append((file_ids, radius))
+        return routed_hits if file_ids == ["routed"] else domain_hits
+
+    monkeypatch.setattr(retrieve, "route_files", fake_route)
+    monkeypatch.setattr(retrieve, "_search_hits", fake_search)
+
+
+def test_short_routed_result_falls_back_even_under_a_radius(monkeypatch, pipeline):
+    _route_to(monkeypatch, pipeline, [_hit("routed:0", 0.7)], [_hit("a:0", 0.8), _hit("routed:0", 0.7)])
+
+    records = _run(min_score=0.2)
+
+    assert [files for files, _radius in pipeline] == [["routed"], []]
+    assert pipeline[0][1] == 0.2
+    assert [rec["chunk_id"] for rec in records] == ["a:0", "routed:0"]
+
+
+def test_weak_routed_result_falls_back(monkeypatch, pipeline):
+    weak = [_hit("routed:0", 0.25), _hit("routed:1", 0.22)]
+    _route_to(monkeypatch, pipeline, weak, [_hit("a:0", 0.8), _hit("a:1", 0.75)])
+
+    records = _run(min_score=0.2)
+
+    assert len(pipeline) == 2
+    assert [rec["chunk_id"] for rec in records] == ["a:0", "a:1"]
+
+
+def test_strong_full_routed_result_is_kept(monkeypatch, pipeline):
+    _route_to(monkeypatch, pipeline, [_hit("routed:0", 0.8), _hit("routed:1", 0.7)], [])
+
+    records = _run(min_score=0.2)
+
+    assert len(pipeline) == 1
+    assert [rec["chunk_id"] for rec in records] == ["routed:0", "routed:1"]
+
+
+def test_fused_keyword_only_records_carry_a_score(monkeypatch, pipeline):
+    monkeypatch.setenv("HYBRID_SEARCH", "true")
+    _route_to(monkeypatch, pipeline, [_hit("a:0", 0.8)], [_hit("a:0", 0.8)])
+
+    async def fake_keyword_search(query, top_k, domains, file_ids=None):
+        return [
+            {"chunk_id": "a:0", "file_id": "a", "domain": "it", "chunk_index": 0, "keyword_score": 3.0},
+            {"chunk_id": "k:0", "file_id": "k", "domain": "it", "chunk_index": 0, "keyword_score": 2.0},
+        ]
+
+    monkeypatch.setattr(retrieve, "keyword_search", fake_keyword_search)
+
+    records = {rec["chunk_id"]: rec for rec in _run(min_score=0.2, top_k=2)}
+
+    assert records["a:0"]["score"] == 0.8
+    assert records["k:0"]["score"] == records["k:0"]["rrf_score"] > 0
+
+
+def test_neighbor_windows_are_fetched_once_and_fit_the_budget(monkeypatch):
+    monkeypatch.setenv("RAG_NEIGHBOR_DECAY", "0.5")
+    requested = []
+
+    async def fake_windows(windows):
+        requested.append(windows)
+        return [
+            {"chunk_id": f"f:{i}", "file_id": "f", "domain": "it", "chunk_index": i, "text": f"word{i}"}
+            for i in range(0, 8)
+        ]
+
+    monkeypatch.setattr(retrieve, "get_chunk_windows", fake_windows)
+    hits = [
+        {"chunk_id": "f:2", "file_id": "f", "chunk_index": 2, "text": "word2", "score": 0.8},
+        {"chunk_id": "f:4", "file_id": "f", "chunk_index": 4, "text": "word4", "score": 0.6},
+    ]
+
+    records = asyncio.run(retrieve._expand_neighbor_windows(hits, 1, max_tokens=4))
+
+    assert requested == [{"f": [(1, 5)]}]
+    neighbors = records[2:]
+    assert [rec["chunk_id"] for rec in neighbors] == ["f:1", "f:3"]
+    assert neighbors[0]["score"] == pytest.approx(0.4)
+    assert neighbors[1]["neighbor_of"] == "f:2"
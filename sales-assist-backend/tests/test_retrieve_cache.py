@@ -0,0 +1,109 @@
+import asyncio
+import math
+
+from rag import retrieval_cache, retrieve, session_context
+
+
+def test_retrieve_chunk_records_served_from_cache(monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "true")
+    retrieval_cache._entries.clear()
+    calls = []
+
+    async def fake_embed(query):
+        return [0.1, 0.2, 0.3]
+
+    async def fake_versions(domains):
+        return {domain: 0 for domain in domains}
+
+    async def fake_uncached(query, query_embedding, file_ids, domain, top_k, min_score):
+        calls.append(query)
+        return [{"chunk_id": "f:0", "file_id": "f", "domain": domain, "score": 0.9, "text": "hello"}]
+
+    monkeypatch.setattr(retrieve, "embed_query_async", fake_embed)
+    monkeypatch.setattr(retrieval_cache, "get_domain_versions", fake_versions)
+    monkeypatch.setattr(retrieve, "_retrieve_chunk_records_uncached", fake_uncached)
+
+    first = asyncio.run(retrieve.retrieve_chunk_records("vpn reset", ["f"], domain="it", top_k=3))
+    second = asyncio.run(retrieve.retrieve_chunk_records("vpn reset", ["f"], domain="it", top_k=3))
+
+    assert first == second
+    assert second[0]["chunk_id"] == "f:0"
+    assert len(calls) == 1
+
+
+def test_top_up_keeps_stored_records_at_top_k(monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "false")
+    monkeypatch.setenv("SESSION_TOPUP_SIMILARITY", "0.0")
+    session_context.forget_session("s-top-up")
+    turn = iter(range(100))
+
+    async def fake_embed(query):
+        # Consecutive turns are similar enough to top up, not to reuse as-is.
+        # (Letters, not digits: numbers are key tokens that block reuse.)
+        angle = 0.5 * "abcdef".index(query[1:])
+        return [math.cos(angle), math.sin(angle), 0.0]
+
+    async def fake_versions(domains):
+        return {domain: 0 for domain in domains}
+
+    async def fake_uncached(query, query_embedding, file_ids, domain, top_k, min_score):
+        n = next(turn)
+        return [{"chunk_id": f"f:{n}-{i}", "score": 0.9} for i in range(top_k)]
+
+    monkeypatch.setattr(retrieve, "embed_query_async", fake_embed)
+    monkeypatch.setattr(retrieval_cache, "get_domain_versions", fake_versions)
+    monkeypatch.setattr(retrieve, "_retrieve_chunk_records_uncached", fake_uncached)
+
+    for n in range(6):
+        records = asyncio.run(
+            retrieve.retrieve_chunk_records(f"q{'abcdef'[n]}", ["f"], domain="it", top_k=3, session_id="s-top-up")
+        )
+
+    stored = session_context._turns[("s-top-up", "it")].records
+    assert len(records) == 5
+    assert len(stored) == 3
+
+
+def test_cache_key_tracks_query_text_only_when_asked():
+    embedding = [0.6, 0.8, 0.0]
+    sku_a = retrieval_cache.make_cache_key("it", ["f"], embedding, 3, query="Price of SKU-1001?")
+    sku_b = retrieval_cache.make_cache_key("it", ["f"], embedding, 3, query="price of sku 1002")
+    same = retrieval_cache.make_cache_key("it", ["f"], embedding, 3, query="  price OF sku-1001 ")
+
+    assert sku_a != sku_b
+    assert sku_a == same
+    assert retrieval_cache.make_cache_key("it", ["f"], embedding, 3) == retrieval_cache.make_cache_key(
+        "it", ["f"], [0.6, 0.8, 0.001], 3
+    )
+
+
+def test_lookup_rejects_dissimilar_query_in_same_bucket():
+    retrieval_cache._entries.clear()
+    key = ("it", ("f",), "bucket", "", 3, 0.0)
+    records = [{"chunk_id": "f:0"}]
+    retrieval_cache.store(key, {"it": 1}, records, [1.0, 0.0, 0.0])
+
+    assert retrieval_cache.lookup(key, {"it": 1}, [0.99, 0.05, 0.0]) == (records, False)
+    assert retrieval_cache.lookup(key, {"it": 1}, [0.6, 0.8, 0.0]) is None
+
+
+def test_no_version_read_when_cache_and_session_reuse_are_off(monkeypatch):
+    monkeypatch.setenv("RETRIEVAL_CACHE_ENABLED", "false")
+    monkeypatch.setenv("SESSION_REUSE_ENABLED", "false")
+
+    async def fake_embed(query):
+        return [1.0, 0.0, 0.0]
+
+    async def no_versions(domains):
+        raise AssertionError("domain versions must not be read")
+
+    async def fake_uncached(query, query_embedding, file_ids, domain, top_k, min_score):
+        return [{"chunk_id": "f:0", "score": 0.9}]
+
+    monkeypatch.setattr(retrieve, "embed_query_async", fake_embed)
+    monkeypatch.setattr(retrieval_cache, "get_domain_versions", no_versions)
+    monkeypatch.setattr(retrieve, "_retrieve_chunk_records_uncached", fake_uncached)
+
+    records = asyncio.run(retrieve.retrieve_chunk_records("q", ["f"], domain="it", top_k=3, session_id="s-off"))
+
+    assert records == [{"chunk_id": "f:0", "score": 0.9}]
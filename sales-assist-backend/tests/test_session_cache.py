@@ -0,0 +1,34 @@
+from services import session_cache
+
+
+def test_sticky_mode_needs_confirmation(monkeypatch):
+    monkeypatch.setenv("SESSION_CACHE_ENABLED", "true")
+    monkeypatch.setenv("SESSION_CACHE_MODE", "sticky")
+    monkeypatch.delenv("SESSION_CACHE_STICKY_CONFIRMED", raising=False)
+    session_cache.put_session({"session_id": "s1", "cache_version": 1})
+
+    assert session_cache.cache_mode() == "version"
+    assert session_cache.versioned()
+    assert session_cache.get_session("s1") is None
+
+    monkeypatch.setenv("SESSION_CACHE_STICKY_CONFIRMED", "true")
+    assert session_cache.cache_mode() == "sticky"
+    assert session_cache.get_session("s1") == {"session_id": "s1", "cache_version": 1}
+    session_cache.invalidate_session("s1")
+
+
+def test_tail_is_written_through_and_dropped_on_a_foreign_write(monkeypatch):
+    monkeypatch.setenv("SESSION_CACHE_ENABLED", "true")
+    monkeypatch.setenv("SESSION_CACHE_MODE", "version")
+    session_cache.put_session({"session_id": "s2", "cache_version": 1})
+    session_cache.put_tail("s2", "it", [], complete=True)
+    session_cache.append_tail("s2", "it", [{"index": 0, "tokens": 5}, {"index": 1, "tokens": 5}], 2)
+
+    assert session_cache.advance_version("s2", 2)
+    assert [m["index"] for m in session_cache.get_tail("s2", "it", 100, None)] == [0, 1]
+    assert session_cache.get_page("s2", "it", None, 1) == ([{"index": 1, "tokens": 5}], 1)
+
+    # Another worker wrote: the stored version jumped past ours.
+    session_cache.put_session({"session_id": "s2", "cache_version": 4})
+    assert session_cache.get_tail("s2", "it", 100, None) is None
+    session_cache.invalidate_session("s2")
@@ -0,0 +1,28 @@
+from rag import session_context
+
+
+def test_reuse_skipped_after_domain_version_bump():
+    session_context.forget_session("s1")
+    records = [{"chunk_id": "f:0", "score": 0.9}]
+    session_context.remember_retrieval("s1", "it", ["f"], [1.0, 0.0], records, {"it": 3})
+
+    same = session_context.match_turn("s1", "it", ["f"], "vpn reset", [1.0, 0.0], {"it": 3})
+    bumped = session_context.match_turn("s1", "it", ["f"], "vpn reset", [1.0, 0.0], {"it": 4})
+
+    assert same is not None and same.mode == "reuse"
+    assert bumped is None
+
+
+def test_similar_question_about_another_sku_is_not_reused():
+    session_context.forget_session("s2")
+    records = [{"chunk_id": "f:0", "score": 0.9}]
+    session_context.remember_retrieval(
+        "s2", "it", ["f"], [1.0, 0.0], records, {"it": 1}, query="Price of SKU-1001?"
+    )
+
+    other = session_context.match_turn("s2", "it", ["f"], "price of SKU-1002", [1.0, 0.01], {"it": 1})
+    same = session_context.match_turn("s2", "it", ["f"], "what's the price of sku-1001", [1.0, 0.01], {"it": 1})
+
+    assert other is None
+    assert same is not None and same.mode == "reuse" and same.records == records
+    assert session_context._key_tokens("SKU-1001 x2") == session_context._key_tokens("sku1001 X2")
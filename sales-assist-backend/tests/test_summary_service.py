@@ -0,0 +1,89 @@
+import asyncio
+from collections import defaultdict
+
+import pytest
+
+from services import mongo_service, summary_service
+
+
+@pytest.fixture
+def db(monkeypatch, async_fake_collection):
+    collections = defaultdict(async_fake_collection)
+    collections["chat_summaries"] = async_fake_collection(unique=[("session_id", "domain")])
+    monkeypatch.setattr(mongo_service, "get_db", lambda: collections)
+    monkeypatch.setenv("SESSION_CACHE_ENABLED", "false")
+    return collections
+
+
+def test_an_older_summary_never_replaces_a_newer_one(db):
+    assert asyncio.run(mongo_service.save_chat_summary("s1", "it", "first ten", 10, 3))
+    assert not asyncio.run(mongo_service.save_chat_summary("s1", "it", "first six", 6, 3))
+    assert asyncio.run(mongo_service.save_chat_summary("s1", "it", "first twelve", 12, 3))
+
+    (doc,) = db["chat_summaries"].docs
+    assert (doc["summary"], doc["covered_until"]) == ("first twelve", 12)
+
+
+def test_backlog_is_folded_in_bounded_batches_by_one_task(monkeypatch):
+    monkeypatch.setenv("CHAT_SUMMARY_ENABLED", "true")
+    monkeypatch.setenv("CHAT_SUMMARY_KEEP_TURNS", "1")
+    monkeypatch.setenv("CHAT_SUMMARY_MIN_NEW_MESSAGES", "2")
+    monkeypatch.setenv("CHAT_SUMMARY_MAX_BATCH_MESSAGES", "4")
+    state = {"count": 12, "summary": None}
+    calls = []
+
+    async def message_count(session_id, domain):
+        return state["count"]
+
+    async def get_summary(session_id, domain):
+        return state["summary"]
+
+    async def messages_range(session_id, domain, start, end):
+        return [{"index": i, "content": f"m{i}"} for i in range(start, end)]
+
+    async def save_summary(session_id, domain, summary, covered_until, tokens):
+        state["summary"] = {"summary": summary, "covered_until": covered_until}
+        return True
+
+    def summarize(previous, messages, max_output_tokens):
+        calls.append([m["index"] for m in messages])
+        return f"{previous or ''}+{len(messages)}"
+
+    monkeypatch.setattr(summary_service, "get_chat_message_count", message_count)
+    monkeypatch.setattr(summary_service, "get_chat_summary", get_summary)
+    monkeypatch.setattr(summary_service, "get_chat_messages_range", messages_range)
+    monkeypatch.setattr(summary_service, "save_chat_summary", save_summary)
+    monkeypatch.setattr(summary_service, "summarize_conversation", summarize)
+
+    async def chat():
+        summary_service.schedule_summary_update("s1", "it")
+        # A second append while the first pass runs is picked up by it.
+        state["count"] = 14
+        summary_service.schedule_summary_update("s1", "it")
+        while summary_service._running:
+            await asyncio.sleep(0.01)
+
+    asyncio.run(chat())
+
+    assert calls == [[0, 1, 2, 3], [4, 5, 6, 7], [8, 9, 10, 11]]
+    assert state["summary"] == {"summary": "+4+4+4", "covered_until": 12}
+
+
+def test_history_context_starts_after_the_summary(monkeypatch):
+    monkeypatch.setenv("CHAT_SUMMARY_ENABLED", "true")
+    reads = []
+
+    async def get_summary(session_id, domain):
+        return {"summary": "earlier", "covered_until": 8, "tokens": 30}
+
+    async def read_history(session_id, domain, max_tokens, since_index=None):
+        reads.append((max_tokens, since_index))
+        return [{"index": 8}]
+
+    monkeypatch.setattr(summary_service, "get_chat_summary", get_summary)
+    monkeypatch.setattr(summary_service, "read_chat_history", read_history)
+
+    summary, messages = asyncio.run(summary_service.load_history_context("s1", "it", 100))
+
+    assert summary == "earlier"
+    assert reads == [(70, 8)]
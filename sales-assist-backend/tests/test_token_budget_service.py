@@ -0,0 +1,40 @@
+from services import token_budget_service as budget_service
+from services.token_budget_service import TokenBudget
+
+
+def _record(chunk_id, text, score, embedding):
+    return {"chunk_id": chunk_id, "file_id": chunk_id, "chunk_index": 0, "text": text, "score": score, "embedding": embedding}
+
+
+def test_exhausted_budget_packs_nothing():
+    records = [_record("a", "alpha beta gamma", 0.9, [1.0, 0.0])]
+
+    assert budget_service.pack_rag_records(records, 0) == ([], 0)
+    assert budget_service.trim_rag_records(records, 0) == ([], 0)
+    assert budget_service.pack_rag_records(records, None)[0] == records
+
+
+def test_mmr_packing_skips_near_duplicates():
+    records = [
+        _record("a", "router reset steps", 0.9, [1.0, 0.0]),
+        _record("b", "router reset guide", 0.89, [1.0, 0.0]),
+        _record("c", "vpn client install", 0.8, [0.0, 1.0]),
+    ]
+    tokens = budget_service.count_tokens("router reset steps") + budget_service.count_tokens("vpn client install")
+
+    packed, used = budget_service.pack_rag_records(records, tokens, mmr_lambda=0.3)
+
+    assert [rec["chunk_id"] for rec in packed] == ["a", "c"]
+    assert used == tokens
+
+
+def test_input_overflow_drops_rag_context(monkeypatch):
+    monkeypatch.setenv("RAG_PACKING", "mmr")
+    records = [_record("a", "alpha beta gamma delta", 0.9, [1.0, 0.0])]
+    prompt = "system " * 20
+    budget = TokenBudget(max_history_tokens=0, max_rag_tokens=0, max_input_tokens=5, max_output_tokens=10)
+
+    _, rag, usage = budget_service.enforce_input_budget(prompt, [], "hi", records, budget)
+
+    assert rag == []
+    assert usage["rag_tokens"] == 0
@@ -0,0 +1,63 @@
+import json
+import os
+
+import numpy as np
+
+from scripts import tune_search_params as tuner
+from services import milvus_index_manager as manager
+
+
+def _export(path, sizes):
+    rng = np.random.default_rng(0)
+    domains = np.concatenate([[domain] * count for domain, count in sizes.items()])
+    vectors = rng.standard_normal((len(domains), 8)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    ids = np.array([f"c{i}" for i in range(len(domains))])
+    np.savez(path, ids=ids, embeddings=vectors, domains=domains)
+    return ids, domains
+
+
+def test_stand_in_ivf_spans_every_domain_and_filters_at_search(tmp_path, monkeypatch):
+    monkeypatch.setenv("MILVUS_FLAT_MAX_ENTITIES", "10")
+    monkeypatch.setenv("VECTOR_QUANTIZATION", "none")
+    path = tmp_path / "vectors.npz"
+    ids, domains = _export(path, {"it": 270, "rpa": 30})
+    backend = tuner.InMemoryIVFBackend(str(path), "kb")
+
+    _centroids, lists = backend._build()
+    query = backend._vectors[0]
+    found = backend.search(query, 5, "rpa", {"nprobe": len(lists)})
+
+    assert backend.saveable
+    assert sum(len(rows) for rows in lists) == len(ids)
+    assert found and all(domains[list(ids).index(cid)] == "rpa" for cid in found)
+
+
+def test_stand_in_for_a_non_ivf_plan_is_never_saved(tmp_path, monkeypatch):
+    params_path = tmp_path / "search_params.json"
+    monkeypatch.setenv("MILVUS_SEARCH_PARAMS_PATH", str(params_path))
+    monkeypatch.setenv("MILVUS_FLAT_MAX_ENTITIES", "50000")
+    path = tmp_path / "vectors.npz"
+    _export(path, {"it": 40})
+
+    tuner.main(
+        ["--backend", "memory", "--vectors-file", str(path), "--collection", "kb", "--domains", "it", "--sample", "5"]
+    )
+
+    assert not params_path.exists()
+
+
+def test_tuned_params_file_is_reread_only_after_the_refresh_interval(tmp_path, monkeypatch):
+    params_path = tmp_path / "search_params.json"
+    monkeypatch.setenv("MILVUS_SEARCH_PARAMS_PATH", str(params_path))
+    monkeypatch.setenv("MILVUS_SEARCH_PARAMS_REFRESH_SECONDS", "60")
+    params_path.write_text(json.dumps({"kb": {"it": {"search_params": {"nprobe": 8}}}}))
+    monkeypatch.setattr(manager, "_tuned_params_checked", 0.0)
+    assert manager._load_tuned_params()["kb"]["it"]["search_params"] == {"nprobe": 8}
+
+    params_path.write_text(json.dumps({"kb": {"it": {"search_params": {"nprobe": 32}}}}))
+    os.utime(params_path, (1, 1))
+    assert manager._load_tuned_params()["kb"]["it"]["search_params"] == {"nprobe": 8}
+
+    monkeypatch.setattr(manager, "_tuned_params_checked", 0.0)
+    assert manager._load_tuned_params()["kb"]["it"]["search_params"] == {"nprobe": 32}
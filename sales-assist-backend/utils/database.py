@@ -4,6 +4,8 @@ from motor.motor_asyncio import AsyncIOMotorClient
 # Global singletons (POC-safe)
 _client: AsyncIOMotorClient | None = None
 _database = None
+_sync_client = None
+_sync_database = None
 
 
 def connect_to_mongo():
@@ -35,12 +37,37 @@ def get_database():
     return _database
 
 
+def get_sync_database():
+    """
+    Blocking pymongo handle for code running on worker threads outside the
+    event loop (Milvus index maintenance and its write hooks).
+    """
+    global _sync_client, _sync_database
+
+    if _sync_database is None:
+        from pymongo import MongoClient
+
+        mongo_uri = os.getenv("MONGO_URI")
+        db_name = os.getenv("MONGO_DB_NAME")
+
+        if not mongo_uri or not db_name:
+            raise RuntimeError("MongoDB environment variables not set")
+
+        _sync_client = MongoClient(mongo_uri)
+        _sync_database = _sync_client[db_name]
+    return _sync_database
+
+
 def close_mongo_connection():
     """
     Gracefully close MongoDB connection.
     """
-    global _client, _database
+    global _client, _database, _sync_client, _sync_database
     if _client:
         _client.close()
         _client = None
         _database = None
+    if _sync_client:
+        _sync_client.close()
+        _sync_client = None
+        _sync_database = None
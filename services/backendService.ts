@@ -1,4 +1,4 @@
-import { Domain, FileMeta } from '../types';
+import { Domain, FileMeta, FileStatusEvent } from '../types';
 
 const BACKEND_URL = import.meta.env.VITE_BACKEND_URL || 'http://localhost:8000';
 
@@ -23,11 +23,23 @@ export const uploadFile = async (
   return response.json();
 };
 
-export const listFiles = async (domain?: Domain): Promise<FileMeta[]> => {
+export const listFiles = async (
+  domain?: Domain,
+  options: { cursor?: string | null; status?: string; limit?: number } = {}
+): Promise<{ files: FileMeta[]; next_cursor: string | null }> => {
   const url = new URL(`${BACKEND_URL}/files`);
   if (domain) {
     url.searchParams.set('domain', domain);
   }
+  if (options.cursor) {
+    url.searchParams.set('cursor', options.cursor);
+  }
+  if (options.status) {
+    url.searchParams.set('status', options.status);
+  }
+  if (options.limit) {
+    url.searchParams.set('limit', String(options.limit));
+  }
 
   const response = await fetch(url.toString(), {
     method: 'GET',
@@ -41,6 +53,31 @@ export const listFiles = async (domain?: Domain): Promise<FileMeta[]> => {
   return response.json();
 };
 
+// Pushes ingestion status/progress for the given files until all of them
+// finish; returns a function that closes the stream early.
+export const subscribeFileStatus = (
+  fileIds: string[],
+  onEvent: (event: FileStatusEvent) => void
+): (() => void) => {
+  const url = new URL(`${BACKEND_URL}/files/events`);
+  fileIds.forEach((id) => url.searchParams.append('file_id', id));
+  const source = new EventSource(url.toString());
+  const pending = new Set(fileIds);
+
+  source.addEventListener('file_status', (message) => {
+    const event: FileStatusEvent = JSON.parse((message as MessageEvent).data);
+    onEvent(event);
+    if (['completed', 'failed', 'not_found'].includes(event.processing_status)) {
+      pending.delete(event.file_id);
+    }
+    if (pending.size === 0) {
+      source.close();
+    }
+  });
+
+  return () => source.close();
+};
+
 export const startSession = async (userId: string): Promise<{ session_id: string; user_id: string }> => {
   const response = await fetch(`${BACKEND_URL}/session/start`, {
     method: 'POST',
@@ -77,11 +114,20 @@ export const endSession = async (sessionId: string): Promise<{ status: string }>
 
 export const getChatHistory = async (
   sessionId: string,
-  domain: Domain
-): Promise<{ session_id: string; domain: Domain; messages: { role: string; content: string; timestamp?: number }[] }> => {
+  domain: Domain,
+  cursor?: number | null
+): Promise<{
+  session_id: string;
+  domain: Domain;
+  messages: { role: string; content: string; timestamp?: number }[];
+  next_cursor: number | null;
+}> => {
   const url = new URL(`${BACKEND_URL}/history`);
   url.searchParams.set('session_id', sessionId);
   url.searchParams.set('domain', domain);
+  if (cursor !== undefined && cursor !== null) {
+    url.searchParams.set('cursor', String(cursor));
+  }
 
   const response = await fetch(url.toString(), {
     method: 'GET',
@@ -94,3 +140,32 @@ export const getChatHistory = async (
 
   return response.json();
 };
+
+export const prefetchChat = async (
+  domain: Domain,
+  sessionId: string,
+  message: string,
+  fileIds: string[],
+  signal?: AbortSignal
+): Promise<{ status: string }> => {
+  const response = await fetch(`${BACKEND_URL}/chat/prefetch`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+    },
+    body: JSON.stringify({
+      domain,
+      session_id: sessionId,
+      message,
+      file_ids: fileIds || [],
+    }),
+    signal,
+  });
+
+  if (!response.ok) {
+    const text = await response.text();
+    throw new Error(text || 'Failed to prefetch');
+  }
+
+  return response.json();
+};
@@ -27,6 +27,19 @@ export interface FileMeta {
   created_at?: string;
   processing_status?: string;
   domain?: Domain;
+  chunks_embedded?: number;
+  chunks_total?: number;
+}
+
+export interface FileStatusEvent {
+  file_id: string;
+  domain?: Domain;
+  processing_status: string;
+  embedding_status: string;
+  stage?: string;
+  chunks_embedded?: number;
+  chunks_total?: number;
+  error?: string;
 }
 
 export interface Source {